@@ -0,0 +1,470 @@
+"""
+Benchmarks for sync-stien (DOFbasen CSV -> records -> DB).
+
+Kør fra server/:
+    python bench_sync.py normalize --rows 200000
+    python bench_sync.py write --rows 200000
+    python bench_sync.py ingest --rows 200000
+    python bench_sync.py lists --rows 100000
+    python bench_sync.py tags --rows 100000
+    python bench_sync.py e2e --users 20 --rows-per-year 300 --latency-ms 80
+
+DATABASE_URL styrer hvilken database `write`/`e2e` måler mod (default: SQLite i tmp).
+`e2e` starter dof_standin.py som subprocess og kører hele sync-stien mod den;
+daily_update_all_jsons synkroniserer alle brugere i databasen, så brug en
+dedikeret database.
+"""
+import os
+import io
+import sys
+import time
+import random
+import shutil
+import socket
+import asyncio
+import subprocess
+import argparse
+import datetime
+import tempfile
+import tracemalloc
+
+os.environ.setdefault("ADMIN_SECRET", "bench")
+os.environ.setdefault(
+    "DATABASE_URL",
+    "sqlite+aiosqlite:///" + os.path.join(tempfile.gettempdir(), "boligbirding_bench.db"),
+)
+
+import pandas as pd
+
+import server
+
+EXPORT_COLUMNS = [
+    "Dato", "Turid", "Turtidfra", "Turtidtil", "Loknr", "Loknavn", "Antal",
+    "Artnavn", "Obserkode", "Turnoter", "Fuglnoter", "Obsid", "DOF_afdeling",
+]
+
+SPECIES = [
+    "Solsort", "Musvit", "Blåmejse", "Gråkrage", "Skovskade", "Husskade",
+    "Ringdue", "Bogfinke", "Grønirisk", "Stær", "Gråspurv", "Skovspurv",
+    "Gærdesmutte", "Rødhals", "Sortmejse", "Stor Flagspætte", "Musvåge",
+    "Spurvehøg", "Tårnfalk", "Mursejler", "Landsvale", "Bysvale",
+    "Havørn", "Rørhøg", "Måge sp.", "Grågås x Canadagås", "Krage/Råge",
+    "Gulbug (Hippolais icterina)", "Gransanger, Phylloscopus collybita",
+]
+
+
+def make_synthetic_export(rows: int, obserkode: str = "8220CVH", seed: int = 1, first_year: int = 1990, last_year: int = 2026) -> bytes:
+    """Syntetisk DOFbasen-eksport (latin1, ';'-separeret) med `rows` rækker."""
+    rng = random.Random(seed)
+    start = datetime.date(first_year, 1, 1).toordinal()
+    end = datetime.date(last_year, 12, 31).toordinal()
+    lines = [";".join(EXPORT_COLUMNS)]
+    for i in range(rows):
+        dato = datetime.date.fromordinal(rng.randint(start, end))
+        dato_txt = dato.strftime("%d-%m-%Y") if i % 3 else dato.isoformat()
+        turid = str(100000 + i // 20)
+        loknr = str(rng.randint(1000, 9999)) if i % 17 else ""
+        antal = str(rng.choice([1, 1, 2, 3, 5, 12, 0]))
+        tag = rng.choice(["", "", "", f"#BB{str(dato.year)[-2:]}", f"#BB{str(dato.year)[-2:]}-2"])
+        fuglnote = rng.choice(["", "", "syngende"])
+        obsid = str(5000000 + i) if i % 11 else ""
+        afd = server.AFDELINGER[i % len(server.AFDELINGER)]
+        lines.append(";".join([
+            dato_txt, turid, "07:00", "08:30", loknr, f"Lokalitet {loknr}", antal,
+            rng.choice(SPECIES), obserkode, tag, fuglnote, obsid, afd,
+        ]))
+    return ("\n".join(lines) + "\n").encode("latin1")
+
+
+def read_export(payload: bytes) -> pd.DataFrame:
+    return pd.read_csv(io.StringIO(payload.decode("latin1")), sep=";", dtype=str)
+
+
+def legacy_normalize(df: pd.DataFrame, obserkode: str, start_date=None, end_date=None):
+    """Den tidligere række-for-række normalisering (df.iterrows()), til sammenligning."""
+    records = []
+    for _, row in df.iterrows():
+        raw_dato = server.safe_str(row.get("Dato", "") or "").strip()
+        if not raw_dato:
+            continue
+        if len(raw_dato) > 10:
+            raw_dato = raw_dato[:10]
+        dato = None
+        for fmt in ("%Y-%m-%d", "%d-%m-%Y"):
+            try:
+                dato = datetime.datetime.strptime(raw_dato, fmt).date()
+                break
+            except Exception:
+                pass
+        if not dato:
+            continue
+        if start_date and dato < start_date or end_date and dato > end_date:
+            continue
+        antal = int(row.get("Antal", "") or 0)
+        if antal == 0:
+            continue
+        row_obserkode = row.get("Obserkode", obserkode) or obserkode
+        try:
+            row_obserkode = server.normalize_obserkode(row_obserkode)
+        except ValueError:
+            row_obserkode = obserkode
+        records.append({
+            "obserkode": row_obserkode,
+            "artnavn": server.safe_str(row.get("Artnavn", "") or ""),
+            "antal": antal,
+            "dato": dato,
+            "turid": server.safe_str(row.get("Turid")),
+            "obsid": server.safe_str(row.get("Obsid")) if "Obsid" in row else None,
+            "turtidfra": server.safe_str(row.get("Turtidfra")),
+            "turtidtil": server.safe_str(row.get("Turtidtil")),
+            "turnoter": server.merged_note_text(row.get("Turnoter", ""), row.get("Fuglnoter", "")),
+            "afdeling": server.safe_str(row.get("DOF_afdeling", "") or ""),
+            "loknavn": server.safe_str(row.get("Loknavn", "") or ""),
+            "loknr": server._parse_int(row.get("Loknr")),
+        })
+    return records
+
+
+def _timed(label: str, rows: int, fn):
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed:8.3f}s  {rows / elapsed if elapsed else float('inf'):12,.0f} rækker/s")
+    return result, elapsed
+
+
+def bench_normalize(args):
+    payload = make_synthetic_export(args.rows, seed=args.seed)
+    df = read_export(payload)
+    print(f"Normalisering af {len(df):,} rækker")
+    before, t_before = _timed("før (iterrows)", len(df), lambda: legacy_normalize(df, "8220CVH"))
+    after, t_after = _timed("efter (kolonnevis)", len(df), lambda: server.normalize_observation_frame(df, "8220CVH"))
+    if before != after:
+        print("ADVARSEL: resultaterne er forskellige")
+        return 1
+    print(f"{len(after):,} records, {t_before / t_after:.1f}x hurtigere")
+    return 0
+
+
+def _bench_records(rows: int, seed: int):
+    df = read_export(make_synthetic_export(rows, seed=seed))
+    records = server.normalize_observation_frame(df, "8220CVH")
+    return [
+        server.ObsRecord(i, r["artnavn"], r["dato"], r["obsid"], r["turnoter"], r["afdeling"], r["loknavn"], r["loknr"], None)
+        for i, r in enumerate(records, 1)
+    ]
+
+
+def bench_lists(args):
+    records = _bench_records(args.rows, args.seed)
+    periods = {
+        "matrikel1": server.MatrikelPeriods([{"name": "Hus", "start_date": "2005-01-01", "end_date": None}]),
+        "matrikel2": server.MatrikelPeriods([{"name": "Sommerhus", "start_date": "1995-04-01", "end_date": "2015-12-31"}]),
+    }
+    site_set = set(range(1000, 9999, 4))
+    excluded = server._get_excluded_species_keys()
+    print(f"Lister for én observatør med {len(records):,} observationer")
+
+    def _scopes():
+        cols = server.ObsColumns(records, "#BB", excluded)
+        start, end = datetime.date.min, datetime.date.max
+        m1 = cols.period_selection(cols.tagged(server.TAG_MATRIKEL1), periods["matrikel1"], start, end)
+        m2 = cols.period_selection(cols.tagged(server.TAG_MATRIKEL2), periods["matrikel2"], start, end)
+        return cols, m1, m2, cols.in_sites(site_set)
+
+    (cols, m1, m2, kommune), _ = _timed("kolonnelager + masker", len(records), _scopes)
+
+    def _per_scope():
+        payloads = {
+            "global.json": cols.firsts(),
+            "matrikelarter.json": cols.firsts(m1["active"]),
+            "matrikelarter_historik.json": cols.firsts(m1["historical"]),
+            "matrikel2arter.json": cols.firsts(m2["active"]),
+            "matrikel2arter_historik.json": cols.firsts(m2["historical"]),
+            "lokalafdeling.json": {},
+            "kommune.json": {"alle": cols.firsts(kommune), "matrikel": cols.firsts(kommune & m1["active"])},
+        }
+        for afd in server.AFDELINGER:
+            in_afd = cols.in_afdeling(afd)
+            payloads["lokalafdeling.json"][afd] = {
+                "alle": cols.firsts(in_afd),
+                "matrikel": cols.firsts(in_afd & m1["active"]),
+            }
+        return payloads
+
+    before, t_before = _timed("firsts pr. udvalg", len(records), _per_scope)
+    after, t_after = _timed("firsts_many (ét gennemløb)", len(records), lambda: server.user_list_payloads(cols, m1, m2, kommune, True))
+    if before != after:
+        print("ADVARSEL: resultaterne er forskellige")
+        return 1
+
+    out_dir = tempfile.mkdtemp(prefix="bench_lists_")
+    try:
+        _timed("build_user_global_lists", len(records), lambda: server.build_user_global_lists(
+            out_dir, "8220CVH", records, "#BB", periods, excluded, 101, "København", site_set,
+        ))
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    print(f"{sum(len(v) for v in after.values() if isinstance(v, list))} arter i globale/matrikel-lister, {t_before / t_after:.1f}x hurtigere")
+    return 0
+
+
+def legacy_has_matrikel_tag(tokens, raw_filter: str, year: int, matrikel_number: int) -> bool:
+    """Det tidligere rækketjek: tag-listen bygges og renses for hver række."""
+    tags = server._matrikel_tags_for_year(raw_filter, year, matrikel_number)
+    clean_tags = [str(tag or "").upper().strip() for tag in (tags or []) if str(tag or "").strip()]
+    return any(tag in tokens for tag in clean_tags)
+
+
+def bench_tags(args):
+    records = _bench_records(args.rows, args.seed)
+    rows = [(server._row_hashtags(r), r.dato.year) for r in records]
+    checks = len(rows) * 3
+    print(f"Matrikel-tagtjek for {len(rows):,} rækker x matrikel 1-3 (filter #BB)")
+
+    def _legacy():
+        return [legacy_has_matrikel_tag(tokens, "#BB", year, n) for tokens, year in rows for n in (1, 2, 3)]
+
+    def _compiled():
+        matcher = server.MatrikelTagMatcher("#BB")
+        return [matcher.matches(tokens, year, n) for tokens, year in rows for n in (1, 2, 3)]
+
+    before, t_before = _timed("før (tag-lister pr. række)", checks, _legacy)
+    after, t_after = _timed("efter (kompileret matcher)", checks, _compiled)
+    if before != after:
+        print("ADVARSEL: resultaterne er forskellige")
+        return 1
+    print(
+        f"{sum(after):,} træf, {t_before / checks * 1e9:.0f} ns -> {t_after / checks * 1e9:.0f} ns pr. tjek, "
+        f"{t_before / t_after:.1f}x hurtigere"
+    )
+    return 0
+
+
+BENCH_OBSERKODE = "BENCH0001"
+
+
+async def _prepare_db():
+    async with server.engine.begin() as conn:
+        await conn.run_sync(server.Base.metadata.create_all)
+    await server.ensure_observation_sync_columns()
+
+
+async def _reset_bench_rows():
+    async with server.SessionLocal() as session:
+        await session.execute(
+            server.Observation.__table__.delete().where(server.Observation.obserkode == BENCH_OBSERKODE)
+        )
+        await session.commit()
+
+
+async def _bench_write(args):
+    df = read_export(make_synthetic_export(args.rows, obserkode=BENCH_OBSERKODE, seed=args.seed))
+    records = server.normalize_observation_frame(df, BENCH_OBSERKODE)
+    await _prepare_db()
+    print(f"Skrivning af {len(records):,} records ({server.engine.dialect.name})")
+
+    await _reset_bench_rows()
+    async with server.SessionLocal() as session:
+        started = time.perf_counter()
+        for offset in range(0, len(records), server.OBSERVATION_BULK_BATCH_SIZE):
+            batch = records[offset:offset + server.OBSERVATION_BULK_BATCH_SIZE]
+            session.add_all([server.Observation(**rec) for rec in batch])
+            await session.commit()
+        t_orm = time.perf_counter() - started
+    print(f"{'før (ORM add_all)':<28} {t_orm:8.3f}s  {len(records) / t_orm:12,.0f} rækker/s")
+
+    await _reset_bench_rows()
+    async with server.SessionLocal() as session:
+        stats = await server.bulk_insert_observations(session, records, label="bench")
+    print(f"{'efter (bulk, ' + stats['method'] + ')':<28} {stats['seconds']:8.3f}s  {stats['rows_per_second']:12,.0f} rækker/s")
+    print(f"{t_orm / stats['seconds']:.1f}x hurtigere")
+
+    await _reset_bench_rows()
+    await server.engine.dispose()
+    return 0
+
+
+def bench_write(args):
+    return asyncio.run(_bench_write(args))
+
+
+async def _ingest_full(payload: bytes):
+    df = read_export(payload)
+    records = server.normalize_observation_frame(df, BENCH_OBSERKODE)
+    return await server.sync_observation_records(BENCH_OBSERKODE, records, label="bench", mode="replace")
+
+
+async def _ingest_streaming(payload: bytes):
+    spool = tempfile.SpooledTemporaryFile(max_size=server.DOF_EXPORT_SPOOL_BYTES)
+    spool.write(payload)
+    spool.seek(0)
+    return await server.ingest_observation_export(BENCH_OBSERKODE, spool, label="bench")
+
+
+async def _bench_ingest(args):
+    payload = make_synthetic_export(args.rows, obserkode=BENCH_OBSERKODE, seed=args.seed)
+    await _prepare_db()
+    print(f"Ingest af {len(payload) / 1024 / 1024:.1f} MB eksport ({args.rows:,} rækker, blokke á {server.OBSERVATION_CSV_BLOCK_BYTES // 1024:,} KB)")
+
+    for label, fn in (("før (hel DataFrame)", _ingest_full), ("efter (streamet, chunks)", _ingest_streaming)):
+        await _reset_bench_rows()
+        tracemalloc.start()
+        started = time.perf_counter()
+        await fn(payload)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{label:<28} {elapsed:8.3f}s  peak {peak / 1024 / 1024:8.1f} MB")
+
+    await _reset_bench_rows()
+    await server.engine.dispose()
+    return 0
+
+
+def bench_ingest(args):
+    return asyncio.run(_bench_ingest(args))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_standin(args):
+    port = _free_port()
+    proc = subprocess.Popen([
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "dof_standin.py"), "serve",
+        "--port", str(port),
+        "--rows-per-year", str(args.rows_per_year),
+        "--first-year", str(args.first_year),
+        "--latency-ms", str(args.latency_ms),
+        "--jitter-ms", str(args.jitter_ms),
+    ])
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return proc, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("dof_standin startede ikke")
+
+
+async def _reset_e2e_users(koder):
+    tables = (server.Observation, server.User, server.Obserkode, server.ExportHash, server.SyncWatermark)
+    async with server.SessionLocal() as session:
+        for model in tables:
+            column = model.kode if model is server.Obserkode else model.obserkode
+            await session.execute(model.__table__.delete().where(column.in_(koder)))
+        await session.commit()
+
+
+async def _bench_e2e(args):
+    proc, base_url = _start_standin(args)
+    data_dir = tempfile.mkdtemp(prefix="boligbirding_e2e_")
+    try:
+        server.DOFBASEN_URL = server.DOF_STATISTIK_URL = server.DOF_KRYDSLISTER_URL = base_url
+        if args.http_rate:
+            server.DOF_HTTP_RATE_PER_HOST = args.http_rate
+            server.DOF_HTTP_BURST_PER_HOST = max(1, int(args.http_rate))
+        shutil.copy(os.path.join(server.SERVER_DIR, "kommuner.csv"), data_dir)
+        server.SERVER_DIR = data_dir
+
+        koder = [f"E2E{i:04d}" for i in range(1, args.users + 1)]
+        await _prepare_db()
+        await _reset_e2e_users(koder)
+        async with server.SessionLocal() as session:
+            for kode in koder:
+                session.add(server.User(obserkode=kode, navn=kode, kommune="101", lokalafdeling="DOF København"))
+                session.add(server.Obserkode(kode=kode))
+            await session.commit()
+
+        aar = datetime.date.today().year
+        print(
+            f"E2E mod {base_url}: {len(koder)} brugere, {args.rows_per_year} rækker/år fra {args.first_year}, "
+            f"latency {args.latency_ms:.0f}ms, {server.engine.dialect.name}"
+        )
+        timings = []
+
+        async def _step(label, coro_factory, per_user=True):
+            started = time.perf_counter()
+            if per_user:
+                for kode in koder:
+                    await coro_factory(kode)
+            else:
+                await coro_factory()
+            elapsed = time.perf_counter() - started
+            timings.append((label, elapsed))
+            return elapsed
+
+        await _step(f"fetch_and_store ({aar})", lambda kode: server.fetch_and_store(kode, aar))
+        await _step("sync_user_all_time", server.sync_user_all_time)
+        await _step("daily_update_all_jsons #1", server.daily_update_all_jsons, per_user=False)
+        await _step("daily_update_all_jsons #2", server.daily_update_all_jsons, per_user=False)
+
+        print()
+        for label, elapsed in timings:
+            print(f"{label:<28} {elapsed:8.2f}s  {elapsed / len(koder):8.3f}s/bruger")
+
+        await _reset_e2e_users(koder)
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(data_dir, ignore_errors=True)
+        await server.close_dof_http_client()
+        server.shutdown_cpu_pool()
+        await server.engine.dispose()
+    return 0
+
+
+def bench_e2e(args):
+    return asyncio.run(_bench_e2e(args))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_norm = sub.add_parser("normalize", help="CSV-normalisering: iterrows vs. kolonnevis")
+    p_norm.add_argument("--rows", type=int, default=200000)
+    p_norm.add_argument("--seed", type=int, default=1)
+    p_norm.set_defaults(func=bench_normalize)
+
+    p_write = sub.add_parser("write", help="DB-skrivning: ORM add_all vs. bulk-insert")
+    p_write.add_argument("--rows", type=int, default=200000)
+    p_write.add_argument("--seed", type=int, default=1)
+    p_write.set_defaults(func=bench_write)
+
+    p_ingest = sub.add_parser("ingest", help="Peak-hukommelse: hel DataFrame vs. streamet chunk-ingest")
+    p_ingest.add_argument("--rows", type=int, default=200000)
+    p_ingest.add_argument("--seed", type=int, default=1)
+    p_ingest.set_defaults(func=bench_ingest)
+
+    p_lists = sub.add_parser("lists", help="Listeberegning: firsts pr. udvalg vs. ét firsts_many-gennemløb")
+    p_lists.add_argument("--rows", type=int, default=100000)
+    p_lists.add_argument("--seed", type=int, default=1)
+    p_lists.set_defaults(func=bench_lists)
+
+    p_tags = sub.add_parser("tags", help="Matrikel-tagtjek: tag-lister pr. række vs. kompileret matcher")
+    p_tags.add_argument("--rows", type=int, default=100000)
+    p_tags.add_argument("--seed", type=int, default=1)
+    p_tags.set_defaults(func=bench_tags)
+
+    p_e2e = sub.add_parser("e2e", help="fetch_and_store/sync_user_all_time/daily sync mod dof_standin")
+    p_e2e.add_argument("--users", type=int, default=10)
+    p_e2e.add_argument("--rows-per-year", type=int, default=300)
+    p_e2e.add_argument("--first-year", type=int, default=2000)
+    p_e2e.add_argument("--latency-ms", type=float, default=50.0)
+    p_e2e.add_argument("--jitter-ms", type=float, default=0.0)
+    p_e2e.add_argument("--http-rate", type=float, default=0.0, help="overstyr DOF_HTTP_RATE_PER_HOST (0 = serverens)")
+    p_e2e.set_defaults(func=bench_e2e)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
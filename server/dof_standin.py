@@ -0,0 +1,279 @@
+"""
+Lokal stand-in for DOFbasen/statistik/krydslister til benchmarks og udvikling.
+
+Serverer syntetiske (eller optagede) svar på de stier server.py bruger:
+    /excel/search_result1.php   CSV-eksport pr. obserkode og årsinterval
+    /popobser.php               observatørnavn
+    /sites/group_<id>.json      lokationer pr. kommune
+    /opslag/artdata.php         artsliste (styles + arter i klammer)
+    /api/v1/login               krydslister-login
+    /arter                      statistikkens artstabel
+
+Kør fra server/:
+    python dof_standin.py serve --port 8765 --rows-per-year 500 --latency-ms 80
+    python dof_standin.py record --out fixtures/ 8220CVH
+
+og peg serveren på den:
+    DOFBASEN_URL=http://127.0.0.1:8765 DOF_STATISTIK_URL=http://127.0.0.1:8765 \\
+    DOF_KRYDSLISTER_URL=http://127.0.0.1:8765 uvicorn server:app
+
+Syntetiske data er deterministiske pr. (obserkode, år), så en års-eksport
+altid er en delmængde af all-time-eksporten – ligesom hos DOFbasen.
+"""
+import os
+import sys
+import zlib
+import random
+import asyncio
+import argparse
+import datetime
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, JSONResponse, HTMLResponse
+
+EXPORT_COLUMNS = [
+    "Dato", "Turid", "Turtidfra", "Turtidtil", "Loknr", "Loknavn", "Antal",
+    "Artnavn", "Obserkode", "Turnoter", "Fuglnoter", "Obsid", "DOF_afdeling",
+]
+
+SPECIES = [
+    "Solsort", "Musvit", "Blåmejse", "Gråkrage", "Skovskade", "Husskade",
+    "Ringdue", "Bogfinke", "Grønirisk", "Stær", "Gråspurv", "Skovspurv",
+    "Gærdesmutte", "Rødhals", "Sortmejse", "Stor Flagspætte", "Musvåge",
+    "Spurvehøg", "Tårnfalk", "Mursejler", "Landsvale", "Bysvale",
+    "Havørn", "Rørhøg", "Måge sp.", "Grågås x Canadagås", "Krage/Råge",
+    "Gulbug (Hippolais icterina)", "Gransanger, Phylloscopus collybita",
+]
+
+BRACKET_SPECIES = ["Fasan", "Mandarinand", "Sortsvane"]
+
+AFDELINGER = [
+    "DOF København", "DOF Nordsjælland", "DOF Vestsjælland", "DOF Storstrøm",
+    "DOF Bornholm", "DOF Fyn", "DOF Sønderjylland", "DOF Sydvestjylland",
+    "DOF Sydøstjylland", "DOF Vestjylland", "DOF Østjylland", "DOF Nordvestjylland",
+    "DOF Nordjylland",
+]
+
+FIRST_SYNTHETIC_YEAR = 2000
+
+
+class StandinConfig:
+    def __init__(
+        self,
+        rows_per_year: int = 300,
+        sites_per_kommune: int = 50,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        first_year: int = FIRST_SYNTHETIC_YEAR,
+        fixtures: Optional[str] = None,
+    ):
+        self.rows_per_year = rows_per_year
+        self.sites_per_kommune = sites_per_kommune
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.first_year = first_year
+        self.fixtures = fixtures
+
+
+def _seed(*parts) -> int:
+    return zlib.crc32(":".join(str(p) for p in parts).encode("utf-8"))
+
+
+def synthetic_year_rows(obserkode: str, year: int, rows: int):
+    """Rækker (uden header) for ét år; obsid er unikt på tværs af år."""
+    rng = random.Random(_seed(obserkode, year))
+    start = datetime.date(year, 1, 1).toordinal()
+    end = datetime.date(year, 12, 31).toordinal()
+    yy = str(year)[-2:]
+    for i in range(rows):
+        dato = datetime.date.fromordinal(rng.randint(start, end))
+        dato_txt = dato.strftime("%d-%m-%Y") if i % 3 else dato.isoformat()
+        turid = str(year * 100000 + i // 20)
+        loknr = str(rng.randint(1000, 9999)) if i % 17 else ""
+        antal = str(rng.choice([1, 1, 2, 3, 5, 12, 0]))
+        tag = rng.choice(["", "", "", f"#BB{yy}", f"#BB{yy}-2"])
+        fuglnote = rng.choice(["", "", "syngende"])
+        obsid = str(year * 1000000 + i) if i % 11 else ""
+        yield ";".join([
+            dato_txt, turid, "07:00", "08:30", loknr, f"Lokalitet {loknr}", antal,
+            rng.choice(SPECIES), obserkode, tag, fuglnote, obsid, AFDELINGER[i % len(AFDELINGER)],
+        ])
+
+
+def synthetic_export(obserkode: str, aar_first: int, aar_second: int, cfg: StandinConfig) -> bytes:
+    lines = [";".join(EXPORT_COLUMNS)]
+    for year in range(max(aar_first, cfg.first_year), aar_second + 1):
+        lines.extend(synthetic_year_rows(obserkode, year, cfg.rows_per_year))
+    return ("\n".join(lines) + "\n").encode("latin1")
+
+
+def synthetic_sites(kommune_id: int, cfg: StandinConfig):
+    base = 1000 + (kommune_id * 37) % 8000
+    return [
+        {"siteNumber": base + i, "siteName": f"Lokalitet {base + i}"}
+        for i in range(cfg.sites_per_kommune)
+    ]
+
+
+def synthetic_artdata_html() -> str:
+    rows = []
+    for i, name in enumerate(SPECIES + BRACKET_SPECIES, start=1):
+        label = f"[{name}]" if name in BRACKET_SPECIES else name
+        css = ' class="su"' if i % 9 == 0 else ""
+        rows.append(f"<tr><td>{i:05d}</td><td>x</td><td><span{css}>{label}</span></td></tr>")
+    return "<html><body><table>" + "".join(rows) + "</table></body></html>"
+
+
+def synthetic_arter_html(obserkode: str) -> str:
+    rng = random.Random(_seed("arter", obserkode))
+    rows = "".join(
+        f"<tr><td>{i}</td><td>{name}</td><td>Latin {i}</td><td>{rng.randint(1, 500)}</td><td>{rng.randint(1, 2000)}</td></tr>"
+        for i, name in enumerate(SPECIES, start=1)
+    )
+    return (
+        "<html><body><table><thead><tr><th>Artnr.</th><th>Navn</th><th>Latin</th>"
+        f"<th>Observationer</th><th>Individer</th></tr></thead><tbody>{rows}</tbody></table></body></html>"
+    )
+
+
+def _fixture_path(cfg: StandinConfig, *candidates: str) -> Optional[str]:
+    if not cfg.fixtures:
+        return None
+    for rel in candidates:
+        path = os.path.join(cfg.fixtures, rel)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _read_fixture(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def create_app(cfg: StandinConfig) -> FastAPI:
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def _latency(request: Request, call_next):
+        delay = cfg.latency_ms + (random.uniform(0, cfg.jitter_ms) if cfg.jitter_ms else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000.0)
+        return await call_next(request)
+
+    @app.get("/excel/search_result1.php")
+    async def search_result(obserdata: str = "", aar_first: int = 1900, aar_second: int = 0):
+        kode = obserdata.strip().upper()
+        aar_second = aar_second or datetime.date.today().year
+        path = _fixture_path(cfg, f"search_result1/{kode}_{aar_first}_{aar_second}.csv", f"search_result1/{kode}.csv")
+        body = _read_fixture(path) if path else synthetic_export(kode, aar_first, aar_second, cfg)
+        return Response(body, media_type="text/csv; charset=latin1")
+
+    @app.get("/popobser.php")
+    async def popobser(obserkode: str = ""):
+        kode = obserkode.strip().upper()
+        path = _fixture_path(cfg, f"popobser/{kode}.html")
+        if path:
+            return HTMLResponse(_read_fixture(path).decode("utf-8", errors="replace"))
+        if kode.startswith("NONAME"):
+            return HTMLResponse("<html><body>Ukendt observatør</body></html>")
+        return HTMLResponse(f'<table><tr><td><acronym>Navn</acronym>:</td><td valign="top">Observatør {kode}</td></tr></table>')
+
+    @app.get("/sites/group_{kommune_id}.json")
+    async def sites(kommune_id: int):
+        path = _fixture_path(cfg, f"sites/group_{kommune_id}.json")
+        if path:
+            return Response(_read_fixture(path), media_type="application/json")
+        return JSONResponse(synthetic_sites(kommune_id, cfg))
+
+    @app.get("/opslag/artdata.php")
+    async def artdata():
+        path = _fixture_path(cfg, "artdata.html")
+        return HTMLResponse(_read_fixture(path).decode("utf-8", errors="replace") if path else synthetic_artdata_html())
+
+    @app.post("/api/v1/login")
+    async def login(request: Request):
+        try:
+            payload = await request.json()
+        except Exception:
+            payload = {}
+        if not payload.get("username") or not payload.get("password"):
+            return JSONResponse({"error": "invalid"}, status_code=401)
+        return {"token": f"standin-{payload['username']}"}
+
+    @app.get("/arter")
+    async def arter(obser: str = ""):
+        kode = obser.strip().upper()
+        path = _fixture_path(cfg, f"arter/{kode}.html")
+        return HTMLResponse(_read_fixture(path).decode("utf-8", errors="replace") if path else synthetic_arter_html(kode))
+
+    return app
+
+
+def serve(args) -> int:
+    import uvicorn
+
+    cfg = StandinConfig(
+        rows_per_year=args.rows_per_year,
+        sites_per_kommune=args.sites,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        first_year=args.first_year,
+        fixtures=args.fixtures,
+    )
+    uvicorn.run(create_app(cfg), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+def record(args) -> int:
+    """Optager rigtige svar for de givne obserkoder til fixtures-mappen (rammer dofbasen.dk)."""
+    import httpx
+
+    dofbasen = os.environ.get("DOFBASEN_URL", "https://dofbasen.dk").rstrip("/")
+    year = datetime.date.today().year
+    with httpx.Client(timeout=60) as client:
+        for kode in args.obserkoder:
+            kode = kode.strip().upper()
+            export = client.get(
+                f"{dofbasen}/excel/search_result1.php?design=excel&soeg=soeg&periode=maanedaar"
+                f"&aar_first=1900&aar_second={year}&obstype=observationer&species=alle"
+                f"&obserdata={kode}&sortering=dato"
+            )
+            export.raise_for_status()
+            navn = client.get(f"{dofbasen}/popobser.php?obserkode={kode}")
+            for rel, body in ((f"search_result1/{kode}.csv", export.content), (f"popobser/{kode}.html", navn.content)):
+                path = os.path.join(args.out, rel)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(body)
+            print(f"{kode}: {len(export.content) / 1024:.0f} KB eksport")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_serve = sub.add_parser("serve", help="Start stand-in serveren")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=8765)
+    p_serve.add_argument("--rows-per-year", type=int, default=300, help="rækker pr. bruger pr. år i eksporter")
+    p_serve.add_argument("--first-year", type=int, default=FIRST_SYNTHETIC_YEAR)
+    p_serve.add_argument("--sites", type=int, default=50, help="lokationer pr. kommune")
+    p_serve.add_argument("--latency-ms", type=float, default=0.0)
+    p_serve.add_argument("--jitter-ms", type=float, default=0.0)
+    p_serve.add_argument("--fixtures", default=None, help="mappe med optagede svar (bruges før syntetiske)")
+    p_serve.set_defaults(func=serve)
+
+    p_record = sub.add_parser("record", help="Optag rigtige DOFbasen-svar som fixtures")
+    p_record.add_argument("--out", required=True)
+    p_record.add_argument("obserkoder", nargs="+")
+    p_record.set_defaults(func=record)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,18 +3,34 @@ import io
 import json
 import time
 import asyncio
+import bisect
 import datetime
 import secrets
 import math
 import hashlib
 import shutil
-import requests
+import random
+import tempfile
+import zlib
+import contextvars
+import contextlib
+import functools
+import multiprocessing
+import threading
+try:
+    import fcntl
+except ImportError:  # Windows: kun låsen inden for processen
+    fcntl = None
+import httpx
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 import re
 
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, List, Tuple, NamedTuple
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Body, Query, Depends
 from fastapi.staticfiles import StaticFiles
@@ -29,7 +45,7 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import Column, String, Date, Integer, Text, select, func, text
+from sqlalchemy import Column, String, Date, Integer, Text, Index, select, func, text, insert, update, bindparam, or_
 
 from starlette.middleware.sessions import SessionMiddleware
 
@@ -84,6 +100,101 @@ class Observation(Base):
     afdeling   = Column(String, nullable=True)
     loknavn    = Column(String, nullable=True)
     loknr      = Column(Integer, nullable=True, index=True)
+    sync_key   = Column(String, nullable=True)   # "o:<obsid>" eller "h:<hash>" (rækker uden obsid)
+    row_hash   = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ux_observations_obserkode_sync_key", "obserkode", "sync_key", unique=True),
+    )
+
+class ObservationTag(Base):
+    """Hashtags fra turnoter, udtrukket når observationen skrives (én række pr. observation og tag)."""
+    __tablename__ = "observation_tags"
+    id        = Column(Integer, primary_key=True)
+    obserkode = Column(String, nullable=False)
+    sync_key  = Column(String, nullable=False)
+    dato      = Column(Date, nullable=True)
+    tag       = Column(String, nullable=False)   # normaliseret, fx "#BB26-2"
+
+    __table_args__ = (
+        Index("ix_observation_tags_obserkode_tag", "obserkode", "tag"),
+        Index("ix_observation_tags_obserkode_sync_key", "obserkode", "sync_key"),
+    )
+
+class ObservationTagState(Base):
+    """Brugere hvis observation_tags er komplette; for andre læses tags fra turnoter."""
+    __tablename__ = "observation_tag_state"
+    obserkode  = Column(String, primary_key=True)
+    version    = Column(Integer, nullable=False)
+    indexed_at = Column(String, nullable=True)
+
+class ObservationDataVersion(Base):
+    """Nyt token hver gang en brugers observationer for et år ændres; indgår i listernes fingerprint."""
+    __tablename__ = "observation_data_versions"
+    id         = Column(Integer, primary_key=True)
+    obserkode  = Column(String, nullable=False)
+    year       = Column(Integer, nullable=False)
+    token      = Column(String, nullable=False)
+    changed_at = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ux_observation_data_versions_obserkode_year", "obserkode", "year", unique=True),
+    )
+
+class ExportHash(Base):
+    """Indholds-hash af seneste normaliserede DOFbasen-eksport pr. (obserkode, årsinterval)."""
+    __tablename__ = "export_hashes"
+    id           = Column(Integer, primary_key=True, index=True)
+    obserkode    = Column(String, index=True, nullable=False)
+    scope        = Column(String, nullable=False)   # fx "2026-2026" eller "1900-NU"
+    content_hash = Column(String, nullable=False)
+    rows         = Column(Integer, nullable=True)
+    checked_at   = Column(String, nullable=True)    # ISO-tidspunkt for seneste tjek
+    changed_at   = Column(String, nullable=True)    # ISO-tidspunkt for seneste ændring
+    last_result  = Column(String, nullable=True)    # "changed" | "skipped" | "pending" (rebuild ikke gennemført)
+
+    __table_args__ = (
+        Index("ux_export_hashes_obserkode_scope", "obserkode", "scope", unique=True),
+    )
+
+class SyncWatermark(Base):
+    """Hvornår en bruger sidst blev synket fuldt (1900-NU) og som delta (seneste år)."""
+    __tablename__ = "sync_watermarks"
+    id              = Column(Integer, primary_key=True, index=True)
+    obserkode       = Column(String, unique=True, index=True, nullable=False)
+    last_full_sync  = Column(Date, nullable=True)
+    last_delta_sync = Column(Date, nullable=True)
+    delta_from_year = Column(Integer, nullable=True)
+
+class SyncJob(Base):
+    """Baggrundsjob (sync/rebuild) der overlever genstart; se job_worker_loop."""
+    __tablename__ = "sync_jobs"
+    id               = Column(Integer, primary_key=True, index=True)
+    kind             = Column(String, index=True, nullable=False)
+    obserkode        = Column(String, nullable=True)
+    year             = Column(Integer, nullable=True)
+    status           = Column(String, index=True, nullable=False, default="pending")  # pending|running|done|failed|cancelled
+    progress         = Column(String, nullable=True)
+    error            = Column(Text, nullable=True)
+    attempts         = Column(Integer, nullable=False, default=0)
+    claim_token      = Column(String, index=True, nullable=True)
+    cancel_requested = Column(Integer, nullable=False, default=0)
+    created_at       = Column(String, nullable=True)
+    not_before       = Column(String, nullable=True)
+    started_at       = Column(String, nullable=True)
+    heartbeat_at     = Column(String, nullable=True)
+    finished_at      = Column(String, nullable=True)
+
+    # Højst ét ventende job pr. (kind, obserkode, year) – håndhæves i DB, så
+    # samtidige enqueue_job fra flere workers ikke kan oprette dubletter
+    __table_args__ = (
+        Index(
+            "ux_sync_jobs_pending_key", "kind", func.coalesce(obserkode, ""), func.coalesce(year, -1),
+            unique=True,
+            sqlite_where=text("status = 'pending'"),
+            postgresql_where=text("status = 'pending'"),
+        ),
+    )
 
 class Lokation(Base):
     __tablename__ = "lokationer"
@@ -260,6 +371,178 @@ def remove_all_user_data_dirs(obserkode: str):
 def safe_output(value: str) -> str:
     return escape(str(value or ""), quote=True)
 
+# ---------------------------------------------------------
+#  DOFbasen HTTP-klient (delt, async, connection pool)
+# ---------------------------------------------------------
+DOFBASEN_URL = os.environ.get("DOFBASEN_URL", "https://dofbasen.dk").rstrip("/")
+DOF_STATISTIK_URL = os.environ.get("DOF_STATISTIK_URL", "https://statistik.dofbasen.dk").rstrip("/")
+DOF_KRYDSLISTER_URL = os.environ.get("DOF_KRYDSLISTER_URL", "https://krydslister.dofbasen.dk").rstrip("/")
+
+DOF_HTTP_TIMEOUT = float(os.environ.get("DOF_HTTP_TIMEOUT", "30"))
+DOF_HTTP_CONNECT_TIMEOUT = float(os.environ.get("DOF_HTTP_CONNECT_TIMEOUT", "10"))
+DOF_HTTP_MAX_PER_HOST = max(1, int(os.environ.get("DOF_HTTP_MAX_PER_HOST", "4")))
+DOF_HTTP_RETRIES = max(0, int(os.environ.get("DOF_HTTP_RETRIES", "3")))
+DOF_HTTP_BACKOFF_SECONDS = float(os.environ.get("DOF_HTTP_BACKOFF_SECONDS", "1.0"))
+DOF_HTTP_RETRY_STATUS = {429, 500, 502, 503, 504}
+# Øvre grænse for Retry-After, så én skæv header ikke parkerer et job i timevis
+DOF_HTTP_MAX_RETRY_AFTER = float(os.environ.get("DOF_HTTP_MAX_RETRY_AFTER", "60"))
+# Fejl hvor requesten med sikkerhed ikke er sendt; kun dem prøves igen for POST
+DOF_HTTP_UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+DOF_HTTP_IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+DOF_HTTP_STREAM_CHUNK_BYTES = 64 * 1024
+# Høflighedsgrænse pr. host: gennemsnitlig rate (kald/s) og burst (token bucket)
+DOF_HTTP_RATE_PER_HOST = float(os.environ.get("DOF_HTTP_RATE_PER_HOST", "2.0"))
+DOF_HTTP_BURST_PER_HOST = max(1, int(os.environ.get("DOF_HTTP_BURST_PER_HOST", "4")))
+
+_dof_http_client: Optional[httpx.AsyncClient] = None
+_dof_http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_dof_host_semaphores: Dict[str, asyncio.Semaphore] = {}
+_dof_host_buckets: Dict[str, "_TokenBucket"] = {}
+
+class _TokenBucket:
+    """Simpel token bucket: op til `burst` kald med det samme, derefter `rate` kald/s."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def get_dof_http_client() -> httpx.AsyncClient:
+    """
+    Delt AsyncClient med keep-alive mod dofbasen.dk, statistik.dofbasen.dk og
+    krydslister.dofbasen.dk. Oprettes dovent pr. event loop.
+    """
+    global _dof_http_client, _dof_http_client_loop
+    loop = asyncio.get_running_loop()
+    if _dof_http_client is None or _dof_http_client.is_closed or _dof_http_client_loop is not loop:
+        _dof_http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(DOF_HTTP_TIMEOUT, connect=DOF_HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=DOF_HTTP_MAX_PER_HOST * 3,
+                max_keepalive_connections=DOF_HTTP_MAX_PER_HOST * 3,
+                keepalive_expiry=60,
+            ),
+            follow_redirects=True,
+            headers={"User-Agent": "Boligbirding/1.0"},
+        )
+        _dof_http_client_loop = loop
+        _dof_host_semaphores.clear()
+        _dof_host_buckets.clear()
+    return _dof_http_client
+
+async def close_dof_http_client():
+    global _dof_http_client, _dof_http_client_loop
+    if _dof_http_client is not None and not _dof_http_client.is_closed:
+        await _dof_http_client.aclose()
+    _dof_http_client = None
+    _dof_http_client_loop = None
+    _dof_host_semaphores.clear()
+    _dof_host_buckets.clear()
+
+def _dof_host_semaphore(url: str) -> asyncio.Semaphore:
+    host = httpx.URL(url).host or ""
+    sem = _dof_host_semaphores.get(host)
+    if sem is None:
+        sem = asyncio.Semaphore(DOF_HTTP_MAX_PER_HOST)
+        _dof_host_semaphores[host] = sem
+    return sem
+
+async def _dof_stream_into(client: httpx.AsyncClient, method: str, url: str, sink, **kwargs) -> httpx.Response:
+    """Streamer svaret direkte over i sink (fil-objekt) i stedet for at holde det i hukommelsen."""
+    sink.seek(0)
+    sink.truncate()
+    async with client.stream(method, url, **kwargs) as resp:
+        if resp.status_code >= 400:
+            await resp.aread()
+        else:
+            async for chunk in resp.aiter_bytes(DOF_HTTP_STREAM_CHUNK_BYTES):
+                sink.write(chunk)
+    sink.seek(0)
+    return resp
+
+def _dof_host_bucket(url: str) -> _TokenBucket:
+    host = httpx.URL(url).host or ""
+    bucket = _dof_host_buckets.get(host)
+    if bucket is None:
+        bucket = _TokenBucket(DOF_HTTP_RATE_PER_HOST, DOF_HTTP_BURST_PER_HOST)
+        _dof_host_buckets[host] = bucket
+    return bucket
+
+def _dof_backoff_delay(attempt: int) -> float:
+    base = DOF_HTTP_BACKOFF_SECONDS * (2 ** attempt)
+    return base + random.uniform(0, base / 2)
+
+async def dof_request(
+    method: str,
+    url: str,
+    *,
+    timeout: Optional[float] = None,
+    retries: Optional[int] = None,
+    sink=None,
+    **kwargs,
+) -> httpx.Response:
+    """
+    Kald mod DOFbasen via den delte klient. Begrænser samtidige kald og raten
+    pr. host (token bucket), og prøver igen med eksponentiel backoff ved netværksfejl og 429/5xx.
+    Ikke-idempotente kald (POST) prøves kun igen ved netværksfejl hvor
+    requesten ikke nåede frem (DOF_HTTP_UNSENT_ERRORS).
+    Med sink (binært fil-objekt) streames body'en dertil; resp.content læses ikke.
+    """
+    client = get_dof_http_client()
+    max_attempts = (DOF_HTTP_RETRIES if retries is None else max(0, retries)) + 1
+    if timeout is not None:
+        kwargs["timeout"] = httpx.Timeout(timeout, connect=min(timeout, DOF_HTTP_CONNECT_TIMEOUT))
+
+    idempotent = method.upper() in DOF_HTTP_IDEMPOTENT_METHODS
+
+    attempt = 0
+    while True:
+        is_last = attempt >= max_attempts - 1
+        try:
+            await _dof_host_bucket(url).acquire()
+            async with _dof_host_semaphore(url):
+                if sink is None:
+                    resp = await client.request(method, url, **kwargs)
+                else:
+                    resp = await _dof_stream_into(client, method, url, sink, **kwargs)
+        except httpx.TransportError as exc:
+            # Fx en read timeout på et login-POST kan allerede være behandlet
+            if is_last or not (idempotent or isinstance(exc, DOF_HTTP_UNSENT_ERRORS)):
+                raise
+            delay = _dof_backoff_delay(attempt)
+            print(f"[HTTP] {method} {url} fejlede ({exc!r}) – nyt forsøg om {delay:.1f}s")
+        else:
+            if resp.status_code not in DOF_HTTP_RETRY_STATUS or is_last:
+                return resp
+            delay = _dof_backoff_delay(attempt)
+            retry_after = _parse_int(resp.headers.get("retry-after"))
+            if retry_after is not None:
+                delay = max(delay, min(float(retry_after), DOF_HTTP_MAX_RETRY_AFTER))
+            print(f"[HTTP] {method} {url} gav {resp.status_code} – nyt forsøg om {delay:.1f}s")
+        await asyncio.sleep(delay)
+        attempt += 1
+
+async def dof_get(url: str, **kwargs) -> httpx.Response:
+    return await dof_request("GET", url, **kwargs)
+
+async def dof_post(url: str, **kwargs) -> httpx.Response:
+    return await dof_request("POST", url, **kwargs)
+
 def _extract_observer_name_from_html(html: str) -> str:
     content = str(html or "")
     if not content:
@@ -280,21 +563,77 @@ def _extract_observer_name_from_html(html: str) -> str:
     value = re.sub(r"<[^>]+>", "", match.group(1) or "").strip()
     return unescape(value)
 
-def fetch_observer_name_from_dof(obserkode: str, timeout_seconds: int = 10) -> str:
+# ---------------------------------------------------------
+#  Observatørnavne (popobser) med cache
+# ---------------------------------------------------------
+NAME_CACHE_TTL_SECONDS = float(os.environ.get("NAME_CACHE_TTL_SECONDS", str(24 * 3600)))
+# Koder uden navn caches kortere, så en nyoprettet profil dukker op samme dag
+NAME_CACHE_NEGATIVE_TTL_SECONDS = float(os.environ.get("NAME_CACHE_NEGATIVE_TTL_SECONDS", "3600"))
+NAME_FETCH_CONCURRENCY = max(1, int(os.environ.get("NAME_FETCH_CONCURRENCY", "8")))
+
+_observer_name_cache: Dict[str, Tuple[float, str]] = {}
+_observer_name_inflight: Dict[str, asyncio.Future] = {}
+
+async def _fetch_observer_name_uncached(safe_kode: str, timeout_seconds: int = 10) -> Optional[str]:
+    """Navnet, "" hvis DOFbasen ikke har et, eller None ved HTTP-fejl (caches ikke)."""
     try:
-        safe_kode = normalize_obserkode(obserkode)
+        navn_res = await dof_get(f"{DOFBASEN_URL}/popobser.php?obserkode={safe_kode}", timeout=timeout_seconds)
     except Exception:
-        return ""
+        return None
+    if navn_res.status_code != 200:
+        return None
+    return _extract_observer_name_from_html(navn_res.text)
 
+async def resolve_observer_name(obserkode: str, force: bool = False, timeout_seconds: int = 10) -> str:
+    """
+    Slår navnet op via cachen (TTL, negativ cache for koder uden navn).
+    Samtidige opslag af samme kode deler ét HTTP-kald.
+    """
     try:
-        navn_res = requests.get(f"https://dofbasen.dk/popobser.php?obserkode={safe_kode}", timeout=timeout_seconds)
+        safe_kode = normalize_obserkode(obserkode)
     except Exception:
         return ""
 
-    if navn_res.status_code != 200:
-        return ""
+    now = time.monotonic()
+    cached = _observer_name_cache.get(safe_kode)
+    if cached and cached[0] > now and not force:
+        return cached[1]
 
-    return _extract_observer_name_from_html(navn_res.text)
+    inflight = _observer_name_inflight.get(safe_kode)
+    if inflight is not None:
+        return await asyncio.shield(inflight)
+
+    future = asyncio.get_running_loop().create_future()
+    _observer_name_inflight[safe_kode] = future
+    try:
+        navn = await _fetch_observer_name_uncached(safe_kode, timeout_seconds)
+        if navn is None:
+            navn = cached[1] if cached else ""
+        else:
+            ttl = NAME_CACHE_TTL_SECONDS if navn else NAME_CACHE_NEGATIVE_TTL_SECONDS
+            _observer_name_cache[safe_kode] = (time.monotonic() + ttl, navn)
+        future.set_result(navn)
+        return navn
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as exc:
+        future.set_exception(exc)
+        future.exception()
+        raise
+    finally:
+        _observer_name_inflight.pop(safe_kode, None)
+
+async def resolve_observer_names(koder: List[str], force: bool = False) -> Dict[str, str]:
+    """Slår mange navne op med højst NAME_FETCH_CONCURRENCY samtidige HTTP-kald."""
+    semaphore = asyncio.Semaphore(NAME_FETCH_CONCURRENCY)
+
+    async def _one(kode: str) -> str:
+        async with semaphore:
+            return await resolve_observer_name(kode, force=force)
+
+    navne = await asyncio.gather(*(_one(kode) for kode in koder))
+    return dict(zip(koder, navne))
 
 def sanitize_text(s):
     """Tillad kun bogstaver, tal og mellemrum."""
@@ -322,12 +661,21 @@ def _extract_hashtag_tokens(text_value: Optional[str]) -> set:
     # Matcher fx #BB26, #BB26-1, #HOME-2 (ingen delstrengs-match)
     return set(re.findall(r"#[A-Z0-9]+(?:-[A-Z0-9]+)*", value))
 
-def _note_has_any_tag(text_value: Optional[str], tags: List[str]) -> bool:
-    clean_tags = [str(tag or "").upper().strip() for tag in (tags or []) if str(tag or "").strip()]
-    if not clean_tags:
-        return False
-    tokens = _extract_hashtag_tokens(text_value)
-    return any(tag in tokens for tag in clean_tags)
+_NO_TAGS: frozenset = frozenset()
+
+@functools.lru_cache(maxsize=65536)
+def _note_hashtags(text_value: Optional[str]) -> frozenset:
+    """Memoiseret _extract_hashtag_tokens – de samme turnoter går igen på mange rækker."""
+    if not text_value or "#" not in text_value:
+        return _NO_TAGS
+    return frozenset(_extract_hashtag_tokens(text_value))
+
+def _row_hashtags(row, tag_index: Optional[Dict[str, frozenset]] = None) -> frozenset:
+    """Rækkens hashtags: fra tag-indekset når brugeren er indekseret, ellers fra turnoter."""
+    sync_key = getattr(row, "sync_key", None)
+    if tag_index is not None and sync_key:
+        return tag_index.get(sync_key, _NO_TAGS)
+    return _note_hashtags(row.turnoter)
 
 def _matrikel_tags_for_year(raw_filter: str, year_value: int, matrikel_number: int) -> List[str]:
     base_tag = resolve_filter_tag(raw_filter, year_value)
@@ -337,10 +685,60 @@ def _matrikel_tags_for_year(raw_filter: str, year_value: int, matrikel_number: i
         return [base_tag, f"{base_tag}-1"]
     return [f"{base_tag}-{int(matrikel_number)}"]
 
-def _observation_has_matrikel_tag(row: Observation, raw_filter: str, matrikel_number: int) -> bool:
+class MatrikelTagMatcher:
+    """
+    Matrikel-tags for ét globalt filter kompileret pr. år: (år, matrikel) ->
+    frozenset af normaliserede tags. Et rækketjek er derefter ét isdisjoint
+    mod rækkens hashtags uden at bygge eller rense tag-lister.
+    """
+
+    def __init__(self, raw_filter: str, years: Optional[Tuple[int, int]] = None):
+        self.raw_filter = raw_filter or ""
+        self._tags: Dict[Tuple[int, int], frozenset] = {}
+        if years:
+            for year in range(years[0], years[1] + 1):
+                self.tags(year, 1)
+                self.tags(year, 2)
+
+    def tags(self, year: int, matrikel_number: int) -> frozenset:
+        key = (year, matrikel_number)
+        compiled = self._tags.get(key)
+        if compiled is None:
+            compiled = self._tags[key] = frozenset(
+                str(tag).upper().strip()
+                for tag in _matrikel_tags_for_year(self.raw_filter, year, matrikel_number)
+                if str(tag).strip()
+            )
+        return compiled
+
+    def matches(self, tokens: frozenset, year: int, matrikel_number: int) -> bool:
+        return bool(tokens) and not tokens.isdisjoint(self.tags(year, matrikel_number))
+
+    def bits(self, tokens: frozenset, year: int) -> int:
+        """TAG_MATRIKEL1/TAG_MATRIKEL2-bits for rækkens hashtags."""
+        if not tokens:
+            return 0
+        bits = 0
+        if not tokens.isdisjoint(self.tags(year, 1)):
+            bits |= TAG_MATRIKEL1
+        if not tokens.isdisjoint(self.tags(year, 2)):
+            bits |= TAG_MATRIKEL2
+        return bits
+
+@functools.lru_cache(maxsize=16)
+def matrikel_tag_matcher(raw_filter: str) -> MatrikelTagMatcher:
+    """Delt matcher pr. filter (pr. proces); år kompileres første gang de bruges."""
+    today = datetime.date.today()
+    return MatrikelTagMatcher(raw_filter, years=(today.year - 30, today.year + 1))
+
+def _observation_has_matrikel_tag(
+    row: Observation,
+    raw_filter: str,
+    matrikel_number: int,
+    tag_index: Optional[Dict[str, frozenset]] = None,
+) -> bool:
     year_value = row.dato.year if getattr(row, "dato", None) else datetime.datetime.now().year
-    tags = _matrikel_tags_for_year(raw_filter, year_value, matrikel_number)
-    return _note_has_any_tag(row.turnoter, tags)
+    return matrikel_tag_matcher(raw_filter).matches(_row_hashtags(row, tag_index), year_value, matrikel_number)
 
 def _parse_iso_date(value: Any) -> Optional[datetime.date]:
     if value is None:
@@ -423,7 +821,17 @@ def _merge_period_lists(base_list: List[Dict[str, Optional[str]]], extra_list: L
 def _load_user_matrikel_periods(user: Optional[User]) -> Dict[str, List[Dict[str, Optional[str]]]]:
     if not user:
         return {}
+    return _decode_matrikel_periods(
+        getattr(user, "matrikel_perioder_json", None),
+        getattr(user, "matrikel1_perioder", None),
+        getattr(user, "matrikel2_perioder", None),
+    )
 
+def _decode_matrikel_periods(
+    dynamic_raw: Optional[str],
+    legacy_m1_raw: Optional[str],
+    legacy_m2_raw: Optional[str],
+) -> Dict[str, List[Dict[str, Optional[str]]]]:
     def _decode(raw_value: Optional[str]) -> List[Dict[str, Optional[str]]]:
         if not raw_value:
             return []
@@ -435,7 +843,6 @@ def _load_user_matrikel_periods(user: Optional[User]) -> Dict[str, List[Dict[str
 
     loaded: Dict[str, List[Dict[str, Optional[str]]]] = {}
 
-    dynamic_raw = getattr(user, "matrikel_perioder_json", None)
     if dynamic_raw:
         try:
             parsed_dynamic = json.loads(dynamic_raw)
@@ -443,21 +850,29 @@ def _load_user_matrikel_periods(user: Optional[User]) -> Dict[str, List[Dict[str
         except Exception:
             pass
 
-    legacy_m1 = _decode(getattr(user, "matrikel1_perioder", None))
-    legacy_m2 = _decode(getattr(user, "matrikel2_perioder", None))
+    legacy_m1 = _decode(legacy_m1_raw)
+    legacy_m2 = _decode(legacy_m2_raw)
     loaded[_matrikel_key(1)] = _merge_period_lists(loaded.get(_matrikel_key(1), []), legacy_m1)
     loaded[_matrikel_key(2)] = _merge_period_lists(loaded.get(_matrikel_key(2), []), legacy_m2)
 
     # Fjern tomme nøgler
     return {k: v for k, v in loaded.items() if isinstance(v, list)}
 
-def _collect_matrikel_indexes_from_observations(obs_rows: List[Observation], raw_filter: str) -> List[int]:
+def _collect_matrikel_indexes_from_observations(
+    obs_rows: List[Observation],
+    raw_filter: str,
+    tag_index: Optional[Dict[str, frozenset]] = None,
+) -> List[int]:
+    return _matrikel_indexes_from_tokens(
+        ((row.dato.year, _row_hashtags(row, tag_index)) for row in (obs_rows or []) if getattr(row, "dato", None)),
+        raw_filter,
+    )
+
+def _matrikel_indexes_from_tokens(year_tokens, raw_filter: str) -> List[int]:
+    """Matrikel-numre ud fra (år, hashtags)-par; par for samme år må gerne være slået sammen."""
     indexes = set()
-    for row in (obs_rows or []):
-        if not getattr(row, "dato", None):
-            continue
-        tokens = _extract_hashtag_tokens(row.turnoter)
-        base_tag = resolve_filter_tag(raw_filter, row.dato.year) if raw_filter else ""
+    for year_value, tokens in year_tokens:
+        base_tag = resolve_filter_tag(raw_filter, year_value) if raw_filter else ""
         if not base_tag:
             for token in tokens:
                 match = re.fullmatch(r"#BB\d{2}(?:-(\d+))?", token)
@@ -481,28 +896,6 @@ def _collect_matrikel_indexes_from_observations(obs_rows: List[Observation], raw
                     indexes.add(parsed)
     return sorted(indexes)
 
-def _period_matches_date(period: Dict[str, Optional[str]], obs_date: Optional[datetime.date]) -> bool:
-    if not obs_date:
-        return False
-    start_date = _parse_iso_date(period.get("start_date"))
-    end_date = _parse_iso_date(period.get("end_date"))
-    if not start_date:
-        return False
-    if obs_date < start_date:
-        return False
-    if end_date and obs_date > end_date:
-        return False
-    return True
-
-def _period_overlaps_range(period: Dict[str, Optional[str]], start_date: datetime.date, end_date: datetime.date) -> bool:
-    period_start = _parse_iso_date(period.get("start_date"))
-    period_end = _parse_iso_date(period.get("end_date"))
-    if not period_start:
-        return False
-    if period_end is None:
-        period_end = datetime.date.max
-    return period_start <= end_date and period_end >= start_date
-
 def _reference_date_for_range(start_date: datetime.date, end_date: datetime.date) -> datetime.date:
     today = datetime.date.today()
     if today < start_date:
@@ -511,60 +904,111 @@ def _reference_date_for_range(start_date: datetime.date, end_date: datetime.date
         return end_date
     return today
 
-def _select_active_period(
-    periods: List[Dict[str, Optional[str]]],
-    start_date: datetime.date,
-    end_date: datetime.date,
-    reference_date: Optional[datetime.date] = None,
-) -> Optional[Dict[str, Optional[str]]]:
-    ref_date = reference_date or _reference_date_for_range(start_date, end_date)
-    overlapping = [p for p in periods if _period_overlaps_range(p, start_date, end_date)]
-    if not overlapping:
-        return None
+# ---------------------------------------------------------
+#  Kompilerede matrikel-perioder
+# ---------------------------------------------------------
+_PERIOD_OPEN_END = datetime.date.max.toordinal()
+
+class MatrikelPeriods:
+    """
+    En brugers perioder for én matrikel som sorterede dato-ordinaler.
+    Foreningen af perioderne gemmes som disjunkte intervaller, så "ligger
+    datoen i en periode" er et bisect-opslag uden strengparsning.
+    """
 
-    active_for_ref = [p for p in overlapping if _period_matches_date(p, ref_date)]
-    if active_for_ref:
-        return max(active_for_ref, key=lambda p: p.get("start_date") or "")
+    def __init__(self, periods: List[Dict[str, Optional[str]]]):
+        self.periods: List[Dict[str, Optional[str]]] = []
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        for period in periods or []:
+            start = _parse_iso_date(period.get("start_date"))
+            if not start:
+                continue
+            end = _parse_iso_date(period.get("end_date"))
+            self.periods.append(period)
+            self.starts.append(start.toordinal())
+            self.ends.append(end.toordinal() if end else _PERIOD_OPEN_END)
+        union_starts: List[int] = []
+        union_ends: List[int] = []
+        for start, end in sorted(zip(self.starts, self.ends)):
+            if union_ends and start <= union_ends[-1] + 1:
+                union_ends[-1] = max(union_ends[-1], end)
+            else:
+                union_starts.append(start)
+                union_ends.append(end)
+        self.union_starts = union_starts
+        self.union_ends = union_ends
 
-    fallback = [p for p in overlapping if (_parse_iso_date(p.get("start_date")) or datetime.date.min) <= ref_date]
-    if fallback:
-        return max(fallback, key=lambda p: p.get("start_date") or "")
+    def __bool__(self) -> bool:
+        return bool(self.periods)
 
-    return min(overlapping, key=lambda p: p.get("start_date") or "")
+    def contains(self, obs_date: Optional[datetime.date]) -> bool:
+        """Ligger datoen i mindst én periode?"""
+        if not obs_date:
+            return False
+        day = obs_date.toordinal()
+        i = bisect.bisect_right(self.union_starts, day) - 1
+        return i >= 0 and day <= self.union_ends[i]
+
+    def mask(self, dato: np.ndarray) -> np.ndarray:
+        """contains() for en hel kolonne af dato-ordinaler."""
+        if not self.union_starts:
+            return np.zeros(len(dato), dtype=bool)
+        i = np.searchsorted(self.union_starts, dato, side="right") - 1
+        return (i >= 0) & (dato <= np.asarray(self.union_ends)[np.maximum(i, 0)])
+
+    def bounds(self, period: Dict[str, Optional[str]]) -> Tuple[int, int]:
+        """(start, slut) som ordinaler for en af objektets perioder; åben slut = date.max."""
+        i = next(i for i, p in enumerate(self.periods) if p is period)
+        return self.starts[i], self.ends[i]
+
+    def overlapping(self, start_date: datetime.date, end_date: datetime.date) -> "MatrikelPeriods":
+        first, last = start_date.toordinal(), end_date.toordinal()
+        return MatrikelPeriods([
+            p for p, s, e in zip(self.periods, self.starts, self.ends)
+            if s <= last and e >= first
+        ])
+
+    def active(
+        self,
+        start_date: datetime.date,
+        end_date: datetime.date,
+        reference_date: Optional[datetime.date] = None,
+    ) -> Optional[Dict[str, Optional[str]]]:
+        """
+        Perioden der er aktiv på referencedatoen blandt de perioder der overlapper
+        intervallet; ellers den senest startede før referencen, ellers den første.
+        """
+        ref = (reference_date or _reference_date_for_range(start_date, end_date)).toordinal()
+        first, last = start_date.toordinal(), end_date.toordinal()
+        candidates = [i for i in range(len(self.periods)) if self.starts[i] <= last and self.ends[i] >= first]
+        if not candidates:
+            return None
+        for pool in (
+            [i for i in candidates if self.starts[i] <= ref <= self.ends[i]],
+            [i for i in candidates if self.starts[i] <= ref],
+        ):
+            if pool:
+                best = max(self.starts[i] for i in pool)
+                return self.periods[next(i for i in pool if self.starts[i] == best)]
+        best = min(self.starts[i] for i in candidates)
+        return self.periods[next(i for i in candidates if self.starts[i] == best)]
 
-def _matrikel_obs_for_range(
-    obs_rows: List[Observation],
-    tags: List[str],
-    periods: List[Dict[str, Optional[str]]],
-    start_date: datetime.date,
-    end_date: datetime.date,
-    reference_date: Optional[datetime.date] = None,
-) -> Dict[str, List[Observation]]:
-    tagged = [row for row in obs_rows if _note_has_any_tag(row.turnoter, tags)]
-    return _apply_period_selection(tagged, periods, start_date, end_date, reference_date=reference_date)
-
-def _apply_period_selection(
-    tagged_rows: List[Observation],
-    periods: List[Dict[str, Optional[str]]],
-    start_date: datetime.date,
-    end_date: datetime.date,
-    reference_date: Optional[datetime.date] = None,
-) -> Dict[str, List[Observation]]:
-    tagged = list(tagged_rows or [])
-    if not periods:
-        return {"active": tagged, "historical": tagged}
-
-    historical_rows = [
-        row for row in tagged
-        if any(_period_matches_date(period, row.dato) for period in periods)
-    ]
+_NO_PERIODS = MatrikelPeriods([])
 
-    active_period = _select_active_period(periods, start_date, end_date, reference_date=reference_date)
-    if not active_period:
-        return {"active": [], "historical": historical_rows}
+@functools.lru_cache(maxsize=1024)
+def _compile_matrikel_periods(dynamic_raw: Optional[str], m1_raw: Optional[str], m2_raw: Optional[str]) -> Dict[str, MatrikelPeriods]:
+    return {key: MatrikelPeriods(periods) for key, periods in _decode_matrikel_periods(dynamic_raw, m1_raw, m2_raw).items()}
 
-    active_rows = [row for row in tagged if _period_matches_date(active_period, row.dato)]
-    return {"active": active_rows, "historical": historical_rows}
+def compiled_matrikel_periods(user: Optional[User]) -> Dict[str, MatrikelPeriods]:
+    """Brugerens matrikel-perioder kompileret; genbruges så længe periode-felterne er uændrede."""
+    if not user:
+        return {}
+    return _compile_matrikel_periods(
+        getattr(user, "matrikel_perioder_json", None),
+        getattr(user, "matrikel1_perioder", None),
+        getattr(user, "matrikel2_perioder", None),
+    )
 
 def safe_str(val):
     # Konverterer nan og None til tom string
@@ -575,16 +1019,33 @@ def safe_str(val):
 def _normalize_base_art_name(name: Optional[str]) -> str:
     return (name or "").split("(")[0].split(",")[0].strip()
 
-def _get_excluded_species_keys() -> set:
+def _excluded_species_stamp() -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(EXCLUDED_SPECIES_FILE)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+# Nøglesættet genindlæses kun når filen ændres (mtime/størrelse) – også på tværs af workers
+_excluded_keys_cache: Tuple[Optional[Tuple[int, int]], frozenset] = (None, frozenset())
+
+def _get_excluded_species_keys() -> frozenset:
+    global _excluded_keys_cache
+    stamp = _excluded_species_stamp()
+    cached_stamp, cached_keys = _excluded_keys_cache
+    if stamp is not None and stamp == cached_stamp:
+        return cached_keys
     try:
         names = load_excluded_species()
     except Exception:
         names = []
-    return {
+    keys = frozenset(
         _normalize_base_art_name(name).casefold()
         for name in names
         if _normalize_base_art_name(name)
-    }
+    )
+    _excluded_keys_cache = (stamp, keys)
+    return keys
 
 def _is_excluded_species(name: Optional[str], excluded_keys: Optional[set] = None) -> bool:
     keys = excluded_keys if excluded_keys is not None else _get_excluded_species_keys()
@@ -593,6 +1054,99 @@ def _is_excluded_species(name: Optional[str], excluded_keys: Optional[set] = Non
         return False
     return base_name.casefold() in keys
 
+# ---------------------------------------------------------
+#  Artsordbog (internerede artsnavne)
+# ---------------------------------------------------------
+class SpeciesDictionary:
+    """
+    Internerer rå artnavne til heltals-id'er. For hvert id gemmes basenavn
+    (name_id), casefold-nøgle (key_id), om navnet kan tælle som art (ikke
+    sp./hybrid/skråstreg) og om arten er ekskluderet. Ordbogen vokser kun;
+    eksklusionsflagene genberegnes når nøglesættet ændres.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids: Dict[str, int] = {}
+        self._name_index: Dict[str, int] = {}
+        self._key_index: Dict[str, int] = {}
+        self.name_id: List[int] = []
+        self.key_id: List[int] = []
+        self.countable: List[bool] = []
+        self.excluded: List[bool] = []
+        self.base: List[str] = []
+        self.keys: List[str] = []
+        self.excluded_keys: frozenset = frozenset()
+        self._arrays: Optional[Tuple[int, np.ndarray, np.ndarray, np.ndarray]] = None
+
+    def intern(self, artnavn: Optional[str]) -> int:
+        raw = artnavn or ""
+        sid = self._ids.get(raw)
+        if sid is not None:
+            return sid
+        with self._lock:
+            sid = self._ids.get(raw)
+            if sid is not None:
+                return sid
+            base = _normalize_base_art_name(raw)
+            key = base.casefold()
+            nid = self._name_index.get(base)
+            if nid is None:
+                nid = self._name_index[base] = len(self.base)
+                self.base.append(base)
+            kid = self._key_index.get(key)
+            if kid is None:
+                kid = self._key_index[key] = len(self.keys)
+                self.keys.append(key)
+            sid = len(self.name_id)
+            self.name_id.append(nid)
+            self.key_id.append(kid)
+            self.countable.append(not ("sp." in base or "/" in base or " x " in base))
+            self.excluded.append(key in self.excluded_keys)
+            self._ids[raw] = sid
+            return sid
+
+    def set_excluded_keys(self, keys) -> None:
+        keys = frozenset(keys)
+        if keys == self.excluded_keys:
+            return
+        with self._lock:
+            self.excluded_keys = keys
+            self.excluded = [self.keys[kid] in keys for kid in self.key_id]
+            self._arrays = None
+
+    def counts(self, sid: int) -> bool:
+        """Tæller id'et som en art (gyldigt navn og ikke ekskluderet)?"""
+        return self.countable[sid] and not self.excluded[sid]
+
+    def base_name(self, sid: int) -> str:
+        return self.base[self.name_id[sid]]
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(name_id, key_id, counts) som NumPy-opslag indekseret med id."""
+        cached = self._arrays
+        size = len(self.name_id)
+        if cached is None or cached[0] != size:
+            with self._lock:
+                size = len(self.name_id)
+                counts = np.asarray(self.countable[:size], dtype=bool) & ~np.asarray(self.excluded[:size], dtype=bool)
+                cached = self._arrays = (
+                    size,
+                    np.asarray(self.name_id[:size], dtype=np.int32),
+                    np.asarray(self.key_id[:size], dtype=np.int32),
+                    counts,
+                )
+        return cached[1], cached[2], cached[3]
+
+_species_dictionary = SpeciesDictionary()
+
+def species_dictionary(excluded_keys: Optional[set] = None) -> SpeciesDictionary:
+    """Processens artsordbog, synkroniseret med de givne (eller filens) ekskluderede arter."""
+    _species_dictionary.set_excluded_keys(
+        excluded_keys if excluded_keys is not None else _get_excluded_species_keys()
+    )
+    return _species_dictionary
+
 def merged_note_text(turnoter: Any, fuglenoter: Any) -> str:
     turnoter_str = safe_str(turnoter).strip()
     fuglenoter_str = safe_str(fuglenoter).strip()
@@ -755,49 +1309,315 @@ async def set_global_year(value: int):
         session.add(GlobalYear(value=int(value)))
         await session.commit()
 
+# ---------------------------------------------------------
+#  CPU-pulje (parsing og listeberegning uden for event loop)
+# ---------------------------------------------------------
+# 0 = ingen procespulje; arbejdet køres så i en tråd som hidtil
+CPU_POOL_WORKERS = max(0, int(os.environ.get("CPU_POOL_WORKERS", "2")))
+# "spawn" undgår fork af en proces med kørende event loop og DB-tråde
+CPU_POOL_START_METHOD = os.environ.get("CPU_POOL_START_METHOD", "spawn").strip().lower()
+
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+
+def get_cpu_pool() -> Optional[ProcessPoolExecutor]:
+    global _cpu_pool
+    if CPU_POOL_WORKERS <= 0:
+        return None
+    if _cpu_pool is None:
+        _cpu_pool = ProcessPoolExecutor(
+            max_workers=CPU_POOL_WORKERS,
+            mp_context=multiprocessing.get_context(CPU_POOL_START_METHOD),
+        )
+        print(f"[CPU] Procespulje startet ({CPU_POOL_WORKERS} workers, {CPU_POOL_START_METHOD})")
+    return _cpu_pool
+
+def shutdown_cpu_pool():
+    global _cpu_pool
+    pool, _cpu_pool = _cpu_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+async def run_in_cpu_pool(fn, *args):
+    """
+    Kører fn(*args) i procespuljen og venter på resultatet. fn skal ligge på
+    modulniveau og args være picklbare (ObsRecord, dicts, datoer – ikke ORM).
+    Er puljen slået fra eller gået i stykker, køres fn i en tråd i stedet.
+    """
+    pool = get_cpu_pool()
+    if pool is None:
+        return await asyncio.to_thread(fn, *args)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(pool, functools.partial(fn, *args))
+    except BrokenProcessPool as e:
+        print(f"[CPU] Procespulje fejlede ({e}) – genstarter og kører i tråd")
+        if _cpu_pool is pool:
+            shutdown_cpu_pool()
+        return await asyncio.to_thread(fn, *args)
+
+class ObsRecord(NamedTuple):
+    """Let, picklbar observation til listeberegning (i stedet for ORM-rækker)."""
+    id: int
+    artnavn: str
+    dato: datetime.date
+    obsid: Optional[str]
+    turnoter: Optional[str]
+    afdeling: Optional[str]
+    loknavn: Optional[str]
+    loknr: Optional[int]
+    sync_key: Optional[str]
+
+async def load_obs_records(session: AsyncSession, *where) -> List[ObsRecord]:
+    columns = [getattr(Observation, name) for name in ObsRecord._fields]
+    rows = (await session.execute(select(*columns).where(*where).order_by(Observation.id))).all()
+    return [ObsRecord(*row) for row in rows]
+
+async def load_obs_records_by_user(session: AsyncSession, *where) -> Dict[str, List[ObsRecord]]:
+    columns = [Observation.obserkode] + [getattr(Observation, name) for name in ObsRecord._fields]
+    rows = (await session.execute(select(*columns).where(*where).order_by(Observation.id))).all()
+    grouped: Dict[str, List[ObsRecord]] = defaultdict(list)
+    for row in rows:
+        grouped[row[0]].append(ObsRecord(*row[1:]))
+    return grouped
+
+# ---------------------------------------------------------
+#  Kolonnelager for observationer (listeberegning)
+# ---------------------------------------------------------
+TAG_MATRIKEL1 = 1
+TAG_MATRIKEL2 = 2
+_AFDELING_INDEX = {navn: idx for idx, navn in enumerate(AFDELINGER)}
+
+class ObsColumns:
+    """
+    Én brugers observationer som NumPy-kolonner: navn-/art-id fra artsordbogen, dato (ordinal),
+    loknr, afdeling-id og matrikel-tags som bitmaske (TAG_MATRIKEL1/2 i forhold
+    til rækkens eget år). Bygges én gang pr. bruger pr. rebuild; udvalg er
+    bool-masker og firsts beregnes vektoriseret (group-by-min). Hashtags tages
+    fra tag_index (observation_tags) når det gives, ellers fra turnoter.
+    """
+
+    def __init__(
+        self,
+        records,
+        raw_filter: str = "",
+        excluded_keys: Optional[set] = None,
+        tag_index: Optional[Dict[str, frozenset]] = None,
+    ):
+        species = species_dictionary(excluded_keys)
+        n = len(records)
+        self.size = n
+        self.names = species.base
+        self.loknavn: List[Optional[str]] = [None] * n
+        self.obsid: List[Optional[str]] = [None] * n
+        self.raw_filter = raw_filter
+        matcher = matrikel_tag_matcher(raw_filter)
+        current_year = datetime.datetime.now().year
+        # (række, hashtags, år) for rækker med tags – til matrikel-numre ud over 1/2
+        self._tagged_rows: List[Tuple[int, frozenset, int]] = []
+
+        sid = np.empty(n, dtype=np.int32)
+        dato = np.zeros(n, dtype=np.int32)
+        loknr = np.full(n, -1, dtype=np.int64)
+        afdeling = np.full(n, -1, dtype=np.int16)
+        has_obsid = np.zeros(n, dtype=bool)
+        tags = np.zeros(n, dtype=np.uint8)
+
+        for i, row in enumerate(records):
+            sid[i] = species.intern(row.artnavn)
+            if row.dato:
+                dato[i] = row.dato.toordinal()
+            if row.loknr is not None:
+                loknr[i] = row.loknr
+            afdeling[i] = _AFDELING_INDEX.get((row.afdeling or "").strip(), -1)
+            has_obsid[i] = bool(str(row.obsid or "").strip())
+            self.obsid[i] = row.obsid
+            self.loknavn[i] = row.loknavn
+
+            if not raw_filter:
+                continue
+            tokens = _row_hashtags(row, tag_index)
+            if not tokens:
+                continue
+            year = row.dato.year if row.dato else current_year
+            self._tagged_rows.append((i, tokens, year))
+            tags[i] = matcher.bits(tokens, year)
+
+        name_of, key_of, counts = species.arrays()
+        self.name_id = name_of[sid]
+        self.species_id = key_of[sid]
+        self.dato = dato
+        self.loknr = loknr
+        self.afdeling = afdeling
+        self.has_obsid = has_obsid
+        self.tags = tags
+        # Rækker der kan tælle som art: gyldigt navn og en dato
+        self.valid = counts[sid] & (dato > 0)
+        self._sorted: Optional[np.ndarray] = None
+        self._obsid_lookup = None
+
+    # --- udvalg (bool-masker) -------------------------------------------
+    def everything(self) -> np.ndarray:
+        return np.ones(self.size, dtype=bool)
+
+    def tagged(self, bit: int) -> np.ndarray:
+        return (self.tags & bit) != 0
+
+    def matrikel(self, matrikel_number: int) -> np.ndarray:
+        """Rækker med tag for matrikel nr. N (i forhold til rækkens år)."""
+        if matrikel_number == 1:
+            return self.tagged(TAG_MATRIKEL1)
+        if matrikel_number == 2:
+            return self.tagged(TAG_MATRIKEL2)
+        mask = np.zeros(self.size, dtype=bool)
+        matcher = matrikel_tag_matcher(self.raw_filter)
+        for i, tokens, year in self._tagged_rows:
+            mask[i] = matcher.matches(tokens, year, matrikel_number)
+        return mask
+
+    def in_year(self, year: int) -> np.ndarray:
+        return (self.dato >= datetime.date(year, 1, 1).toordinal()) & (self.dato <= datetime.date(year, 12, 31).toordinal())
+
+    def in_afdeling(self, afdeling: str) -> np.ndarray:
+        idx = _AFDELING_INDEX.get(afdeling)
+        if idx is None:
+            return np.zeros(self.size, dtype=bool)
+        return self.afdeling == idx
+
+    def in_sites(self, site_set) -> np.ndarray:
+        if not site_set:
+            return np.zeros(self.size, dtype=bool)
+        return np.isin(self.loknr, np.fromiter(site_set, dtype=np.int64, count=len(site_set)))
+
+    def until(self, end_date: datetime.date) -> np.ndarray:
+        return (self.dato > 0) & (self.dato <= end_date.toordinal())
+
+    def in_bounds(self, start: int, end: int) -> np.ndarray:
+        """Rækker med dato-ordinal i [start, end]."""
+        return (self.dato >= start) & (self.dato <= end)
+
+    def period_selection(
+        self,
+        tagged: np.ndarray,
+        periods: MatrikelPeriods,
+        start_date: datetime.date,
+        end_date: datetime.date,
+        reference_date: Optional[datetime.date] = None,
+    ) -> Dict[str, np.ndarray]:
+        """Aktiv periode og historik (alle perioder) som masker over de taggede rækker."""
+        if not periods:
+            return {"active": tagged, "historical": tagged}
+        historical = tagged & periods.mask(self.dato)
+        active_period = periods.active(start_date, end_date, reference_date=reference_date)
+        if not active_period:
+            return {"active": np.zeros(self.size, dtype=bool), "historical": historical}
+        return {"active": tagged & self.in_bounds(*periods.bounds(active_period)), "historical": historical}
+
+    # --- beregninger ----------------------------------------------------
+    @staticmethod
+    def _group_first(keys: np.ndarray, *tiebreak: np.ndarray) -> np.ndarray:
+        """Indeks (i keys) for første element pr. gruppe efter sortering på (keys, *tiebreak)."""
+        order = np.lexsort(tuple(reversed(tiebreak)) + (keys,))
+        sorted_keys = keys[order]
+        starts = np.ones(len(order), dtype=bool)
+        starts[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        return order[starts]
+
+    def firsts(self, mask: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Samme resultat som _firsts_from_obs: første dato pr. art (casefold),
+        ved samme dato den første række med obsid, sorteret efter dato og
+        derefter artens første forekomst.
+        """
+        return self.firsts_many({None: mask})[None]
+
+    def _sorted_rows(self) -> np.ndarray:
+        """Gyldige rækker sorteret efter (art, dato, uden obsid sidst, række) – beregnes én gang."""
+        if self._sorted is None:
+            rows = np.flatnonzero(self.valid)
+            self._sorted = rows[np.lexsort((rows, ~self.has_obsid[rows], self.dato[rows], self.species_id[rows]))]
+        return self._sorted
+
+    def firsts_many(self, scopes: Dict[Any, Optional[np.ndarray]]) -> Dict[Any, List[Dict[str, Any]]]:
+        """
+        firsts for mange udvalg (nøgle -> maske, None = alle). Brugerens rækker
+        sorteres én gang; hvert udvalg er derefter et lineært filter af den
+        rækkefølge, hvor første række pr. art er vinderen. En række der er first
+        i flere udvalg formateres én gang, og dict'en deles mellem listerne.
+        """
+        ordered = self._sorted_rows()
+        entries: Dict[int, Dict[str, Any]] = {}
+        result: Dict[Any, List[Dict[str, Any]]] = {}
+        for key, mask in scopes.items():
+            rows = ordered if mask is None else ordered[mask[ordered]]
+            out = result[key] = []
+            if rows.size == 0:
+                continue
+            species = self.species_id[rows]
+            starts = np.flatnonzero(np.concatenate(([True], species[1:] != species[:-1])))
+            winners = rows[starts]
+            first_seen = np.minimum.reduceat(rows, starts)
+            for w in winners[np.lexsort((first_seen, self.dato[winners]))].tolist():
+                entry = entries.get(w)
+                if entry is None:
+                    entry = entries[w] = {
+                        "artnavn": safe_output(self.names[self.name_id[w]]),
+                        "lokalitet": safe_output(self.loknavn[w] or ""),
+                        "dato": datetime.date.fromordinal(int(self.dato[w])).strftime("%d-%m-%Y"),
+                        "obsid": safe_output(self.obsid[w] or "") or self._fallback_obsid(w),
+                    }
+                out.append(entry)
+        return result
+
+    def _fallback_obsid(self, row: int) -> str:
+        """
+        obsid til en first uden obsid: en anden af brugerens rækker samme dag og
+        art med obsid, helst på samme lokalitet. Opslaget bygges første gang.
+        """
+        if self._obsid_lookup is None:
+            exact: Dict[Tuple[int, int, str], str] = {}
+            by_art: Dict[Tuple[int, int], str] = {}
+            for i in range(self.size):
+                obsid = safe_output(self.obsid[i] or "")
+                if not obsid or not self.dato[i]:
+                    continue
+                day, art = int(self.dato[i]), int(self.species_id[i])
+                exact.setdefault((day, art, safe_output(self.loknavn[i] or "").strip().casefold()), obsid)
+                by_art.setdefault((day, art), obsid)
+            self._obsid_lookup = (exact, by_art)
+        exact, by_art = self._obsid_lookup
+        day, art = int(self.dato[row]), int(self.species_id[row])
+        lok = safe_output(self.loknavn[row] or "").strip().casefold()
+        return exact.get((day, art, lok)) or by_art.get((day, art)) or ""
+
+    def count_species(self, mask: Optional[np.ndarray] = None) -> int:
+        rows = self.valid if mask is None else (mask & self.valid)
+        return int(np.unique(self.species_id[rows]).size)
+
+    def score(self, mask: Optional[np.ndarray] = None) -> Tuple[int, str, str]:
+        """
+        (antal arter, seneste nye art, dens dato) pr. navn (ikke casefold),
+        som scoreboards beregner det; ved samme dato vinder navnet set først.
+        """
+        rows = np.flatnonzero(self.valid if mask is None else (mask & self.valid))
+        if rows.size == 0:
+            return 0, "", ""
+        names = self.name_id[rows]
+        first_dates = self.dato[rows[self._group_first(names, self.dato[rows])]]
+        first_seen = rows[self._group_first(names, rows)]
+        tied = first_dates == first_dates.max()
+        latest = first_seen[tied].argmin()
+        return (
+            int(first_dates.size),
+            self.names[self.name_id[first_seen[tied][latest]]],
+            datetime.date.fromordinal(int(first_dates[tied][latest])).strftime("%d-%m-%Y"),
+        )
+
 # ---------------------------------------------------------
 #  First lists (individuelle)
 # ---------------------------------------------------------
 def _firsts_from_obs(obs_iter: List[Observation], excluded_keys: Optional[set] = None) -> List[Dict[str, Any]]:
-    firsts: Dict[str, Dict[str, Any]] = {}
-    blocked = excluded_keys if excluded_keys is not None else _get_excluded_species_keys()
-    for o in obs_iter:
-        navn = _normalize_base_art_name(o.artnavn)
-        if "sp." in navn or "/" in navn or " x " in navn:
-            continue
-        if navn.casefold() in blocked:
-            continue
-        key = navn.casefold()
-        has_obsid = bool(str(o.obsid or "").strip())
-        existing = firsts.get(key)
-        should_replace = (
-            existing is None
-            or o.dato < existing["dato"]
-            or (
-                o.dato == existing["dato"]
-                and not str(existing.get("obsid") or "").strip()
-                and has_obsid
-            )
-        )
-        if should_replace:
-            firsts[key] = {
-                "artnavn": safe_output(navn),
-                "lokalitet": safe_output(o.loknavn or ""),
-                "dato": o.dato,
-                "obsid": safe_output(o.obsid or "")
-            }
-    return sorted(
-        (
-            {
-                "artnavn": v["artnavn"],
-                "lokalitet": v["lokalitet"],
-                "dato": v["dato"].strftime("%d-%m-%Y"),
-                "obsid": v.get("obsid", "")
-            }
-            for v in firsts.values()
-        ),
-        key=lambda x: datetime.datetime.strptime(x["dato"], "%d-%m-%Y"),
-    )
+    """Firsts for en vilkårlig række-liste (visninger); samme regler som ObsColumns.firsts."""
+    return ObsColumns(list(obs_iter), excluded_keys=excluded_keys).firsts()
 
 async def _user_matrikel_view_payload(
     obserkode: str,
@@ -823,41 +1643,32 @@ async def _user_matrikel_view_payload(
 
     async with SessionLocal() as session:
         user = (await session.execute(select(User).where(User.obserkode == obserkode))).scalar_one_or_none()
-        all_obs_query = select(Observation).where(
-            Observation.obserkode == obserkode,
-            Observation.dato <= today,
-        )
-        all_obs_rows = (await session.execute(all_obs_query)).scalars().all()
-        obs_query = select(Observation).where(Observation.obserkode == obserkode)
+        available_matrikler = await load_matrikel_indexes(session, obserkode, raw_filter, until=today)
+        obs_filters = [Observation.obserkode == obserkode]
         if not is_global:
-            obs_query = obs_query.where(
+            obs_filters += [
                 Observation.dato >= range_start,
                 Observation.dato <= visible_end,
-            )
-        obs_rows = (await session.execute(obs_query)).scalars().all()
+            ]
+        obs_rows = await load_obs_records(session, *obs_filters)
+        tag_index = await load_user_tag_index(session, obserkode)
 
-    available_matrikler = _collect_matrikel_indexes_from_observations(all_obs_rows, raw_filter)
     if not available_matrikler:
         available_matrikler = [1]
 
     tagged_rows = [
         row for row in obs_rows
-        if _observation_has_matrikel_tag(row, raw_filter, matrikel_index)
+        if _observation_has_matrikel_tag(row, raw_filter, matrikel_index, tag_index)
     ]
     if is_global:
         tagged_rows = [row for row in tagged_rows if row.dato and row.dato <= today]
 
-    period_map = _load_user_matrikel_periods(user)
-    period_key = _matrikel_key(matrikel_index)
-    periods = period_map.get(period_key) or []
-    period_options = [
-        period for period in periods
-        if _period_overlaps_range(period, range_start, visible_end)
-    ]
-    period_options.sort(key=lambda period: period.get("start_date") or "")
+    periods = compiled_matrikel_periods(user).get(_matrikel_key(matrikel_index), _NO_PERIODS)
+    options = periods.overlapping(range_start, visible_end)
+    period_options = options.periods
 
     reference_date = _reference_date_for_range(range_start, visible_end)
-    active_period = _select_active_period(period_options, range_start, visible_end, reference_date=reference_date) if period_options else None
+    active_period = options.active(range_start, visible_end, reference_date=reference_date)
 
     selected_period = None
     if selected_period_name:
@@ -866,7 +1677,8 @@ async def _user_matrikel_view_payload(
         selected_period = active_period
 
     if selected_period:
-        selected_rows = [row for row in tagged_rows if _period_matches_date(selected_period, row.dato)]
+        first_day, last_day = options.bounds(selected_period)
+        selected_rows = [row for row in tagged_rows if row.dato and first_day <= row.dato.toordinal() <= last_day]
     else:
         selected_rows = tagged_rows
 
@@ -904,21 +1716,22 @@ async def _user_kommune_view_payload(
     raw_filter = await get_global_filter()
     excluded_keys = _get_excluded_species_keys()
 
-    query = select(Observation).where(
+    obs_filters = [
         Observation.obserkode == obserkode,
         Observation.dato <= today,
-    )
+    ]
     if not is_global:
         year_value = int(aar_value)
         start_date = datetime.date(year_value, 1, 1)
         end_date = min(datetime.date(year_value, 12, 31), today)
-        query = query.where(
+        obs_filters += [
             Observation.dato >= start_date,
             Observation.dato <= end_date,
-        )
+        ]
 
     async with SessionLocal() as session:
-        obs_rows = (await session.execute(query)).scalars().all()
+        obs_rows = await load_obs_records(session, *obs_filters)
+        tag_index = await load_user_tag_index(session, obserkode) if matrikel_only else None
         site_numbers = (await session.execute(
             select(Lokation.site_number).where(Lokation.kommune_id == int(kommune_id))
         )).scalars().all()
@@ -936,94 +1749,14 @@ async def _user_kommune_view_payload(
     if matrikel_only:
         selected_rows = [
             row for row in selected_rows
-            if _observation_has_matrikel_tag(row, raw_filter, 1)
+            if _observation_has_matrikel_tag(row, raw_filter, 1, tag_index)
         ]
 
     return {
         "firsts": _firsts_from_obs(selected_rows, excluded_keys=excluded_keys)
     }
 
-async def generate_user_lists(obserkode: str, aar: int):
-    obserkode = normalize_obserkode(obserkode)
-    _, _, OBSER_DIR = get_data_dirs(aar)
-    safe_makedirs(OBSER_DIR)
-    user_dir = get_user_dir(aar, obserkode)
-    safe_makedirs(user_dir)
-
-    async with SessionLocal() as session:
-        q = select(Observation).where(
-            Observation.obserkode == obserkode,
-            Observation.dato >= datetime.date(aar, 1, 1),
-            Observation.dato <= datetime.date(aar, 12, 31),
-        )
-        obs = (await session.execute(q)).scalars().all()
-        filt = await get_global_filter()
-        user = (await session.execute(select(User).where(User.obserkode == obserkode))).scalar_one_or_none()
-    tags = resolve_matrikel_tags(filt, aar)
-    matrikel1_tags = [tags["matrikel1"], f"{tags['matrikel1']}-1"] if tags["matrikel1"] else []
-    matrikel2_tags = [tags["matrikel2"]] if tags["matrikel2"] else []
-    user_periods = _load_user_matrikel_periods(user)
-    year_start = datetime.date(aar, 1, 1)
-    year_end = datetime.date(aar, 12, 31)
-    year_reference_date = _reference_date_for_range(year_start, year_end)
-    excluded_keys = _get_excluded_species_keys()
-
-    # Global (alle)
-    global_list = _firsts_from_obs(obs, excluded_keys=excluded_keys)
-    with open(os.path.join(user_dir, "global.json"), "w", encoding="utf-8") as f:
-        json.dump(global_list, f, ensure_ascii=False, indent=2)
-    print(f"[LISTS] {obserkode}/{aar}: global.json ({len(global_list)} arter)")
-
-    # Matrikel 1 (aktiv periode)
-    m1_obs = _matrikel_obs_for_range(
-        obs_rows=obs,
-        tags=matrikel1_tags,
-        periods=user_periods.get("matrikel1") or [],
-        start_date=year_start,
-        end_date=year_end,
-        reference_date=year_reference_date,
-    )
-    matrikel_list = _firsts_from_obs(m1_obs["active"], excluded_keys=excluded_keys)
-    with open(os.path.join(user_dir, "matrikelarter.json"), "w", encoding="utf-8") as f:
-        json.dump(matrikel_list, f, ensure_ascii=False, indent=2)
-    matrikel_historik = _firsts_from_obs(m1_obs["historical"], excluded_keys=excluded_keys)
-    with open(os.path.join(user_dir, "matrikelarter_historik.json"), "w", encoding="utf-8") as f:
-        json.dump(matrikel_historik, f, ensure_ascii=False, indent=2)
-    print(f"[LISTS] {obserkode}/{aar}: matrikelarter.json ({len(matrikel_list)} arter, filter='{','.join(matrikel1_tags)}')")
-
-    # Matrikel 2 (aktiv periode, privat)
-    m2_obs = _matrikel_obs_for_range(
-        obs_rows=obs,
-        tags=matrikel2_tags,
-        periods=user_periods.get("matrikel2") or [],
-        start_date=year_start,
-        end_date=year_end,
-        reference_date=year_reference_date,
-    )
-    matrikel2_list = _firsts_from_obs(m2_obs["active"], excluded_keys=excluded_keys)
-    with open(os.path.join(user_dir, "matrikel2arter.json"), "w", encoding="utf-8") as f:
-        json.dump(matrikel2_list, f, ensure_ascii=False, indent=2)
-    matrikel2_historik = _firsts_from_obs(m2_obs["historical"], excluded_keys=excluded_keys)
-    with open(os.path.join(user_dir, "matrikel2arter_historik.json"), "w", encoding="utf-8") as f:
-        json.dump(matrikel2_historik, f, ensure_ascii=False, indent=2)
-    print(f"[LISTS] {obserkode}/{aar}: matrikel2arter.json ({len(matrikel2_list)} arter, filter='{tags['matrikel2']}')")
-
-    # Lokalafdeling – alle afdelinger
-    la_dict: Dict[str, Dict[str, Any]] = {}
-    for afd in AFDELINGER:
-        la_obs = [o for o in obs if (o.afdeling or "").strip() == afd]
-        la_dict[afd] = {
-            "alle": _firsts_from_obs(la_obs, excluded_keys=excluded_keys),
-            "matrikel": _firsts_from_obs([
-                o for o in la_obs
-                if o in m1_obs["active"]
-            ], excluded_keys=excluded_keys),
-        }
-    with open(os.path.join(user_dir, "lokalafdeling.json"), "w", encoding="utf-8") as f:
-        json.dump(la_dict, f, ensure_ascii=False, indent=2)
-    print(f"[LISTS] {obserkode}/{aar}: lokalafdeling.json for {len(AFDELINGER)} afdelinger")
-
-    # Kommune – kun brugerens hjemme-kommune
+def _resolve_user_kommune(user: Optional[User]) -> Tuple[Optional[int], Optional[str]]:
     kommune_id = None
     kommune_navn = None
     if user and getattr(user, "kommune", None):
@@ -1037,158 +1770,419 @@ async def generate_user_lists(obserkode: str, aar: int):
                 if row.get("navn") == value:
                     kommune_id = _parse_int(row.get("id"))
                     break
+    return kommune_id, kommune_navn
 
-    kommune_alle = []
-    kommune_matrikel = []
-    if kommune_id:
-        async with SessionLocal() as session:
-            site_numbers = (await session.execute(
-                select(Lokation.site_number).where(Lokation.kommune_id == kommune_id)
-            )).scalars().all()
-        if not site_numbers and kommune_navn:
-            site_numbers = _load_kommune_sites_from_file(kommune_navn)
-        site_set = set(_parse_int(x) for x in site_numbers if _parse_int(x) is not None)
-        if site_set:
-            k_obs = [o for o in obs if o.loknr in site_set]
-            kommune_alle = _firsts_from_obs(k_obs, excluded_keys=excluded_keys)
-            if tags["matrikel1"]:
-                kommune_matrikel = _firsts_from_obs([o for o in k_obs if o in m1_obs["active"]], excluded_keys=excluded_keys)
-
-    kommune_payload = {
-        "kommune_id": str(kommune_id) if kommune_id else None,
-        "kommune_navn": kommune_navn,
-        "alle": kommune_alle,
-        "matrikel": kommune_matrikel,
-    }
-    with open(os.path.join(user_dir, "kommune.json"), "w", encoding="utf-8") as f:
-        json.dump(kommune_payload, f, ensure_ascii=False, indent=2)
-    print(f"[LISTS] {obserkode}/{aar}: kommune.json")
+async def _kommune_site_set(kommune_id: Optional[int], kommune_navn: Optional[str]) -> set:
+    if not kommune_id:
+        return set()
+    async with SessionLocal() as session:
+        site_numbers = (await session.execute(
+            select(Lokation.site_number).where(Lokation.kommune_id == kommune_id)
+        )).scalars().all()
+    if not site_numbers and kommune_navn:
+        site_numbers = _load_kommune_sites_from_file(kommune_navn)
+    return set(_parse_int(x) for x in site_numbers if _parse_int(x) is not None)
 
-async def generate_user_global_lists(obserkode: str):
-    obserkode = normalize_obserkode(obserkode)
-    user_dir = get_global_user_dir(obserkode)
-    safe_makedirs(user_dir)
+def _write_list_file(user_dir: str, filename: str, payload: Any):
+    with open(os.path.join(user_dir, filename), "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
 
-    async with SessionLocal() as session:
-        q = select(Observation).where(Observation.obserkode == obserkode)
-        obs = (await session.execute(q)).scalars().all()
-        filt = await get_global_filter()
-        user = (await session.execute(select(User).where(User.obserkode == obserkode))).scalar_one_or_none()
-    user_periods = _load_user_matrikel_periods(user)
-    excluded_keys = _get_excluded_species_keys()
+def user_list_payloads(
+    cols: ObsColumns,
+    m1: Dict[str, np.ndarray],
+    m2: Dict[str, np.ndarray],
+    kommune_mask: Optional[np.ndarray],
+    kommune_matrikel: bool,
+) -> Dict[str, Any]:
+    """
+    Alle brugerens lister (global, matrikel 1/2 aktiv+historik, lokalafdelinger
+    og kommune) beregnet i ét firsts_many-gennemløb. Returnerer filnavn -> payload
+    (kommune.json uden kommune-felterne).
+    """
+    scopes: Dict[Any, Optional[np.ndarray]] = {
+        "global.json": None,
+        "matrikelarter.json": m1["active"],
+        "matrikelarter_historik.json": m1["historical"],
+        "matrikel2arter.json": m2["active"],
+        "matrikel2arter_historik.json": m2["historical"],
+    }
+    for afd in AFDELINGER:
+        in_afd = cols.in_afdeling(afd)
+        scopes[(afd, "alle")] = in_afd
+        scopes[(afd, "matrikel")] = in_afd & m1["active"]
+    if kommune_mask is not None:
+        scopes["kommune_alle"] = kommune_mask
+        if kommune_matrikel:
+            scopes["kommune_matrikel"] = kommune_mask & m1["active"]
+
+    lists = cols.firsts_many(scopes)
+    payloads: Dict[str, Any] = {
+        name: lists[name]
+        for name in ("global.json", "matrikelarter.json", "matrikelarter_historik.json",
+                     "matrikel2arter.json", "matrikel2arter_historik.json")
+    }
+    payloads["lokalafdeling.json"] = {
+        afd: {"alle": lists[(afd, "alle")], "matrikel": lists[(afd, "matrikel")]}
+        for afd in AFDELINGER
+    }
+    payloads["kommune.json"] = {
+        "alle": lists.get("kommune_alle", []),
+        "matrikel": lists.get("kommune_matrikel", []),
+    }
+    return payloads
+
+def _write_user_list_payloads(
+    user_dir: str,
+    label: str,
+    payloads: Dict[str, Any],
+    kommune_id: Optional[int],
+    kommune_navn: Optional[str],
+    matrikel1_filter: str,
+    matrikel2_filter: str,
+):
+    for name in ("global.json", "matrikelarter.json", "matrikelarter_historik.json",
+                 "matrikel2arter.json", "matrikel2arter_historik.json", "lokalafdeling.json"):
+        _write_list_file(user_dir, name, payloads[name])
+    _write_list_file(user_dir, "kommune.json", {
+        "kommune_id": str(kommune_id) if kommune_id else None,
+        "kommune_navn": kommune_navn,
+        **payloads["kommune.json"],
+    })
+    print(
+        f"[LISTS] {label}: global {len(payloads['global.json'])}, "
+        f"matrikel {len(payloads['matrikelarter.json'])} (filter='{matrikel1_filter}'), "
+        f"matrikel2 {len(payloads['matrikel2arter.json'])} (filter='{matrikel2_filter}'), "
+        f"{len(AFDELINGER)} afdelinger, kommune {len(payloads['kommune.json']['alle'])} arter"
+    )
 
-    # Global (alle)
-    global_list = _firsts_from_obs(obs, excluded_keys=excluded_keys)
-    with open(os.path.join(user_dir, "global.json"), "w", encoding="utf-8") as f:
-        json.dump(global_list, f, ensure_ascii=False, indent=2)
-    print(f"[LISTS] {obserkode}/global: global.json ({len(global_list)} arter)")
+def build_user_year_lists(
+    user_dir: str,
+    obserkode: str,
+    aar: int,
+    obs: List[ObsRecord],
+    filt: str,
+    user_periods: Dict[str, MatrikelPeriods],
+    excluded_keys: set,
+    kommune_id: Optional[int],
+    kommune_navn: Optional[str],
+    site_set: set,
+    tag_index: Optional[Dict[str, frozenset]] = None,
+):
+    """Beregner og skriver brugerens årslister. Ren funktion – køres i CPU-puljen."""
+    tags = resolve_matrikel_tags(filt, aar)
+    matrikel1_tags = [tags["matrikel1"], f"{tags['matrikel1']}-1"] if tags["matrikel1"] else []
+    year_start = datetime.date(aar, 1, 1)
+    year_end = datetime.date(aar, 12, 31)
+    year_reference_date = _reference_date_for_range(year_start, year_end)
+    # Alle rækker ligger i `aar`, så rækkens egne matrikel-tags er årets tags
+    cols = ObsColumns(obs, filt, excluded_keys, tag_index)
+
+    m1 = cols.period_selection(
+        cols.tagged(TAG_MATRIKEL1),
+        user_periods.get("matrikel1", _NO_PERIODS),
+        year_start,
+        year_end,
+        reference_date=year_reference_date,
+    )
+    m2 = cols.period_selection(
+        cols.tagged(TAG_MATRIKEL2),
+        user_periods.get("matrikel2", _NO_PERIODS),
+        year_start,
+        year_end,
+        reference_date=year_reference_date,
+    )
+    kommune_mask = cols.in_sites(site_set) if kommune_id and site_set else None
+    payloads = user_list_payloads(cols, m1, m2, kommune_mask, kommune_matrikel=bool(tags["matrikel1"]))
+    _write_user_list_payloads(
+        user_dir, f"{obserkode}/{aar}", payloads, kommune_id, kommune_navn,
+        ",".join(matrikel1_tags), tags["matrikel2"],
+    )
 
-    # Matrikel 1 (aktiv periode, all-time)
+def build_user_global_lists(
+    user_dir: str,
+    obserkode: str,
+    obs: List[ObsRecord],
+    filt: str,
+    user_periods: Dict[str, MatrikelPeriods],
+    excluded_keys: set,
+    kommune_id: Optional[int],
+    kommune_navn: Optional[str],
+    site_set: set,
+    tag_index: Optional[Dict[str, frozenset]] = None,
+):
+    """Beregner og skriver brugerens all-time lister. Ren funktion – køres i CPU-puljen."""
+    cols = ObsColumns(obs, filt, excluded_keys, tag_index)
     all_start = datetime.date.min
     all_end = datetime.date.max
     all_reference_date = datetime.date.today()
-    tagged_m1 = [row for row in obs if _observation_has_matrikel_tag(row, filt, 1)]
-    m1_obs = _apply_period_selection(
-        tagged_rows=tagged_m1,
-        periods=user_periods.get("matrikel1") or [],
-        start_date=all_start,
-        end_date=all_end,
+
+    m1 = cols.period_selection(
+        cols.tagged(TAG_MATRIKEL1),
+        user_periods.get("matrikel1", _NO_PERIODS),
+        all_start,
+        all_end,
         reference_date=all_reference_date,
     )
-    matrikel_list = _firsts_from_obs(m1_obs["active"], excluded_keys=excluded_keys)
-    with open(os.path.join(user_dir, "matrikelarter.json"), "w", encoding="utf-8") as f:
-        json.dump(matrikel_list, f, ensure_ascii=False, indent=2)
-    matrikel_historik = _firsts_from_obs(m1_obs["historical"], excluded_keys=excluded_keys)
-    with open(os.path.join(user_dir, "matrikelarter_historik.json"), "w", encoding="utf-8") as f:
-        json.dump(matrikel_historik, f, ensure_ascii=False, indent=2)
-    print(f"[LISTS] {obserkode}/global: matrikelarter.json ({len(matrikel_list)} arter, filter='{filt}')")
-
-    # Matrikel 2 (aktiv periode, privat all-time)
-    tagged_m2 = [row for row in obs if _observation_has_matrikel_tag(row, filt, 2)]
-    m2_obs = _apply_period_selection(
-        tagged_rows=tagged_m2,
-        periods=user_periods.get("matrikel2") or [],
-        start_date=all_start,
-        end_date=all_end,
+    m2 = cols.period_selection(
+        cols.tagged(TAG_MATRIKEL2),
+        user_periods.get("matrikel2", _NO_PERIODS),
+        all_start,
+        all_end,
         reference_date=all_reference_date,
     )
-    matrikel2_list = _firsts_from_obs(m2_obs["active"], excluded_keys=excluded_keys)
-    with open(os.path.join(user_dir, "matrikel2arter.json"), "w", encoding="utf-8") as f:
-        json.dump(matrikel2_list, f, ensure_ascii=False, indent=2)
-    matrikel2_historik = _firsts_from_obs(m2_obs["historical"], excluded_keys=excluded_keys)
-    with open(os.path.join(user_dir, "matrikel2arter_historik.json"), "w", encoding="utf-8") as f:
-        json.dump(matrikel2_historik, f, ensure_ascii=False, indent=2)
-    print(f"[LISTS] {obserkode}/global: matrikel2arter.json ({len(matrikel2_list)} arter, filter='{filt}-2')")
-
-    # Lokalafdeling – alle afdelinger (all-time)
-    la_dict: Dict[str, Dict[str, Any]] = {}
-    for afdeling in AFDELINGER:
-        la_obs = [o for o in obs if (o.afdeling or "").strip() == afdeling]
-        la_dict[afdeling] = {
-            "alle": _firsts_from_obs(la_obs, excluded_keys=excluded_keys),
-            "matrikel": _firsts_from_obs([
-                o for o in la_obs
-                if o in m1_obs["active"]
-            ], excluded_keys=excluded_keys),
-        }
-    with open(os.path.join(user_dir, "lokalafdeling.json"), "w", encoding="utf-8") as f:
-        json.dump(la_dict, f, ensure_ascii=False, indent=2)
-    print(f"[LISTS] {obserkode}/global: lokalafdeling.json")
+    kommune_mask = cols.in_sites(site_set) if kommune_id and site_set else None
+    payloads = user_list_payloads(cols, m1, m2, kommune_mask, kommune_matrikel=bool(filt))
+    _write_user_list_payloads(
+        user_dir, f"{obserkode}/global", payloads, kommune_id, kommune_navn,
+        filt, f"{filt}-2",
+    )
 
-    # Kommune – kun brugerens hjemme-kommune
-    kommune_id = None
-    kommune_navn = None
-    if user and getattr(user, "kommune", None):
-        value = str(user.kommune).strip()
-        if value.isdigit():
-            kommune_id = int(value)
-            kommune_navn = _kommune_name_by_id(value)
-        else:
-            kommune_navn = value
-            for row in _read_kommuner():
-                if row.get("navn") == value:
-                    kommune_id = _parse_int(row.get("id"))
-                    break
+def build_user_all_lists(
+    obserkode: str,
+    year_dirs: Dict[int, str],
+    global_dir: Optional[str],
+    obs: List[ObsRecord],
+    filt: str,
+    user_periods: Dict[str, MatrikelPeriods],
+    excluded_keys: set,
+    kommune_id: Optional[int],
+    kommune_navn: Optional[str],
+    site_set: set,
+    tag_index: Optional[Dict[str, frozenset]] = None,
+):
+    """
+    Alle brugerens lister ud fra ét sæt rækker: rækkerne fordeles på år i
+    hukommelsen og hvert års mappe i year_dirs skrives, derefter global_dir
+    hvis den er givet. Ren funktion – køres i CPU-puljen.
+    """
+    by_year: Dict[int, List[ObsRecord]] = {aar: [] for aar in year_dirs}
+    for rec in obs:
+        if rec.dato and rec.dato.year in by_year:
+            by_year[rec.dato.year].append(rec)
+    for aar, user_dir in sorted(year_dirs.items()):
+        build_user_year_lists(
+            user_dir, obserkode, aar, by_year[aar], filt, user_periods, excluded_keys,
+            kommune_id, kommune_navn, site_set, tag_index,
+        )
+    if global_dir:
+        build_user_global_lists(
+            global_dir, obserkode, obs, filt, user_periods, excluded_keys,
+            kommune_id, kommune_navn, site_set, tag_index,
+        )
 
-    kommune_alle = []
-    kommune_matrikel = []
-    if kommune_id:
-        async with SessionLocal() as session:
-            site_numbers = (await session.execute(
-                select(Lokation.site_number).where(Lokation.kommune_id == kommune_id)
+# ---------------------------------------------------------
+#  Fingerprint af brugerlister (spring uændrede over)
+# ---------------------------------------------------------
+# Bump når listernes indhold/format ændres, så alle lister bygges igen
+LIST_FINGERPRINT_VERSION = "2"
+LIST_FINGERPRINT_ENABLED = os.environ.get("LIST_FINGERPRINT_ENABLED", "1").strip() not in ("0", "false", "no")
+LIST_FINGERPRINT_FILE = ".fingerprint"
+
+def _list_fingerprint_base(
+    obserkode: str,
+    filt: str,
+    excluded_keys,
+    user_periods: Dict[str, MatrikelPeriods],
+    kommune_id: Optional[int],
+    kommune_navn: Optional[str],
+    site_set: set,
+):
+    """sha1 over det der er fælles for alle brugerens lister; kopieres pr. liste."""
+    digest = hashlib.sha1()
+    periods = {key: value.periods for key, value in sorted(user_periods.items())}
+    digest.update(f"v{LIST_FINGERPRINT_VERSION}\x1e{obserkode}\x1e{filt or ''}\x1e".encode("utf-8"))
+    digest.update("|".join(sorted(excluded_keys)).encode("utf-8"))
+    digest.update(f"\x1e{json.dumps(periods, sort_keys=True)}\x1e{kommune_id}\x1e{kommune_navn or ''}\x1e".encode("utf-8"))
+    digest.update(",".join(str(site) for site in sorted(site_set or ())).encode("utf-8"))
+    return digest
+
+def _list_fingerprint(
+    base,
+    scope: str,
+    data_tokens: List[Tuple[int, str]],
+    user_periods: Dict[str, MatrikelPeriods],
+    start_date: datetime.date,
+    end_date: datetime.date,
+    reference_date: datetime.date,
+) -> str:
+    """
+    Fingerprint for én liste-mappe: fælles input, data-tokens for de år listen
+    dækker og de aktive perioder på referencedatoen (skifter med tiden).
+    """
+    digest = base.copy()
+    digest.update(f"\x1e{scope}\x1e".encode("utf-8"))
+    digest.update(";".join(f"{year}:{token}" for year, token in data_tokens).encode("utf-8"))
+    for key, periods in sorted(user_periods.items()):
+        active = periods.active(start_date, end_date, reference_date=reference_date)
+        digest.update(f"\x1e{key}={json.dumps(active, sort_keys=True)}".encode("utf-8"))
+    return digest.hexdigest()
+
+def _read_list_fingerprint(user_dir: str) -> Optional[str]:
+    try:
+        with open(os.path.join(user_dir, LIST_FINGERPRINT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def _write_list_fingerprint(user_dir: str, fingerprint: Optional[str]):
+    path = os.path.join(user_dir, LIST_FINGERPRINT_FILE)
+    if fingerprint is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(fingerprint)
+
+async def generate_user_all_lists(obserkode: str, years=None, include_global: bool = True) -> Dict[str, Any]:
+    """
+    Bygger brugerens årslister for `years` (None = alle år med data) og
+    all-time hvis include_global – med én observationsforespørgsel, én
+    læsning af filter/bruger/tag-indeks og ét kald til CPU-puljen.
+    Lister hvis fingerprint er uændret springes over; er alle uændrede,
+    læses observationerne slet ikke. Returnerer {"requested": ønskede år,
+    "years": byggede år, "dirs": byggede mapper, "unchanged": antal
+    oversprungne lister, "skipped": True hvis intet blev bygget}.
+    """
+    obserkode = normalize_obserkode(obserkode)
+    if years is not None:
+        years = sorted({int(aar) for aar in years})
+        if not years and not include_global:
+            return {"requested": [], "years": [], "dirs": [], "unchanged": 0, "skipped": True}
+
+    async with SessionLocal() as session:
+        filt = await get_global_filter()
+        user = (await session.execute(select(User).where(User.obserkode == obserkode))).scalar_one_or_none()
+        data_versions = await load_observation_data_versions(session, obserkode)
+        if years is None:
+            year_values = (await session.execute(
+                select(func.extract("year", Observation.dato)).where(Observation.obserkode == obserkode).distinct()
             )).scalars().all()
-        if not site_numbers and kommune_navn:
-            site_numbers = _load_kommune_sites_from_file(kommune_navn)
-        site_set = set(_parse_int(x) for x in site_numbers if _parse_int(x) is not None)
-        if site_set:
-            k_obs = [o for o in obs if o.loknr in site_set]
-            kommune_alle = _firsts_from_obs(k_obs, excluded_keys=excluded_keys)
-            if filt:
-                kommune_matrikel = _firsts_from_obs([o for o in k_obs if o in m1_obs["active"]], excluded_keys=excluded_keys)
-
-    kommune_payload = {
-        "kommune_id": str(kommune_id) if kommune_id else None,
-        "kommune_navn": kommune_navn,
-        "alle": kommune_alle,
-        "matrikel": kommune_matrikel,
+            years = sorted(int(y) for y in year_values if y is not None)
+    kommune_id, kommune_navn = _resolve_user_kommune(user)
+    site_set = await _kommune_site_set(kommune_id, kommune_navn)
+    user_periods = compiled_matrikel_periods(user)
+    excluded_keys = _get_excluded_species_keys()
+
+    # Fingerprint pr. mappe; kun mapper hvor det afviger bygges
+    base = _list_fingerprint_base(obserkode, filt, excluded_keys, user_periods, kommune_id, kommune_navn, site_set)
+    fingerprints: Dict[str, str] = {}
+    year_dirs: Dict[int, str] = {}
+    for aar in years:
+        year_start, year_end = datetime.date(aar, 1, 1), datetime.date(aar, 12, 31)
+        user_dir = get_user_dir(aar, obserkode)
+        fingerprint = _list_fingerprint(
+            base, str(aar), [(aar, data_versions.get(aar, ""))], user_periods,
+            year_start, year_end, _reference_date_for_range(year_start, year_end),
+        )
+        if not LIST_FINGERPRINT_ENABLED or _read_list_fingerprint(user_dir) != fingerprint:
+            year_dirs[aar] = user_dir
+            fingerprints[user_dir] = fingerprint
+    global_dir = None
+    if include_global:
+        user_dir = get_global_user_dir(obserkode)
+        fingerprint = _list_fingerprint(
+            base, "global", sorted(data_versions.items()), user_periods,
+            datetime.date.min, datetime.date.max, datetime.date.today(),
+        )
+        if not LIST_FINGERPRINT_ENABLED or _read_list_fingerprint(user_dir) != fingerprint:
+            global_dir = user_dir
+            fingerprints[user_dir] = fingerprint
+    unchanged = len(years) + int(include_global) - len(fingerprints)
+    result = {
+        "requested": years, "years": sorted(year_dirs), "dirs": list(fingerprints),
+        "unchanged": unchanged, "skipped": not fingerprints,
     }
-    with open(os.path.join(user_dir, "kommune.json"), "w", encoding="utf-8") as f:
-        json.dump(kommune_payload, f, ensure_ascii=False, indent=2)
-    print(f"[LISTS] {obserkode}/global: kommune.json")
+    if not fingerprints:
+        print(f"[LISTS] {obserkode}: {unchanged} lister uændrede (fingerprint) – springer over")
+        return result
+
+    filters = [Observation.obserkode == obserkode]
+    if global_dir is None:
+        filters += [
+            Observation.dato >= datetime.date(min(year_dirs), 1, 1),
+            Observation.dato <= datetime.date(max(year_dirs), 12, 31),
+        ]
+    async with SessionLocal() as session:
+        obs = await load_obs_records(session, *filters)
+        tag_index = await load_user_tag_index(session, obserkode)
+
+    # Fjern gamle fingerprints først, så en afbrudt skrivning altid bygges igen
+    for user_dir in fingerprints:
+        safe_makedirs(user_dir)
+        _write_list_fingerprint(user_dir, None)
+
+    await run_in_cpu_pool(
+        build_user_all_lists, obserkode, year_dirs, global_dir, obs, filt,
+        user_periods, excluded_keys, kommune_id, kommune_navn, site_set, tag_index,
+    )
+    for user_dir, fingerprint in fingerprints.items():
+        _write_list_fingerprint(user_dir, fingerprint)
+    if unchanged:
+        print(f"[LISTS] {obserkode}: {unchanged} lister uændrede (fingerprint)")
+    return result
+
+def _lists_version_marker() -> str:
+    return os.path.join(SERVER_DIR, "data", ".lists_version")
+
+async def backfill_user_lists() -> Dict[str, Any]:
+    """
+    Genopbygger alle brugeres lister med forældet fingerprint (med
+    scoreboards) – efter bump af LIST_FINGERPRINT_VERSION og når filter eller
+    udelukkede arter ændres – og noterer versionen i data/.lists_version.
+    """
+    async with SessionLocal() as session:
+        koder = [
+            kode for kode in (await session.execute(select(User.obserkode))).scalars().all()
+            if SAFE_OBSERKODE_RE.fullmatch((kode or "").strip().upper())
+        ]
+    result = await rebuild_after_ingest({kode: "user" for kode in koder}, label="LIST BACKFILL")
+    safe_makedirs(os.path.dirname(_lists_version_marker()))
+    with open(_lists_version_marker(), "w", encoding="utf-8") as f:
+        f.write(LIST_FINGERPRINT_VERSION)
+    return result
+
+async def list_settings_token() -> str:
+    """Token over de globale indstillinger der styrer alle lister (filter, udelukkede arter)."""
+    filter_ = await get_global_filter()
+    excluded = sorted(_get_excluded_species_keys())
+    return hashlib.sha1(f"{filter_ or ''}\x1e{'|'.join(excluded)}".encode("utf-8")).hexdigest()
+
+async def enqueue_lists_rebuild_if_changed(before: str):
+    """Lægger et lists_backfill-job i kø hvis filter eller udelukkede arter er ændret siden `before`."""
+    if await list_settings_token() != before:
+        await enqueue_job("lists_backfill")
+
+async def generate_user_lists(obserkode: str, aar: int):
+    await generate_user_all_lists(obserkode, [aar], include_global=False)
+
+async def generate_user_global_lists(obserkode: str):
+    await generate_user_all_lists(obserkode, [], include_global=True)
 
 
 _prefs_scoreboard_rebuild_lock = asyncio.Lock()
 
 
 async def _rebuild_scoreboards_after_optin_change(obserkode: str):
-    try:
-        safe_obserkode = normalize_obserkode(obserkode)
-    except ValueError:
+    await _rebuild_scoreboards_after_optin_changes([obserkode])
+
+
+async def _rebuild_scoreboards_after_optin_changes(obserkoder: List[str]):
+    """Genopbyg scoreboards for alle berørte år én gang, uanset hvor mange brugere der har ændret opt-in."""
+    safe_koder: List[str] = []
+    for obserkode in obserkoder:
+        try:
+            safe_koder.append(normalize_obserkode(obserkode))
+        except ValueError:
+            continue
+    safe_koder = sorted(set(safe_koder))
+    if not safe_koder:
         return
 
     async with _prefs_scoreboard_rebuild_lock:
         try:
-            years = await get_available_years_for_user(safe_obserkode)
+            years = []
+            for safe_obserkode in safe_koder:
+                years.extend(await get_available_years_for_user(safe_obserkode))
             if not years:
                 current_year = await get_global_year()
                 years = [current_year]
@@ -1206,11 +2200,12 @@ async def _rebuild_scoreboards_after_optin_change(obserkode: str):
             for year in years:
                 await generate_scoreboards_from_lists(year)
 
-            await generate_user_global_lists(safe_obserkode)
+            for safe_obserkode in safe_koder:
+                await generate_user_global_lists(safe_obserkode)
             await generate_global_scoreboards_all_time()
-            print(f"[PREFS] Scoreboards genopbygget for {safe_obserkode}: years={years} + global")
+            print(f"[PREFS] Scoreboards genopbygget for {', '.join(safe_koder)}: years={years} + global")
         except Exception as error:
-            print(f"[PREFS] Kunne ikke genopbygge scoreboards for {safe_obserkode}: {error}")
+            print(f"[PREFS] Kunne ikke genopbygge scoreboards for {', '.join(safe_koder)}: {error}")
 
 # ---------------------------------------------------------
 #  Artsdata
@@ -1431,17 +2426,9 @@ async def generate_scoreboards_from_lists(aar: int):
     """
     import datetime
     import shutil
-    excluded_keys = _get_excluded_species_keys()
+    species = species_dictionary()
 
     # --- Hjælpere ---
-    def _normalize_art(name: str) -> str:
-        return (name or "").split("(")[0].split(",")[0].strip()
-
-    def _is_valid_art(name: str) -> bool:
-        n = _normalize_base_art_name(name)
-        if n.casefold() in excluded_keys:
-            return False
-        return ("sp." not in n) and ("/" not in n) and (" x " not in n)
 
     def _parse_dato(d: str) -> datetime.datetime:
         try:
@@ -1458,11 +2445,17 @@ async def generate_scoreboards_from_lists(aar: int):
         if not isinstance(list_rows, list) or not list_rows:
             return 0, "", ""
 
-        cleaned = [r for r in list_rows if r.get("artnavn") and _is_valid_art(r["artnavn"])]
+        cleaned = []
+        unique_arter = set()
+        for r in list_rows:
+            if not r.get("artnavn"):
+                continue
+            sid = species.intern(r["artnavn"])
+            if species.counts(sid):
+                cleaned.append(r)
+                unique_arter.add(species.name_id[sid])
         if not cleaned:
             return 0, "", ""
-
-        unique_arter = {_normalize_art(r["artnavn"]) for r in cleaned}
         antal_arter = len(unique_arter)
 
         latest = max(cleaned, key=lambda r: _parse_dato(r.get("dato")))
@@ -1597,30 +2590,6 @@ async def generate_kommune_scoreboards(aar: int, users: List[User]):
         opted_ids = _user_opted_kommuner(user)
         return str(kommune_id) in opted_ids
 
-    def _is_valid_art(name: str) -> bool:
-        n = _normalize_base_art_name(name)
-        if n.casefold() in excluded_keys:
-            return False
-        return ("sp." not in n) and ("/" not in n) and (" x " not in n)
-
-    def _firsts_from_obs_rows(obs_rows, filter_tag: Optional[str] = None):
-        firsts = {}
-        for row in obs_rows:
-            if filter_tag and filter_tag not in (row.turnoter or ""):
-                continue
-            navn = (row.artnavn or "").split("(")[0].split(",")[0].strip()
-            if not _is_valid_art(navn) or not row.dato:
-                continue
-            if navn not in firsts or row.dato < firsts[navn]["dato"]:
-                firsts[navn] = {"dato": row.dato, "artnavn": navn}
-        return firsts
-
-    def _score_from_firsts(firsts):
-        if not firsts:
-            return 0, "", ""
-        latest = max(firsts.values(), key=lambda r: r["dato"])
-        return len(firsts), latest.get("artnavn", ""), latest["dato"].strftime("%d-%m-%Y")
-
     def _safe_clear_dir(path: str):
         if os.path.isdir(path):
             shutil.rmtree(path, ignore_errors=True)
@@ -1636,92 +2605,133 @@ async def generate_kommune_scoreboards(aar: int, users: List[User]):
     _safe_clear_dir(outdir_kommune_alle)
     _safe_clear_dir(outdir_kommune_matr)
 
-    user_codes = {u.obserkode for u in users if u.obserkode}
-
     async with SessionLocal() as session:
         lok_rows = (await session.execute(
             select(Lokation.kommune_id, Lokation.site_number)
         )).all()
-        obs_rows = (await session.execute(
-            select(Observation).where(
-                Observation.dato >= year_start,
-                Observation.dato <= year_end,
-            )
-        )).scalars().all()
+        records_by_user = await load_obs_records_by_user(
+            session,
+            Observation.dato >= year_start,
+            Observation.dato <= year_end,
+        )
+        tag_index = await load_tag_index(session, [u.obserkode for u in users if u.obserkode])
 
-        obs_by_user = defaultdict(list)
-        for obs in obs_rows:
-            kode = obs.obserkode or ""
-            if kode in user_codes:
-                obs_by_user[kode].append(obs)
+    # Ét kolonnelager pr. bruger; kommunerne er derefter kun masker over det
+    columns_by_user = {
+        u.obserkode: ObsColumns(
+            records_by_user.get(u.obserkode, []) if u.obserkode else [],
+            raw_filter, excluded_keys, tag_index.get(u.obserkode),
+        )
+        for u in users
+    }
+    matrikel_by_user = {kode: cols.tagged(TAG_MATRIKEL1) for kode, cols in columns_by_user.items()}
 
-        kommune_sites = defaultdict(set)
-        for kommune_id, site_number in lok_rows:
-            if kommune_id is None or site_number is None:
-                continue
-            kommune_sites[int(kommune_id)].add(int(site_number))
+    kommune_sites = defaultdict(set)
+    for kommune_id, site_number in lok_rows:
+        if kommune_id is None or site_number is None:
+            continue
+        kommune_sites[int(kommune_id)].add(int(site_number))
 
-        for kommune in kommuner:
-            kommune_id = _parse_int(kommune.get("id"))
-            if kommune_id is None:
+    for kommune in kommuner:
+        kommune_id = _parse_int(kommune.get("id"))
+        if kommune_id is None:
+            continue
+        kommune_name = kommune.get("navn") or str(kommune_id)
+        site_numbers = kommune_sites.get(kommune_id) or set()
+        if not site_numbers:
+            site_numbers = set(_load_kommune_sites_from_file(kommune_name))
+
+        rows_alle = []
+        rows_matr = []
+        for u in users:
+            if not _user_in_kommune(u, kommune_id):
                 continue
-            kommune_name = kommune.get("navn") or str(kommune_id)
-            site_numbers = kommune_sites.get(kommune_id) or set()
-            if not site_numbers:
-                site_numbers = set(_load_kommune_sites_from_file(kommune_name))
-
-            rows_alle = []
-            rows_matr = []
-            for u in users:
-                user_obs = obs_by_user.get(u.obserkode, [])
-                kommune_obs = [o for o in user_obs if _parse_int(o.loknr) in site_numbers]
-
-                is_opted = _user_in_kommune(u, kommune_id)
-                if is_opted:
-                    firsts_all = _firsts_from_obs_rows(kommune_obs)
-                    a_all, art_all, dato_all = _score_from_firsts(firsts_all)
-                    rows_alle.append({
-                        "navn": safe_output(u.navn or u.obserkode),
-                        "obserkode": u.obserkode,
-                        "antal_arter": a_all,
-                        "sidste_art": safe_output(art_all),
-                        "sidste_dato": safe_output(dato_all),
-                    })
-
-                if is_opted:
-                    tagged_matrikel_obs = [
-                        row for row in kommune_obs
-                        if _observation_has_matrikel_tag(row, raw_filter, 1)
-                    ]
-                    firsts_m = _firsts_from_obs_rows(tagged_matrikel_obs)
-                    a_m, art_m, dato_m = _score_from_firsts(firsts_m)
-                    rows_matr.append({
-                        "navn": safe_output(u.navn or u.obserkode),
-                        "obserkode": u.obserkode,
-                        "antal_arter": a_m,
-                        "sidste_art": safe_output(art_m),
-                        "sidste_dato": safe_output(dato_m),
-                    })
+            cols = columns_by_user[u.obserkode]
+            in_kommune = cols.in_sites(site_numbers)
+
+            a_all, art_all, dato_all = cols.score(in_kommune)
+            rows_alle.append({
+                "navn": safe_output(u.navn or u.obserkode),
+                "obserkode": u.obserkode,
+                "antal_arter": a_all,
+                "sidste_art": safe_output(art_all),
+                "sidste_dato": safe_output(dato_all),
+            })
+
+            a_m, art_m, dato_m = cols.score(in_kommune & matrikel_by_user[u.obserkode])
+            rows_matr.append({
+                "navn": safe_output(u.navn or u.obserkode),
+                "obserkode": u.obserkode,
+                "antal_arter": a_m,
+                "sidste_art": safe_output(art_m),
+                "sidste_dato": safe_output(dato_m),
+            })
+
+        filename = f"{_kommune_slug(kommune_name)}.json"
+        with open(os.path.join(outdir_kommune_alle, filename), "w", encoding="utf-8") as f:
+            json.dump(_finalize(_ensure_scoreboard_fields(rows_alle)), f, ensure_ascii=False, indent=2)
+        with open(os.path.join(outdir_kommune_matr, filename), "w", encoding="utf-8") as f:
+            json.dump(_finalize(_ensure_scoreboard_fields(rows_matr)), f, ensure_ascii=False, indent=2)
 
-            filename = f"{_kommune_slug(kommune_name)}.json"
-            with open(os.path.join(outdir_kommune_alle, filename), "w", encoding="utf-8") as f:
-                json.dump(_finalize(_ensure_scoreboard_fields(rows_alle)), f, ensure_ascii=False, indent=2)
-            with open(os.path.join(outdir_kommune_matr, filename), "w", encoding="utf-8") as f:
-                json.dump(_finalize(_ensure_scoreboard_fields(rows_matr)), f, ensure_ascii=False, indent=2)
 
+@contextlib.asynccontextmanager
+async def cross_process_lock(name: str, pg_key: int, poll_seconds: float = 0.5):
+    """
+    Lås på tværs af uvicorn-workers: pg_advisory_lock på PostgreSQL, ellers
+    en fcntl-fillås i data/ (fælles for alle workers på samme maskine).
+    """
+    if engine.dialect.name == "postgresql":
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": pg_key})
+            try:
+                yield
+            finally:
+                await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": pg_key})
+        return
+    if fcntl is None:
+        yield
+        return
+    lock_dir = os.path.join(SERVER_DIR, "data")
+    safe_makedirs(lock_dir)
+    with open(os.path.join(lock_dir, f".{name}.lock"), "a+") as handle:
+        # Ikke-blokerende forsøg i en løkke, så en annulleret task aldrig efterlader låsen taget
+        while True:
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(poll_seconds)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+# Højst én all-time rebuild ad gangen – i processen via asyncio.Lock og på tværs
+# af workers via cross_process_lock, da hver rebuild rydder og genskriver
+# data/global/scoreboards. Kald der kommer mens en rebuild kører, venter og
+# dækkes af én samlet opfølgende kørsel ("dirty igen").
+ALL_TIME_REBUILD_LOCK_KEY = 0x5342_414C
+_all_time_rebuild_lock = asyncio.Lock()
+_all_time_rebuild_requested = 0
+_all_time_rebuild_completed = 0
 
 async def generate_global_scoreboards_all_time():
+    global _all_time_rebuild_requested, _all_time_rebuild_completed
+    _all_time_rebuild_requested += 1
+    request_id = _all_time_rebuild_requested
+    async with _all_time_rebuild_lock:
+        if _all_time_rebuild_completed >= request_id:
+            print("[SB-ALL] Rebuild allerede dækket af en nyere kørsel – springer over")
+            return
+        covered = _all_time_rebuild_requested
+        async with cross_process_lock("all_time_rebuild", ALL_TIME_REBUILD_LOCK_KEY):
+            await _build_global_scoreboards_all_time()
+        _all_time_rebuild_completed = covered
+
+async def _build_global_scoreboards_all_time():
     import shutil
     excluded_keys = _get_excluded_species_keys()
-
-    def _normalize_art(name: str) -> str:
-        return (name or "").split("(")[0].split(",")[0].strip()
-
-    def _is_valid_art(name: str) -> bool:
-        n = _normalize_base_art_name(name)
-        if n.casefold() in excluded_keys:
-            return False
-        return ("sp." not in n) and ("/" not in n) and (" x " not in n)
+    species = species_dictionary(excluded_keys)
 
     def _parse_dato(d: str) -> datetime.datetime:
         try:
@@ -1733,11 +2743,17 @@ async def generate_global_scoreboards_all_time():
         if not isinstance(list_rows, list) or not list_rows:
             return 0, "", ""
 
-        cleaned = [r for r in list_rows if r.get("artnavn") and _is_valid_art(r["artnavn"])]
+        cleaned = []
+        unique_arter = set()
+        for r in list_rows:
+            if not r.get("artnavn"):
+                continue
+            sid = species.intern(r["artnavn"])
+            if species.counts(sid):
+                cleaned.append(r)
+                unique_arter.add(species.name_id[sid])
         if not cleaned:
             return 0, "", ""
-
-        unique_arter = {_normalize_art(r["artnavn"]) for r in cleaned}
         antal_arter = len(unique_arter)
 
         latest = max(cleaned, key=lambda r: _parse_dato(r.get("dato")))
@@ -1846,39 +2862,24 @@ async def generate_global_scoreboards_all_time():
 
     # Kommune (all-time)
     raw_filter = await get_global_filter()
-    obs_by_user = defaultdict(list)
     async with SessionLocal() as session:
-        all_obs_rows = (await session.execute(select(Observation))).scalars().all()
-    user_codes = {u.obserkode for u in users if u.obserkode}
-    for row in all_obs_rows:
-        kode = row.obserkode or ""
-        if kode in user_codes:
-            obs_by_user[kode].append(row)
+        records_by_user = await load_obs_records_by_user(session)
+        tag_index = await load_tag_index(session)
+        lok_rows = (await session.execute(select(Lokation.kommune_id, Lokation.site_number))).all()
+
+    columns_by_user = {
+        u.obserkode: ObsColumns(records_by_user.get(u.obserkode, []), raw_filter, excluded_keys, tag_index.get(u.obserkode))
+        for u in users
+    }
+    del records_by_user, tag_index
+    matrikel_by_user = {kode: cols.tagged(TAG_MATRIKEL1) for kode, cols in columns_by_user.items()}
 
     kommune_site_map = {}
-    async with SessionLocal() as session:
-        lok_rows = (await session.execute(select(Lokation.kommune_id, Lokation.site_number))).all()
     for kommune_id_value, site_number in lok_rows:
         if kommune_id_value is None or site_number is None:
             continue
         kommune_site_map.setdefault(int(kommune_id_value), set()).add(int(site_number))
 
-    def _firsts_from_obs_rows_global(obs_rows):
-        firsts = {}
-        for row in obs_rows:
-            navn = (row.artnavn or "").split("(")[0].split(",")[0].strip()
-            if not _is_valid_art(navn) or not row.dato:
-                continue
-            if navn not in firsts or row.dato < firsts[navn]["dato"]:
-                firsts[navn] = {"dato": row.dato, "artnavn": navn}
-        return firsts
-
-    def _score_from_firsts_global(firsts):
-        if not firsts:
-            return 0, "", ""
-        latest = max(firsts.values(), key=lambda r: r["dato"])
-        return len(firsts), latest.get("artnavn", ""), latest["dato"].strftime("%d-%m-%Y")
-
     kommuner = _read_kommuner()
     for kommune in kommuner:
         kommune_id = _parse_int(kommune.get("id"))
@@ -1889,36 +2890,28 @@ async def generate_global_scoreboards_all_time():
         rows_alle = []
         rows_matr = []
         for u in users:
-            user_obs = obs_by_user.get(u.obserkode, [])
-            kommune_obs = [row for row in user_obs if _parse_int(row.loknr) in site_set]
-
-            opted_kommuner = _user_opted_kommuner(u)
-            is_opted = str(kommune_id) in opted_kommuner
-            if is_opted:
-                firsts_all = _firsts_from_obs_rows_global(kommune_obs)
-                a1, art1, dato1 = _score_from_firsts_global(firsts_all)
-                rows_alle.append({
-                    "navn": u.navn or u.obserkode,
-                    "obserkode": u.obserkode,
-                    "antal_arter": a1,
-                    "sidste_art": art1,
-                    "sidste_dato": dato1,
-                })
+            if str(kommune_id) not in _user_opted_kommuner(u):
+                continue
+            cols = columns_by_user[u.obserkode]
+            in_kommune = cols.in_sites(site_set)
 
-            if is_opted:
-                tagged_matrikel_obs = [
-                    row for row in kommune_obs
-                    if _observation_has_matrikel_tag(row, raw_filter, 1)
-                ]
-                firsts_m = _firsts_from_obs_rows_global(tagged_matrikel_obs)
-                a2, art2, dato2 = _score_from_firsts_global(firsts_m)
-                rows_matr.append({
-                    "navn": u.navn or u.obserkode,
-                    "obserkode": u.obserkode,
-                    "antal_arter": a2,
-                    "sidste_art": art2,
-                    "sidste_dato": dato2,
-                })
+            a1, art1, dato1 = cols.score(in_kommune)
+            rows_alle.append({
+                "navn": u.navn or u.obserkode,
+                "obserkode": u.obserkode,
+                "antal_arter": a1,
+                "sidste_art": art1,
+                "sidste_dato": dato1,
+            })
+
+            a2, art2, dato2 = cols.score(in_kommune & matrikel_by_user[u.obserkode])
+            rows_matr.append({
+                "navn": u.navn or u.obserkode,
+                "obserkode": u.obserkode,
+                "antal_arter": a2,
+                "sidste_art": art2,
+                "sidste_dato": dato2,
+            })
 
         filename = f"{_kommune_slug(kommune_name)}.json"
         with open(os.path.join(outdir_kommune_alle, filename), "w", encoding="utf-8") as f:
@@ -1930,200 +2923,1302 @@ async def generate_global_scoreboards_all_time():
 # ---------------------------------------------------------
 #  DOFbasen sync (CSV -> DB -> lister -> scoreboards)
 # ---------------------------------------------------------
+def _dof_export_url(obserkode: str, aar_first: int, aar_second: int) -> str:
+    return (
+        f"{DOFBASEN_URL}/excel/search_result1.php"
+        "?design=excel&soeg=soeg&periode=maanedaar"
+        f"&aar_first={aar_first}&aar_second={aar_second}"
+        "&obstype=observationer&species=alle"
+        f"&obserdata={obserkode}&sortering=dato"
+    )
 
-async def fetch_and_store(
+OBSERVATION_RECORD_FIELDS = (
+    "obserkode", "artnavn", "antal", "dato", "turid", "obsid",
+    "turtidfra", "turtidtil", "turnoter", "afdeling", "loknavn", "loknr",
+)
+
+def _text_column(df: pd.DataFrame, name: str) -> pd.Series:
+    if name not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    return df[name].fillna("").astype(str)
+
+def normalize_observation_frame(
+    df: Optional[pd.DataFrame],
     obserkode: str,
-    aar: Optional[int] = None,
-    include_global_rebuild: bool = True,
-):
+    start_date: Optional[datetime.date] = None,
+    end_date: Optional[datetime.date] = None,
+) -> List[Dict[str, Any]]:
     """
-    Henter observationer fra DOFbasen (CSV), indsætter ALLE rækker i DB for det angivne år,
-    og bygger derefter per-bruger lister + scoreboards for det år.
+    Kolonnevis normalisering af en DOFbasen-eksport til rene records (dicts med
+    Observation-kolonner), klar til bulk-insert. Rækker uden gyldig dato,
+    med Antal 0/tom eller uden for [start_date, end_date] springes over.
     """
-    import io
-    import datetime
-    import pandas as pd
-    import requests
+    if df is None or df.empty:
+        return []
 
-    obserkode = normalize_obserkode(obserkode)
+    # Dato: første 10 tegn, YYYY-MM-DD eller DD-MM-YYYY
+    raw_dato = _text_column(df, "Dato").str.strip().str.slice(0, 10)
+    dato = pd.to_datetime(raw_dato, format="%Y-%m-%d", errors="coerce")
+    missing = dato.isna()
+    if missing.any():
+        dato = dato.fillna(pd.to_datetime(raw_dato.where(missing, ""), format="%d-%m-%Y", errors="coerce"))
+
+    antal = pd.to_numeric(_text_column(df, "Antal").str.strip(), errors="coerce")
+    antal = antal.where(np.isfinite(antal), 0).fillna(0)
+    antal = np.trunc(antal).astype("int64")
+
+    keep = dato.notna() & (antal != 0)
+    if start_date is not None:
+        keep &= dato >= pd.Timestamp(start_date)
+    if end_date is not None:
+        keep &= dato <= pd.Timestamp(end_date)
+    if not keep.any():
+        return []
 
-    if aar is None:
-        aar = await get_global_year()
-    filter_ = await get_global_filter()
-    filter_tag = resolve_filter_tag(filter_, aar)
+    df = df.loc[keep]
+    dato = dato.loc[keep]
+    antal = antal.loc[keep]
+
+    koder = _text_column(df, "Obserkode").str.strip().str.upper()
+    koder = koder.where(koder.str.fullmatch(SAFE_OBSERKODE_RE), obserkode)
+
+    turnoter = _text_column(df, "Turnoter").str.strip()
+    fuglenoter = _text_column(df, "Fuglnoter").str.strip()
+    both = (turnoter != "") & (fuglenoter != "")
+    noter = turnoter.where(turnoter != "", fuglenoter)
+    noter = noter.where(~both, turnoter + " " + fuglenoter)
+
+    loknr = pd.to_numeric(_text_column(df, "Loknr").str.strip(), errors="coerce")
+    loknr_valid = np.isfinite(loknr)
+    loknr = pd.Series(np.trunc(loknr.where(loknr_valid, 0)).astype("int64"), index=df.index).astype(object).where(loknr_valid, None)
+
+    columns = {
+        "obserkode": koder.tolist(),
+        "artnavn": _text_column(df, "Artnavn").tolist(),
+        "antal": antal.tolist(),
+        "dato": dato.dt.date.tolist(),
+        "turid": _text_column(df, "Turid").tolist(),
+        "obsid": _text_column(df, "Obsid").tolist() if "Obsid" in df.columns else [None] * len(df),
+        "turtidfra": _text_column(df, "Turtidfra").tolist(),
+        "turtidtil": _text_column(df, "Turtidtil").tolist(),
+        "turnoter": noter.tolist(),
+        "afdeling": _text_column(df, "DOF_afdeling").tolist(),
+        "loknavn": _text_column(df, "Loknavn").tolist(),
+        "loknr": loknr.tolist(),
+    }
+    return [
+        dict(zip(OBSERVATION_RECORD_FIELDS, values))
+        for values in zip(*(columns[name] for name in OBSERVATION_RECORD_FIELDS))
+    ]
 
-    url = (
-        "https://dofbasen.dk/excel/search_result1.php"
-        "?design=excel&soeg=soeg&periode=maanedaar"
-        f"&aar_first={aar}&aar_second={aar}"
-        "&obstype=observationer&species=alle"
-        f"&obserdata={obserkode}&sortering=dato"
+OBSERVATION_BULK_BATCH_SIZE = max(1, int(os.environ.get("OBSERVATION_BULK_BATCH_SIZE", "25000")))
+
+OBSERVATION_WRITE_FIELDS = OBSERVATION_RECORD_FIELDS + ("sync_key", "row_hash")
+
+async def _bulk_insert_observation_batch(session: AsyncSession, records: List[Dict[str, Any]]) -> str:
+    conn = await session.connection()
+    if conn.dialect.name == "postgresql" and conn.dialect.driver == "asyncpg":
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            Observation.__tablename__,
+            records=[tuple(rec.get(name) for name in OBSERVATION_WRITE_FIELDS) for rec in records],
+            columns=list(OBSERVATION_WRITE_FIELDS),
+        )
+        return "copy"
+    await session.execute(
+        insert(Observation.__table__),
+        [{name: rec.get(name) for name in OBSERVATION_WRITE_FIELDS} for rec in records],
     )
-    df = None
-    try:
-        resp = requests.get(url, timeout=30)
-        resp.raise_for_status()
-        df = pd.read_csv(io.StringIO(resp.content.decode("latin1")), sep=";", dtype=str)
-        print(f"[INFO] Hentet {len(df)} rækker fra DOFbasen for {obserkode} ({aar})")
-    except Exception as e:
-        print(f"[WARN] HTTP-fejl ({e}) – prøver lokal CSV fallback...")
+    return "executemany"
 
-    # 3) Lokal fallback (valgfri)
-    if df is None or df.empty:
-        candidates = [
-            os.path.join(ROOT_DIR, "search_result (3).csv"),
-            os.path.join(SERVER_DIR, "search_result (3).csv"),
-        ]
-        for p in candidates:
-            if os.path.exists(p):
-                try:
-                    df = pd.read_csv(p, sep=";", dtype=str, encoding="latin1")
-                    print(f"[INFO] Lokal CSV: {len(df)} rækker fra {p}")
-                    break
-                except Exception as e:
-                    print(f"[ERROR] Kunne ikke parse {p}: {e}")
+async def bulk_insert_observations(
+    session: AsyncSession,
+    records: List[Dict[str, Any]],
+    label: str = "",
+    commit: bool = True,
+) -> Dict[str, Any]:
+    """
+    Skriver normaliserede records til observations uden ORM-objekter:
+    asyncpg COPY på Postgres, ellers Core insert() som executemany.
+    Committer pr. batch (medmindre commit=False) og logger rækker/s.
+    """
+    started = time.perf_counter()
+    method = "none"
+    for offset in range(0, len(records), OBSERVATION_BULK_BATCH_SIZE):
+        method = await _bulk_insert_observation_batch(session, records[offset:offset + OBSERVATION_BULK_BATCH_SIZE])
+        if commit:
+            await session.commit()
+    elapsed = time.perf_counter() - started
+    rate = len(records) / elapsed if elapsed > 0 else 0.0
+    if records:
+        print(f"[BULK] {label}: {len(records)} rækker på {elapsed:.2f}s ({rate:,.0f} rækker/s, {method})")
+    return {"rows": len(records), "seconds": elapsed, "rows_per_second": rate, "method": method}
 
-    # 4) Ingen data -> skriv tomme lister og scoreboards for det valgte år
-    if df is None or df.empty:
-        print(f"[ERROR] Ingen data til {obserkode}/{aar}. Skriver tomme lister.")
-        await generate_user_lists(obserkode, aar)
-        await generate_scoreboards_from_lists(aar)
-        if include_global_rebuild:
-            await generate_user_global_lists(obserkode)
-            await generate_global_scoreboards_all_time()
+# "diff": upsert pr. sync_key og slet kun forsvundne rækker; "replace": slet scope og indsæt alt
+OBSERVATION_SYNC_MODE = os.environ.get("OBSERVATION_SYNC_MODE", "diff").strip().lower()
+_SYNC_KEY_FIELDS = ("turid", "dato", "artnavn", "antal", "loknr", "turtidfra", "turtidtil", "turnoter")
+
+def _record_digest(rec: Dict[str, Any], fields) -> str:
+    payload = "\x1f".join("" if rec.get(name) is None else str(rec.get(name)) for name in fields)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def compute_observation_row_keys(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Sætter grundnøgle (sync_key uden løbenummer), row_hash og hashtags (til
+    observation_tags). Ren funktion, så den kan køres i CPU-puljen sammen med
+    normaliseringen.
+    """
+    for rec in records:
+        obsid = str(rec.get("obsid") or "").strip()
+        rec["sync_key"] = f"o:{obsid}" if obsid else f"h:{_record_digest(rec, _SYNC_KEY_FIELDS)}"
+        rec["row_hash"] = _record_digest(rec, OBSERVATION_RECORD_FIELDS)
+        rec["hashtags"] = tuple(sorted(_note_hashtags(rec.get("turnoter"))))
+    return records
+
+def assign_observation_sync_keys(
+    records: List[Dict[str, Any]],
+    seen: Optional[Dict[str, int]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Sætter sync_key og row_hash på records. Nøglen er obsid når det findes,
+    ellers et hash af turens/rækkens indhold. Dubletter får et løbenummer
+    (seen deles mellem chunks af samme eksport). Records der allerede har
+    row_hash (fra compute_observation_row_keys) får kun løbenummeret.
+    """
+    if seen is None:
+        seen = {}
+    for rec in records:
+        if "row_hash" not in rec:
+            compute_observation_row_keys([rec])
+        key = rec["sync_key"]
+        count = seen.get(key, 0)
+        seen[key] = count + 1
+        if count:
+            rec["sync_key"] = f"{key}#{count + 1}"
+    return records
+
+def _observation_scope_filters(obserkode: str, start_date: Optional[datetime.date], end_date: Optional[datetime.date]):
+    filters = [Observation.obserkode == obserkode]
+    if start_date is not None:
+        filters.append(Observation.dato >= start_date)
+    if end_date is not None:
+        filters.append(Observation.dato <= end_date)
+    return filters
+
+async def _delete_observation_ids(session: AsyncSession, ids: List[int]):
+    for offset in range(0, len(ids), 5000):
+        chunk = ids[offset:offset + 5000]
+        await session.execute(Observation.__table__.delete().where(Observation.id.in_(chunk)))
+
+async def _update_observation_rows(session: AsyncSession, rows: List[Dict[str, Any]]):
+    if not rows:
         return
+    stmt = update(Observation.__table__).where(Observation.__table__.c.id == bindparam("_id"))
+    for offset in range(0, len(rows), OBSERVATION_BULK_BATCH_SIZE):
+        await session.execute(stmt, rows[offset:offset + OBSERVATION_BULK_BATCH_SIZE])
 
-    # 5) (INFO) Vis hvad admin-filter ville give—men ANVEND DET IKKE på CSV -> DB
-    if filter_tag:
-        try:
-            before = len(df)
-            after = len(df[df["Turnoter"].fillna("").str.contains(filter_tag)])
-            print(f"[INFO] (info) Filter '{filter_tag}': {before} -> {after} rækker (for {obserkode}) [ikke anvendt til DB]")
-        except Exception:
-            pass
+# ---------------------------------------------------------
+#  Tag-indeks (observation_tags)
+# ---------------------------------------------------------
+# Bump når tokeniseringen ændres – så genindekseres alle brugere af tag_reindex-jobbet
+TAG_INDEX_VERSION = 1
+
+def _observation_tag_rows(obserkode: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    rows = []
+    for rec in records:
+        tags = rec.get("hashtags")
+        if tags is None:
+            tags = _note_hashtags(rec.get("turnoter"))
+        for tag in tags:
+            rows.append({"obserkode": obserkode, "sync_key": rec["sync_key"], "dato": rec.get("dato"), "tag": tag})
+    return rows
+
+async def _insert_observation_tags(session: AsyncSession, obserkode: str, records: List[Dict[str, Any]]) -> int:
+    rows = _observation_tag_rows(obserkode, records)
+    for offset in range(0, len(rows), OBSERVATION_BULK_BATCH_SIZE):
+        await session.execute(insert(ObservationTag.__table__), rows[offset:offset + OBSERVATION_BULK_BATCH_SIZE])
+    return len(rows)
+
+async def _delete_observation_tags(session: AsyncSession, obserkode: str, sync_keys: List[str]):
+    for offset in range(0, len(sync_keys), 5000):
+        await session.execute(ObservationTag.__table__.delete().where(
+            ObservationTag.obserkode == obserkode,
+            ObservationTag.sync_key.in_(sync_keys[offset:offset + 5000]),
+        ))
+
+async def _tag_index_ready(session: AsyncSession, obserkode: str) -> bool:
+    version = (await session.execute(
+        select(ObservationTagState.version).where(ObservationTagState.obserkode == obserkode)
+    )).scalar_one_or_none()
+    return version == TAG_INDEX_VERSION
+
+async def reindex_observation_tags(session: AsyncSession, obserkode: str) -> int:
+    """
+    Genopbygger brugerens tag-indeks fra turnoter og markerer det komplet.
+    Committer ikke – kører i kalderens transaktion.
+    """
+    await session.execute(ObservationTag.__table__.delete().where(ObservationTag.obserkode == obserkode))
+    rows = (await session.execute(
+        select(Observation.sync_key, Observation.dato, Observation.turnoter).where(
+            Observation.obserkode == obserkode,
+            Observation.sync_key.is_not(None),
+            Observation.turnoter.like("%#%"),
+        )
+    )).all()
+    count = await _insert_observation_tags(session, obserkode, [
+        {"sync_key": sync_key, "dato": dato, "turnoter": turnoter}
+        for sync_key, dato, turnoter in rows
+    ])
+    state = await session.get(ObservationTagState, obserkode)
+    if state is None:
+        session.add(ObservationTagState(obserkode=obserkode, version=TAG_INDEX_VERSION, indexed_at=_now_iso()))
+    else:
+        state.version = TAG_INDEX_VERSION
+        state.indexed_at = _now_iso()
+    return count
 
-    # 6) Indsæt ALLE rækker i DB for det valgte år (rydder ALT for brugeren for det år) - batch-inserts
-    BATCH_SIZE = 25000
-    start_date = datetime.date(aar, 1, 1)
-    end_date = datetime.date(aar, 12, 31)
+async def load_tag_index(session: AsyncSession, koder: Optional[List[str]] = None) -> Dict[str, Dict[str, frozenset]]:
+    """
+    sync_key -> hashtags pr. bruger, kun for brugere med komplet indeks (andre
+    mangler i resultatet og falder tilbage til turnoter). koder=None: alle.
+    """
+    ready_query = select(ObservationTagState.obserkode).where(ObservationTagState.version == TAG_INDEX_VERSION)
+    if koder is not None:
+        ready_query = ready_query.where(ObservationTagState.obserkode.in_(list(koder)))
+    ready = set((await session.execute(ready_query)).scalars().all())
+    index: Dict[str, Dict[str, frozenset]] = {kode: {} for kode in ready}
+    if not ready:
+        return index
+
+    tag_query = select(ObservationTag.obserkode, ObservationTag.sync_key, ObservationTag.tag)
+    if koder is not None:
+        tag_query = tag_query.where(ObservationTag.obserkode.in_(list(ready)))
+    grouped: Dict[Tuple[str, str], set] = defaultdict(set)
+    for kode, sync_key, tag in (await session.execute(tag_query)).all():
+        if kode in ready:
+            grouped[(kode, sync_key)].add(tag)
+    interned: Dict[frozenset, frozenset] = {}
+    for (kode, sync_key), tags in grouped.items():
+        frozen = frozenset(tags)
+        index[kode][sync_key] = interned.setdefault(frozen, frozen)
+    return index
+
+async def load_user_tag_index(session: AsyncSession, obserkode: str) -> Optional[Dict[str, frozenset]]:
+    return (await load_tag_index(session, [obserkode])).get(obserkode)
+
+async def load_matrikel_indexes(
+    session: AsyncSession,
+    obserkode: str,
+    raw_filter: str,
+    until: Optional[datetime.date] = None,
+) -> List[int]:
+    """Matrikel-numre brugeren har tags for – indekseret opslag når tag-indekset er komplet."""
+    if not await _tag_index_ready(session, obserkode):
+        query = select(Observation.dato, Observation.turnoter).where(Observation.obserkode == obserkode)
+        if until is not None:
+            query = query.where(Observation.dato <= until)
+        return _collect_matrikel_indexes_from_observations((await session.execute(query)).all(), raw_filter)
+
+    query = select(ObservationTag.dato, ObservationTag.tag).where(
+        ObservationTag.obserkode == obserkode,
+        ObservationTag.dato.is_not(None),
+    )
+    if until is not None:
+        query = query.where(ObservationTag.dato <= until)
+    by_year: Dict[int, set] = defaultdict(set)
+    for dato, tag in (await session.execute(query.distinct())).all():
+        by_year[dato.year].add(tag)
+    return _matrikel_indexes_from_tokens(by_year.items(), raw_filter)
+
+async def reindex_missing_tag_indexes() -> Dict[str, int]:
+    """Indekserer alle brugere uden komplet tag-indeks (én transaktion pr. bruger)."""
     async with SessionLocal() as session:
-        await session.execute(
-            Observation.__table__.delete().where(
-                Observation.obserkode == obserkode,
-                Observation.dato >= start_date,
-                Observation.dato <= end_date
+        koder = set((await session.execute(
+            select(Observation.obserkode).where(Observation.obserkode.is_not(None)).distinct()
+        )).scalars().all())
+        ready = set((await session.execute(
+            select(ObservationTagState.obserkode).where(ObservationTagState.version == TAG_INDEX_VERSION)
+        )).scalars().all())
+    missing = sorted(koder - ready)
+    counts: Dict[str, int] = {}
+    for i, kode in enumerate(missing, 1):
+        async with SessionLocal() as session:
+            counts[kode] = await reindex_observation_tags(session, kode)
+            await session.commit()
+        await report_job_progress(f"tag-indeks {i}/{len(missing)}")
+    if missing:
+        print(f"[TAGS] Indekserede {len(missing)} brugere ({sum(counts.values())} tags)")
+    return counts
+
+async def touch_observation_data_versions(session: AsyncSession, obserkode: str, years) -> None:
+    """Giver brugerens år nye data-tokens (kalderen committer)."""
+    years = sorted({int(y) for y in years if y})
+    if not years:
+        return
+    existing = {
+        row.year: row for row in (await session.execute(
+            select(ObservationDataVersion).where(
+                ObservationDataVersion.obserkode == obserkode,
+                ObservationDataVersion.year.in_(years),
             )
+        )).scalars().all()
+    }
+    now = _now_iso()
+    for year in years:
+        row = existing.get(year)
+        if row is None:
+            session.add(ObservationDataVersion(obserkode=obserkode, year=year, token=secrets.token_hex(8), changed_at=now))
+        else:
+            row.token = secrets.token_hex(8)
+            row.changed_at = now
+
+async def load_observation_data_versions(session: AsyncSession, obserkode: str) -> Dict[int, str]:
+    rows = await session.execute(
+        select(ObservationDataVersion.year, ObservationDataVersion.token).where(ObservationDataVersion.obserkode == obserkode)
+    )
+    return {int(year): token for year, token in rows}
+
+class ObservationSyncWriter:
+    """
+    Skriver en brugers records for scopet [start_date, end_date] i én transaktion,
+    chunk for chunk (async with ... / await writer.feed(records)).
+
+    I diff-mode sammenlignes på (obserkode, sync_key): nye rækker indsættes,
+    ændrede opdateres, og kun rækker der er forsvundet upstream slettes ved
+    afslutning. Resultatet (writer.change_set) har antal og berørte år.
+    observation_tags holdes i takt i samme transaktion (eller genopbygges ved
+    afslutning, hvis brugeren endnu ikke er indekseret).
+    """
+
+    def __init__(
+        self,
+        obserkode: str,
+        start_date: Optional[datetime.date] = None,
+        end_date: Optional[datetime.date] = None,
+        label: str = "",
+        mode: Optional[str] = None,
+    ):
+        self.obserkode = obserkode
+        self.start_date = start_date
+        self.end_date = end_date
+        self.label = label
+        self.mode = "replace" if (mode or OBSERVATION_SYNC_MODE) == "replace" else "diff"
+        self.change_set: Optional[Dict[str, Any]] = None
+        self._session: Optional[AsyncSession] = None
+        self._existing: Dict[str, Tuple[int, Optional[str], Optional[datetime.date]]] = {}
+        self._seen_keys: Dict[str, int] = {}
+        self._incoming_keys: set = set()
+        self._years: set = set()
+        self._counts = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+        self._rows = 0
+        self._tags_ready = False
+
+    async def __aenter__(self) -> "ObservationSyncWriter":
+        self._session = SessionLocal()
+        try:
+            await self._begin()
+        except BaseException:
+            await self._session.close()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                await self._finish()
+            else:
+                await self._session.rollback()
+        finally:
+            await self._session.close()
+        return False
+
+    async def _begin(self):
+        session = self._session
+        scope = _observation_scope_filters(self.obserkode, self.start_date, self.end_date)
+        self._tags_ready = await _tag_index_ready(session, self.obserkode)
+        if self.mode == "replace":
+            old_years = (await session.execute(
+                select(func.extract("year", Observation.dato)).where(*scope).distinct()
+            )).scalars().all()
+            self._years.update(int(y) for y in old_years if y is not None)
+            if self._tags_ready:
+                await session.execute(ObservationTag.__table__.delete().where(
+                    ObservationTag.obserkode == self.obserkode,
+                    ObservationTag.sync_key.in_(select(Observation.sync_key).where(*scope)),
+                ))
+            result = await session.execute(Observation.__table__.delete().where(*scope))
+            self._counts["deleted"] = result.rowcount or 0
+            return
+
+        legacy_ids: List[int] = []
+        existing = await session.execute(
+            select(Observation.id, Observation.sync_key, Observation.row_hash, Observation.dato).where(*scope)
         )
+        for row_id, sync_key, row_hash, dato in existing:
+            if sync_key:
+                self._existing[sync_key] = (row_id, row_hash, dato)
+            else:
+                # Rækker fra før sync_key fandtes: erstattes af de nye
+                legacy_ids.append(row_id)
+                if dato:
+                    self._years.add(dato.year)
+        await _delete_observation_ids(session, legacy_ids)
+        self._counts["deleted"] += len(legacy_ids)
+
+    async def feed(self, records: List[Dict[str, Any]]):
+        if not records:
+            return
+        session = self._session
+        self._rows += len(records)
+        assign_observation_sync_keys(records, self._seen_keys)
+        if self.mode == "replace":
+            self._years.update(rec["dato"].year for rec in records)
+            await bulk_insert_observations(session, records, label=self.label, commit=False)
+            if self._tags_ready:
+                await _insert_observation_tags(session, self.obserkode, records)
+            self._counts["inserted"] += len(records)
+            return
+
+        to_insert: List[Dict[str, Any]] = []
+        to_update: List[Dict[str, Any]] = []
+        updated_records: List[Dict[str, Any]] = []
+        for rec in records:
+            key = rec["sync_key"]
+            self._incoming_keys.add(key)
+            current = self._existing.get(key)
+            if current is None:
+                to_insert.append(rec)
+                continue
+            row_id, row_hash, old_dato = current
+            if row_hash == rec["row_hash"]:
+                self._counts["unchanged"] += 1
+                continue
+            to_update.append({"_id": row_id, **{name: rec.get(name) for name in OBSERVATION_WRITE_FIELDS}})
+            updated_records.append(rec)
+            self._years.add(rec["dato"].year)
+            if old_dato:
+                self._years.add(old_dato.year)
+
+        # Nøgler uden for scopet (fx en observation flyttet over en årsgrænse) opdateres i stedet for at indsættes
+        if to_insert and (self.start_date is not None or self.end_date is not None):
+            pending = {rec["sync_key"]: rec for rec in to_insert}
+            pending_keys = list(pending.keys())
+            for offset in range(0, len(pending_keys), 5000):
+                moved = (await session.execute(
+                    select(Observation.id, Observation.sync_key, Observation.dato).where(
+                        Observation.obserkode == self.obserkode,
+                        Observation.sync_key.in_(pending_keys[offset:offset + 5000]),
+                    )
+                )).all()
+                for row_id, sync_key, dato in moved:
+                    rec = pending.pop(sync_key)
+                    to_update.append({"_id": row_id, **{name: rec.get(name) for name in OBSERVATION_WRITE_FIELDS}})
+                    updated_records.append(rec)
+                    self._years.add(rec["dato"].year)
+                    if dato:
+                        self._years.add(dato.year)
+            to_insert = list(pending.values())
+
+        self._years.update(rec["dato"].year for rec in to_insert)
+        await _update_observation_rows(session, to_update)
+        await bulk_insert_observations(session, to_insert, label=self.label, commit=False)
+        if self._tags_ready:
+            await _delete_observation_tags(session, self.obserkode, [rec["sync_key"] for rec in updated_records])
+            await _insert_observation_tags(session, self.obserkode, updated_records + to_insert)
+        self._counts["inserted"] += len(to_insert)
+        self._counts["updated"] += len(to_update)
+
+    async def _finish(self):
+        session = self._session
+        if self.mode == "diff":
+            gone: List[int] = []
+            gone_keys: List[str] = []
+            for key, (row_id, _, dato) in self._existing.items():
+                if key not in self._incoming_keys:
+                    gone.append(row_id)
+                    gone_keys.append(key)
+                    if dato:
+                        self._years.add(dato.year)
+            await _delete_observation_ids(session, gone)
+            if self._tags_ready:
+                await _delete_observation_tags(session, self.obserkode, gone_keys)
+            self._counts["deleted"] += len(gone)
+        if not self._tags_ready:
+            await reindex_observation_tags(session, self.obserkode)
+        if self._counts["inserted"] or self._counts["updated"] or self._counts["deleted"]:
+            await touch_observation_data_versions(session, self.obserkode, self._years)
+        await session.commit()
+
+        self.change_set = {"mode": self.mode, "skipped": False, **self._counts, "years": sorted(self._years)}
+        c = self.change_set
+        print(
+            f"[SYNC-DIFF] {self.label}: {self._rows} rækker, "
+            f"+{c['inserted']} ~{c['updated']} -{c['deleted']} ={c['unchanged']} ({self.mode})"
+        )
+
+async def sync_observation_records(
+    obserkode: str,
+    records: List[Dict[str, Any]],
+    start_date: Optional[datetime.date] = None,
+    end_date: Optional[datetime.date] = None,
+    label: str = "",
+    mode: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Synkroniserer en færdig liste records (se ObservationSyncWriter) og returnerer change set."""
+    async with ObservationSyncWriter(obserkode, start_date, end_date, label=label, mode=mode) as writer:
+        await writer.feed(records)
+    return writer.change_set
+
+def change_set_is_empty(change_set: Optional[Dict[str, Any]]) -> bool:
+    if not change_set:
+        return True
+    return not (change_set.get("inserted") or change_set.get("updated") or change_set.get("deleted"))
+
+# ---------------------------------------------------------
+#  Indholds-hash af eksporter (spring uændrede over)
+# ---------------------------------------------------------
+# Bump når normaliseringen ændres, så alle eksporter behandles som ændrede
+EXPORT_HASH_VERSION = "2"
+EXPORT_HASH_ENABLED = os.environ.get("EXPORT_HASH_ENABLED", "1").strip() not in ("0", "false", "no")
+
+def export_scope(aar_first: int, aar_second: Optional[int] = None) -> str:
+    if aar_second is None:
+        return f"{aar_first}-NU"
+    return f"{aar_first}-{aar_second}"
+
+def new_export_digest():
+    """
+    sha1 seedet med normaliseringsversionen. Filter og udelukkede arter
+    indgår ikke: de styrer kun listerne, og en ændring heri lægger selv et
+    lists_backfill-job i kø (se enqueue_lists_rebuild_if_changed).
+    """
+    digest = hashlib.sha1()
+    digest.update(f"v{EXPORT_HASH_VERSION}\x1e".encode("utf-8"))
+    return digest
+
+def update_export_digest(digest, records: List[Dict[str, Any]]):
+    for rec in records:
+        digest.update(("\x1f".join(
+            "" if rec.get(name) is None else str(rec.get(name)) for name in OBSERVATION_RECORD_FIELDS
+        ) + "\n").encode("utf-8"))
+
+def _parse_export_scope(scope: Optional[str]) -> Optional[Tuple[int, float]]:
+    first, _, last = str(scope or "").partition("-")
+    try:
+        return int(first), (math.inf if last == "NU" else int(last))
+    except ValueError:
+        return None
+
+def _export_scope_invalidated_by(other: str, scope: str) -> bool:
+    """
+    Skal hashen for `other` glemmes når `scope` er skrevet? Kun hvis de
+    overlapper, og `other` ikke ligger helt inden i `scope` (fx glemmes
+    1900-NU når 2025-NU ændres, men ikke omvendt).
+    """
+    a, b = _parse_export_scope(other), _parse_export_scope(scope)
+    if a is None or b is None:
+        return True
+    overlaps = a[0] <= b[1] and b[0] <= a[1]
+    contained = b[0] <= a[0] and a[1] <= b[1]
+    return overlaps and not contained
+
+async def export_hash_state(obserkode: str, scope: str, content_hash: str) -> Tuple[bool, bool]:
+    """
+    (matches, rebuild_pending): matches er True hvis eksporten er uændret og
+    kan springes over; rebuild_pending er True hvis en tidligere skrivning for
+    brugeren endnu ikke er fulgt af en gennemført rebuild (så springes intet over).
+    """
+    if not EXPORT_HASH_ENABLED:
+        return False, False
+    async with SessionLocal() as session:
+        rows = (await session.execute(
+            select(ExportHash.scope, ExportHash.content_hash, ExportHash.last_result).where(ExportHash.obserkode == obserkode)
+        )).all()
+    pending = any(last_result == "pending" for _, _, last_result in rows)
+    stored = next((content for row_scope, content, _ in rows if row_scope == scope), None)
+    return (not pending and stored == content_hash), pending
+
+async def record_export_hash(obserkode: str, scope: str, content_hash: str, rows: int, changed: bool):
+    """
+    Gemmer resultatet af et tjek. Ved ændring glemmes hashes for intervaller
+    som skrivningen har gjort ugyldige (se _export_scope_invalidated_by), og
+    hashen står som "pending" indtil confirm_export_hashes efter rebuild.
+    """
+    now = datetime.datetime.now().isoformat(timespec="seconds")
+    async with SessionLocal() as session:
+        if changed:
+            others = (await session.execute(
+                select(ExportHash.scope).where(ExportHash.obserkode == obserkode, ExportHash.scope != scope)
+            )).scalars().all()
+            stale = [other for other in others if _export_scope_invalidated_by(other, scope)]
+            if stale:
+                await session.execute(ExportHash.__table__.delete().where(
+                    ExportHash.obserkode == obserkode, ExportHash.scope.in_(stale)
+                ))
+        row = (await session.execute(
+            select(ExportHash).where(ExportHash.obserkode == obserkode, ExportHash.scope == scope)
+        )).scalar_one_or_none()
+        if row is None:
+            row = ExportHash(obserkode=obserkode, scope=scope)
+            session.add(row)
+        row.content_hash = content_hash
+        row.rows = rows
+        row.checked_at = now
+        row.last_result = "pending" if changed else "skipped"
+        if changed:
+            row.changed_at = now
+        await session.commit()
+
+async def confirm_export_hashes(koder) -> None:
+    """Markerer brugernes ventende hashes som gyldige – kaldes når deres rebuild er gennemført."""
+    koder = [kode for kode in koder if kode]
+    if not koder or not EXPORT_HASH_ENABLED:
+        return
+    async with SessionLocal() as session:
+        await session.execute(ExportHash.__table__.update().where(
+            ExportHash.obserkode.in_(koder), ExportHash.last_result == "pending",
+        ).values(last_result="changed"))
         await session.commit()
 
-        inserted = 0
-        batch = []
-        for _, row in df.iterrows():
-            raw_dato = (row.get("Dato", "") or "").strip()
-            if not raw_dato:
+def skipped_change_set(scope: str) -> Dict[str, Any]:
+    return {"mode": "skipped", "skipped": True, "scope": scope,
+            "inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0, "years": []}
+
+# ---------------------------------------------------------
+#  Streaming ingest af DOFbasen-eksporter
+# ---------------------------------------------------------
+# Eksporten deles i blokke á ca. så mange bytes (altid ved rækkegrænse) til CPU-puljen
+OBSERVATION_CSV_BLOCK_BYTES = max(64 * 1024, int(os.environ.get("OBSERVATION_CSV_BLOCK_BYTES", str(2 * 1024 * 1024))))
+DOF_EXPORT_SPOOL_BYTES = int(os.environ.get("DOF_EXPORT_SPOOL_BYTES", str(8 * 1024 * 1024)))
+
+def _export_has_rows(fileobj) -> bool:
+    fileobj.seek(0)
+    fileobj.readline()
+    has_rows = bool(fileobj.readline().strip())
+    fileobj.seek(0)
+    return has_rows
+
+async def download_dof_export(url: str, timeout: float = 30, log_prefix: str = "[INFO]"):
+    """
+    Streamer en CSV-eksport til en SpooledTemporaryFile (i RAM op til
+    DOF_EXPORT_SPOOL_BYTES, derefter på disk). Returnerer None ved fejl.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=DOF_EXPORT_SPOOL_BYTES)
+    try:
+        resp = await dof_get(url, timeout=timeout, sink=spool)
+        resp.raise_for_status()
+    except Exception as e:
+        spool.close()
+        print(f"{log_prefix} HTTP-fejl ({e}) – prøver lokal CSV fallback...")
+        return None
+    size = spool.seek(0, os.SEEK_END)
+    spool.seek(0)
+    print(f"{log_prefix} Hentet {size / 1024:.0f} KB fra DOFbasen")
+    return spool
+
+def _local_export_fallback(log_prefix: str = "[INFO]") -> Optional[str]:
+    candidates = [
+        os.path.join(ROOT_DIR, "search_result (3).csv"),
+        os.path.join(SERVER_DIR, "search_result (3).csv"),
+    ]
+    for p in candidates:
+        if os.path.exists(p):
+            print(f"{log_prefix} Lokal CSV: {p}")
+            return p
+    return None
+
+async def open_observation_export(url: str, log_prefix: str = "[INFO]"):
+    """
+    Henter eksporten (streamet) og falder tilbage til lokal CSV hvis hentningen
+    fejler eller er tom. Returnerer fil-objekt/sti, eller None hvis intet findes.
+    """
+    source = await download_dof_export(url, log_prefix=log_prefix)
+    if source is not None and _export_has_rows(source):
+        return source
+    fallback = _local_export_fallback(log_prefix)
+    if fallback is None:
+        return source
+    if source is not None:
+        source.close()
+    return fallback
+
+def _record_boundary(buf: bytes) -> int:
+    """
+    Position lige efter sidste linjeskift der afslutter en hel CSV-række,
+    dvs. hvor antallet af citationstegn før det er lige (felter i "..." kan
+    indeholde linjeskift; "" tæller to og ændrer ikke pariteten). -1 hvis ingen.
+    """
+    idx = buf.rfind(b"\n")
+    while idx >= 0:
+        if buf.count(b'"', 0, idx) % 2 == 0:
+            return idx + 1
+        idx = buf.rfind(b"\n", 0, idx)
+    return -1
+
+def iter_export_blocks(source, block_bytes: Optional[int] = None):
+    """
+    Generator over (header, blok) i bytes, hvor hver blok består af hele
+    CSV-rækker. source er et binært fil-objekt eller en sti.
+    """
+    block_bytes = block_bytes or OBSERVATION_CSV_BLOCK_BYTES
+    fileobj = open(source, "rb") if isinstance(source, str) else source
+    try:
+        fileobj.seek(0)
+        header = fileobj.readline()
+        if not header.strip():
+            return
+        if not header.endswith(b"\n"):
+            header += b"\n"
+        pending = b""
+        while True:
+            chunk = fileobj.read(block_bytes)
+            if not chunk:
+                break
+            pending += chunk
+            cut = _record_boundary(pending)
+            if cut <= 0:
                 continue
-            if len(raw_dato) > 10:
-                raw_dato = raw_dato[:10]
-            dato = None
-            for fmt in ("%Y-%m-%d", "%d-%m-%Y"):
-                try:
-                    dato = datetime.datetime.strptime(raw_dato, fmt).date()
+            yield header, pending[:cut]
+            pending = pending[cut:]
+        if pending.strip():
+            yield header, pending
+    finally:
+        if isinstance(source, str):
+            fileobj.close()
+
+def parse_export_block(
+    header: bytes,
+    block: bytes,
+    obserkode: str,
+    start_date: Optional[datetime.date] = None,
+    end_date: Optional[datetime.date] = None,
+    want_records: bool = True,
+) -> Dict[str, Any]:
+    """
+    Parser og normaliserer én blok (køres i CPU-puljen). Returnerer rå og
+    normaliserede rækketal, blok-digest, records (hvis want_records) og tid
+    brugt på decode (read_csv) og normalize. Records har grundnøgle og
+    row_hash sat, så web-processen kun tildeler løbenumre.
+    """
+    started = time.perf_counter()
+    try:
+        frame = pd.read_csv(io.BytesIO(header + block), sep=";", dtype=str, encoding="latin1")
+    except pd.errors.EmptyDataError:
+        frame = pd.DataFrame()
+    decoded = time.perf_counter()
+    records = normalize_observation_frame(frame, obserkode, start_date, end_date) if len(frame) else []
+    digest = hashlib.sha1()
+    update_export_digest(digest, records)
+    if want_records:
+        compute_observation_row_keys(records)
+    return {
+        "raw_rows": len(frame),
+        "rows": len(records),
+        "digest": digest.hexdigest(),
+        "records": records if want_records else None,
+        "decode_s": decoded - started,
+        "normalize_s": time.perf_counter() - decoded,
+    }
+
+async def iter_export_records(
+    source,
+    obserkode: str,
+    start_date: Optional[datetime.date] = None,
+    end_date: Optional[datetime.date] = None,
+    want_records: bool = True,
+):
+    """
+    Async generator over parse_export_block-resultater i eksportens
+    rækkefølge. Op til CPU_POOL_WORKERS blokke parses samtidig.
+    """
+    blocks = iter_export_blocks(source)
+    window = max(1, CPU_POOL_WORKERS)
+    pending: List[asyncio.Future] = []
+    try:
+        while True:
+            while len(pending) < window:
+                item = await asyncio.to_thread(next, blocks, None)
+                if item is None:
                     break
-                except Exception:
-                    pass
-            if not dato or not (start_date <= dato <= end_date):
-                continue
+                header, block = item
+                pending.append(asyncio.ensure_future(run_in_cpu_pool(
+                    parse_export_block, header, block, obserkode, start_date, end_date, want_records
+                )))
+            if not pending:
+                break
+            yield await pending.pop(0)
+    finally:
+        for fut in pending:
+            fut.cancel()
+        blocks.close()
 
-            antal = int(row.get("Antal", "") or 0)
-            if antal == 0:
-                continue
+def _add_block_stats(stats: Dict[str, Any], block: Dict[str, Any]):
+    stats["decode_s"] = stats.get("decode_s", 0.0) + block["decode_s"]
+    stats["normalize_s"] = stats.get("normalize_s", 0.0) + block["normalize_s"]
 
-            row_obserkode = row.get("Obserkode", obserkode) or obserkode
-            try:
-                row_obserkode = normalize_obserkode(row_obserkode)
-            except ValueError:
-                row_obserkode = obserkode
-            obs = Observation(
-                obserkode=row_obserkode,
-                artnavn=safe_str(row.get("Artnavn", "") or ""),
-                dato=dato,
-                turid=safe_str(row.get("Turid")),
-                obsid=safe_str(row.get("Obsid")) if "Obsid" in row else None,
-                turtidfra=safe_str(row.get("Turtidfra")),
-                turtidtil=safe_str(row.get("Turtidtil")),
-                    turnoter=merged_note_text(row.get("Turnoter", ""), row.get("Fuglnoter", "")),
-                afdeling=safe_str(row.get("DOF_afdeling", "") or ""),
-                loknavn=safe_str(row.get("Loknavn", "") or ""),
-                loknr=_parse_int(row.get("Loknr")),
-                antal=antal
-            )
-            batch.append(obs)
-            inserted += 1
-            if len(batch) >= BATCH_SIZE:
-                session.add_all(batch)
-                await session.commit()
-                batch = []
-        if batch:
-            session.add_all(batch)
-            await session.commit()
-        print(f"[INFO] Indsat {inserted} observationer for {obserkode} ({aar})")
+async def ingest_observation_export(
+    obserkode: str,
+    source,
+    start_date: Optional[datetime.date] = None,
+    end_date: Optional[datetime.date] = None,
+    label: str = "",
+    stats: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Parser eksporten blok for blok (i CPU-puljen) og skriver hver blok til DB
+    med det samme, så hukommelsesforbruget er uafhængigt af eksportens størrelse.
+    """
+    stats = stats if stats is not None else {}
+    try:
+        async with ObservationSyncWriter(obserkode, start_date, end_date, label=label) as writer:
+            async for block in iter_export_records(source, obserkode, start_date, end_date):
+                _add_block_stats(stats, block)
+                await writer.feed(block["records"])
+    finally:
+        if hasattr(source, "close"):
+            source.close()
+    return writer.change_set
+
+# Eksporter op til denne størrelse holdes som records i RAM efter hash-gennemløbet,
+# så de ikke skal parses igen; større eksporter streames i et andet gennemløb
+INGEST_BUFFER_BYTES = int(os.environ.get("INGEST_BUFFER_BYTES", str(2 * 1024 * 1024)))
+
+def _export_size(source) -> int:
+    if source is None:
+        return 0
+    if isinstance(source, str):
+        return os.path.getsize(source)
+    size = source.seek(0, os.SEEK_END)
+    source.seek(0)
+    return size
+
+async def sync_observation_export(
+    obserkode: str,
+    source,
+    scope: str,
+    start_date: Optional[datetime.date] = None,
+    end_date: Optional[datetime.date] = None,
+    label: str = "",
+    stats: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Første gennemløb hasher den normaliserede eksport (uden DB). Er hashen
+    uændret siden sidst, springes skrivning over og change set markeres
+    skipped; ellers skrives eksporten og hashen gemmes. Små eksporter skrives
+    fra de records hash-gennemløbet gav; store parses igen (streamet).
+    stats udfyldes med decode_s/normalize_s/write_s og rækketal.
+    """
+    stats = stats if stats is not None else {}
+    buffered: Optional[List[List[Dict[str, Any]]]] = [] if _export_size(source) <= INGEST_BUFFER_BYTES else None
+    if not EXPORT_HASH_ENABLED and buffered is None:
+        started = time.perf_counter()
+        change_set = await ingest_observation_export(obserkode, source, start_date, end_date, label=label, stats=stats)
+        stats["write_s"] = time.perf_counter() - started
+        stats["rows"] = change_set["inserted"] + change_set["updated"] + change_set["unchanged"]
+        return change_set
+
+    digest = new_export_digest()
+    rows = 0
+    try:
+        async for block in iter_export_records(
+            source, obserkode, start_date, end_date, want_records=buffered is not None
+        ):
+            _add_block_stats(stats, block)
+            rows += block["rows"]
+            digest.update(block["digest"].encode("ascii"))
+            if buffered is not None:
+                buffered.append(block["records"])
+    except BaseException:
+        if hasattr(source, "close"):
+            source.close()
+        raise
+    content_hash = digest.hexdigest()
+    stats["rows"] = rows
+
+    matches, rebuild_pending = await export_hash_state(obserkode, scope, content_hash)
+    if matches:
+        if hasattr(source, "close"):
+            source.close()
+        await record_export_hash(obserkode, scope, content_hash, rows, changed=False)
+        print(f"[SYNC-SKIP] {label}: uændret eksport ({rows} rækker) – springer DB og rebuild over")
+        return skipped_change_set(scope)
+
+    started = time.perf_counter()
+    if buffered is not None:
+        if hasattr(source, "close"):
+            source.close()
+        async with ObservationSyncWriter(obserkode, start_date, end_date, label=label) as writer:
+            for records in buffered:
+                await writer.feed(records)
+        change_set = writer.change_set
+    else:
+        if hasattr(source, "seek"):
+            source.seek(0)
+        change_set = await ingest_observation_export(obserkode, source, start_date, end_date, label=label, stats=stats)
+    stats["write_s"] = time.perf_counter() - started
+    if EXPORT_HASH_ENABLED:
+        await record_export_hash(obserkode, scope, content_hash, rows, changed=True)
+    change_set["scope"] = scope
+    change_set["rebuild_pending"] = rebuild_pending
+    return change_set
 
-    # 7) Generér lister og scoreboards kun for det valgte år
-    await generate_user_lists(obserkode, aar)
-    await generate_scoreboards_from_lists(aar)
-    if include_global_rebuild:
-        await generate_user_global_lists(obserkode)
-        await generate_global_scoreboards_all_time()
+# ---------------------------------------------------------
+#  Ingest-pipeline (fetch -> decode -> normalize -> write -> rebuild)
+# ---------------------------------------------------------
+# Hentning og skrivning kører i hver sin worker-gruppe forbundet af en kø,
+# så bruger N+1 hentes mens bruger N skrives
+INGEST_FETCH_CONCURRENCY = max(1, int(os.environ.get("INGEST_FETCH_CONCURRENCY", os.environ.get("SYNC_CONCURRENCY", "4"))))
+INGEST_WRITE_CONCURRENCY = max(1, int(os.environ.get("INGEST_WRITE_CONCURRENCY", "2")))
+INGEST_STAGES = ("fetch", "decode", "normalize", "write")
+
+class IngestRequest(NamedTuple):
+    obserkode: str
+    first_year: int
+    last_year: int
+    start_date: Optional[datetime.date]
+    end_date: Optional[datetime.date]
+    scope: str
+    label: str
+    full: bool = False
+
+    @property
+    def url(self) -> str:
+        return _dof_export_url(self.obserkode, self.first_year, self.last_year)
+
+def year_ingest_request(obserkode: str, aar: int) -> IngestRequest:
+    """Ét kalenderår; rækker uden for året røres ikke."""
+    return IngestRequest(
+        obserkode, aar, aar, datetime.date(aar, 1, 1), datetime.date(aar, 12, 31),
+        export_scope(aar, aar), f"{obserkode}/{aar}",
+    )
 
+def open_ingest_request(obserkode: str, first_year: int = 1900, today: Optional[datetime.date] = None) -> IngestRequest:
+    """first_year-NU; med first_year=1900 er det en fuld sync der også sletter forsvundne rækker."""
+    today = today or datetime.date.today()
+    full = first_year <= 1900
+    return IngestRequest(
+        obserkode, first_year, today.year, None if full else datetime.date(first_year, 1, 1), None,
+        export_scope(first_year), f"{obserkode}/{export_scope(first_year)}", full,
+    )
+
+def missing_change_set(scope: str) -> Dict[str, Any]:
+    return {"mode": "missing", "skipped": False, "scope": scope,
+            "inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0, "years": []}
+
+def _format_stage_stats(stats: Dict[str, Any]) -> str:
+    return (
+        f"fetch {stats.get('fetch_s', 0):.2f}s ({stats.get('bytes', 0) / 1024:.0f} KB) | "
+        f"decode {stats.get('decode_s', 0):.2f}s | normalize {stats.get('normalize_s', 0):.2f}s "
+        f"({stats.get('rows', 0)} rækker) | write {stats.get('write_s', 0):.2f}s"
+    )
 
-async def _background_global_rebuild(obserkode: str):
-    """Kør global rebuild i baggrunden (kald via asyncio.create_task)."""
+async def run_ingest_pipeline(
+    requests: List[IngestRequest],
+    label: str = "INGEST",
+    after_write=None,
+) -> Dict[str, Any]:
+    """
+    Kører fetch/decode/normalize/write for alle requests. Decode og normalize
+    sker blokvis i CPU-puljen. after_write(request, change_set) kaldes efter
+    hver skrivning (fx delta-watermarks; fulde syncs gemmer selv deres
+    watermark). Returnerer {kode: change_set eller
+    Exception}; hvert change set har tider pr. stage under "stages".
+    """
+    results: Dict[str, Any] = {}
+    if not requests:
+        return results
+    started = time.perf_counter()
+    pending: asyncio.Queue = asyncio.Queue()
+    for req in requests:
+        pending.put_nowait(req)
+    fetched: asyncio.Queue = asyncio.Queue(maxsize=INGEST_WRITE_CONCURRENCY)
+    prefix = f"[{label}]"
+
+    async def _fetcher():
+        while True:
+            try:
+                req = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            stats: Dict[str, Any] = {}
+            t0 = time.perf_counter()
+            try:
+                source = await open_observation_export(req.url, log_prefix=prefix)
+                stats["bytes"] = _export_size(source)
+            except Exception as exc:
+                results[req.obserkode] = exc
+                print(f"{prefix} Fejl ved hentning for {req.obserkode}: {exc}")
+                continue
+            stats["fetch_s"] = time.perf_counter() - t0
+            await fetched.put((req, source, stats))
+
+    async def _writer():
+        while True:
+            item = await fetched.get()
+            if item is None:
+                return
+            req, source, stats = item
+            try:
+                if source is None:
+                    print(f"{prefix} Ingen data for {req.obserkode} – beholder eksisterende observationer")
+                    change_set = missing_change_set(req.scope)
+                else:
+                    change_set = await sync_observation_export(
+                        req.obserkode, source, req.scope, req.start_date, req.end_date,
+                        label=req.label, stats=stats,
+                    )
+                change_set["full"] = req.full
+                change_set["stages"] = stats
+                # En gennemført fuld sync (også en uændret eksport) nulstiller afstemningsdagen
+                if req.full and change_set.get("mode") != "missing":
+                    await _store_sync_watermark(req.obserkode, datetime.date.today(), True, None)
+                if after_write is not None:
+                    await after_write(req, change_set)
+                results[req.obserkode] = change_set
+                print(f"{prefix} {req.label}: {_format_stage_stats(stats)}")
+            except Exception as exc:
+                results[req.obserkode] = exc
+                print(f"{prefix} Fejl for {req.obserkode}: {exc}")
+            await report_job_progress(f"{label}: {len(results)}/{len(requests)} brugere")
+
+    fetchers = [asyncio.create_task(_fetcher()) for _ in range(min(len(requests), INGEST_FETCH_CONCURRENCY))]
+    writers = [asyncio.create_task(_writer()) for _ in range(min(len(requests), INGEST_WRITE_CONCURRENCY))]
     try:
-        await generate_user_global_lists(obserkode)
-        await generate_global_scoreboards_all_time()
-        print(f"[BG] Global rebuild færdig for {obserkode}")
-    except Exception as e:
-        print(f"[BG] Global rebuild fejlede for {obserkode}: {e}")
+        await asyncio.gather(*fetchers)
+        for _ in writers:
+            await fetched.put(None)
+        await asyncio.gather(*writers)
+    finally:
+        for task in fetchers + writers:
+            task.cancel()
+
+    failed = sum(1 for r in results.values() if isinstance(r, Exception))
+    skipped = sum(1 for r in results.values() if isinstance(r, dict) and r.get("skipped"))
+    totals = {stage: 0.0 for stage in INGEST_STAGES}
+    for result in results.values():
+        if isinstance(result, dict):
+            for stage in INGEST_STAGES:
+                totals[stage] += result["stages"].get(f"{stage}_s", 0.0)
+    print(
+        f"{prefix} {len(requests)} brugere på {time.perf_counter() - started:.1f}s "
+        f"({len(requests) - skipped - failed} ændrede, {skipped} uændrede, {failed} fejl) – "
+        + ", ".join(f"{stage} {totals[stage]:.1f}s" for stage in INGEST_STAGES)
+    )
+    return results
+
+def ingest_rebuild_plan(results: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Rebuild-plan ud fra run_ingest_pipeline: {kode: berørte år}. Uændrede,
+    manglende, tomme og fejlede synkroniseringer udelades; "user" (alle
+    brugerens år) hvis en tidligere rebuild ikke blev færdig.
+    """
+    plan: Dict[str, Any] = {}
+    for kode, result in results.items():
+        if not isinstance(result, dict) or result.get("skipped") or result.get("mode") == "missing":
+            continue
+        if result.get("rebuild_pending"):
+            plan[kode] = "user"
+        elif not change_set_is_empty(result):
+            plan[kode] = set(result["years"])
+    return plan
+
+def ingested_koder(results: Dict[str, Any]) -> List[str]:
+    """Koder hvis sync gennemførte (til confirm_export_hashes efter rebuild)."""
+    return [kode for kode, result in results.items() if isinstance(result, dict)]
+
+async def _observation_years(obserkode: Optional[str] = None) -> List[int]:
+    async with SessionLocal() as session:
+        q = select(func.extract("year", Observation.dato)).distinct()
+        if obserkode is not None:
+            q = q.where(Observation.obserkode == obserkode)
+        years = (await session.execute(q)).scalars().all()
+    return sorted(int(y) for y in years if y is not None)
+
+# Antal brugere hvis lister bygges samtidig; hver bruger er ét job i CPU-puljen
+LIST_REBUILD_CONCURRENCY = max(1, int(os.environ.get("LIST_REBUILD_CONCURRENCY", str(max(1, CPU_POOL_WORKERS)))))
+
+async def rebuild_user_lists(
+    years_by_kode: Dict[str, Any],
+    include_global: bool = True,
+    label: str = "REBUILD",
+    concurrency: Optional[int] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Bygger lister for mange brugere samtidig ({kode: år eller None = alle år
+    med data}); op til LIST_REBUILD_CONCURRENCY brugere ad gangen fordeles på
+    CPU-puljen. Returnerer {kode: generate_user_all_lists-resultat}; brugere
+    hvor alle lister var uændrede tælles som uændrede. Fejler en bruger,
+    færdiggøres de andre, og den første fejl kastes bagefter.
+    """
+    async def _job(kode: str) -> Dict[str, Any]:
+        return await generate_user_all_lists(kode, years_by_kode[kode], include_global=include_global)
+
+    results = await run_sync_pool(
+        list(years_by_kode), _job, label=f"{label} LISTER",
+        concurrency=concurrency or LIST_REBUILD_CONCURRENCY,
+    )
+    errors = [result for result in results.values() if isinstance(result, Exception)]
+    if errors:
+        raise errors[0]
+    return results
+
+async def rebuild_after_ingest(
+    plan: Dict[str, Any],
+    label: str = "INGEST",
+    year_scoreboards: bool = True,
+    global_lists: bool = True,
+    global_scoreboards: bool = True,
+) -> Dict[str, Any]:
+    """
+    Rebuild-stage. plan er {kode: år}, hvor år er et sæt årstal, "user"
+    (brugerens år i DB) eller "all" (alle år med data). Hver brugers års- og
+    all-time lister bygges i ét gennemløb, derefter årenes scoreboards og
+    til sidst all-time scoreboards.
+    """
+    prefix = f"[{label}]"
+    if not plan:
+        return {"rebuild_s": 0.0, "lists": 0, "unchanged": 0}
+    started = time.perf_counter()
+    all_years = await _observation_years() if "all" in plan.values() else []
+    # Brugerlisterne bygges parallelt (én bruger pr. job); "user" = brugerens år med data
+    results = await rebuild_user_lists(
+        {kode: all_years if years == "all" else None if years == "user" else years for kode, years in plan.items()},
+        include_global=global_lists,
+        label=label,
+    )
+    lists = sum(len(result["dirs"]) for result in results.values())
+    unchanged = sum(result["unchanged"] for result in results.values())
+    built_koder = sum(1 for result in results.values() if not result["skipped"])
+    print(f"{prefix} Lister: {lists} bygget for {built_koder} brugere, {unchanged} uændrede (fingerprint).")
+
+    if year_scoreboards:
+        # Alle planlagte år – også hvor listerne var uændrede, da en afbrudt
+        # rebuild kan have skrevet listerne men ikke nået scoreboards
+        for aar in sorted(set().union(*(result["requested"] for result in results.values()))):
+            await generate_scoreboards_from_lists(aar)
+            print(f"{prefix} Scoreboards genereret for {aar}")
+
+    if global_lists:
+        if global_scoreboards:
+            await generate_global_scoreboards_all_time()
+            print(f"{prefix} Samlede scoreboards (alle år) genereret.")
+    elapsed = time.perf_counter() - started
+    print(f"{prefix} rebuild {elapsed:.1f}s ({lists} lister bygget, {unchanged} uændrede)")
+    return {"rebuild_s": elapsed, "lists": lists, "unchanged": unchanged}
+
+async def fetch_and_store(
+    obserkode: str,
+    aar: Optional[int] = None,
+    include_global_rebuild: bool = True,
+    rebuild_scoreboards: bool = True,
+):
+    """
+    Henter observationer fra DOFbasen (CSV), synkroniserer brugerens rækker i DB for det angivne år,
+    og bygger derefter per-bruger lister + scoreboards for det år.
+    Med rebuild_scoreboards=False bygges kun brugerens egne lister (scoreboards
+    bygges så én gang af kalderen). change_set["rebuilt"] er True hvis noget
+    skulle bygges, så kalderen kan springe sin egen opfølgende rebuild over.
+    """
+    obserkode = normalize_obserkode(obserkode)
+    if aar is None:
+        aar = await get_global_year()
+
+    results = await run_ingest_pipeline([year_ingest_request(obserkode, aar)], label="SYNC")
+    change_set = results[obserkode]
+    if isinstance(change_set, Exception):
+        raise change_set
+    plan = ingest_rebuild_plan(results)
+    change_set["rebuilt"] = bool(plan)
+    if not plan:
+        await confirm_export_hashes([obserkode])
+        return change_set
+
+    await rebuild_after_ingest(
+        plan,
+        label="SYNC",
+        year_scoreboards=rebuild_scoreboards,
+        global_lists=include_global_rebuild,
+        global_scoreboards=rebuild_scoreboards,
+    )
+    await confirm_export_hashes([obserkode])
+    return change_set
+
 
-async def fetch_and_store_sites_for_kommune(kommune_id: int, kommune_name: Optional[str] = None):
-    url = f"https://statistik.dofbasen.dk/sites/group_{kommune_id}.json"
+KOMMUNE_SYNC_CONCURRENCY = max(1, int(os.environ.get("KOMMUNE_SYNC_CONCURRENCY", "8")))
+
+def _kommune_sites_digest(pairs) -> str:
+    """sha1 over sorterede (site_number, site_name) – ens for DOF-payload og DB-rækker."""
+    lines = sorted(f"{_parse_int(num)}\x1f{name or ''}" for num, name in pairs)
+    return hashlib.sha1("\n".join(lines).encode("utf-8")).hexdigest()
+
+async def _stored_kommune_site_digests() -> Dict[int, str]:
+    async with SessionLocal() as session:
+        rows = (await session.execute(
+            select(Lokation.kommune_id, Lokation.site_number, Lokation.site_name)
+        )).all()
+    grouped: Dict[int, List[Tuple[Any, Any]]] = defaultdict(list)
+    for kommune_id, site_number, site_name in rows:
+        grouped[kommune_id].append((site_number, site_name))
+    return {kommune_id: _kommune_sites_digest(pairs) for kommune_id, pairs in grouped.items()}
+
+async def fetch_and_store_sites_for_kommune(
+    kommune_id: int,
+    kommune_name: Optional[str] = None,
+    stored_digest: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Henter kommunens sites. Er indholdet identisk med DB (stored_digest),
+    springes skrivning over; ellers erstattes rækkerne i én transaktion.
+    """
+    started = time.perf_counter()
+    url = f"{DOF_STATISTIK_URL}/sites/group_{kommune_id}.json"
     try:
-        resp = requests.get(url, timeout=10)
+        resp = await dof_get(url, timeout=10)
         resp.raise_for_status()
         sites = resp.json()
     except Exception as e:
         print(f"[ERROR] Kunne ikke hente sites for kommune {kommune_id}: {e}")
-        return
+        raise
 
-    async with SessionLocal() as session:
-        # Slet eksisterende sites for denne kommune
-        await session.execute(
-            Lokation.__table__.delete().where(Lokation.kommune_id == kommune_id)
-        )
-        # Indsæt nye
-        for site in sites:
-            session.add(Lokation(
-                site_number=site["siteNumber"],
-                site_name=site["siteName"],
-                kommune_id=kommune_id
-            ))
-        await session.commit()
-    print(f"[INFO] Opdateret {len(sites)} lokationer for kommune {kommune_id}")
+    digest = _kommune_sites_digest((site["siteNumber"], site["siteName"]) for site in sites)
+    unchanged = stored_digest == digest
+    if not unchanged:
+        async with SessionLocal() as session:
+            await session.execute(
+                Lokation.__table__.delete().where(Lokation.kommune_id == kommune_id)
+            )
+            if sites:
+                await session.execute(insert(Lokation.__table__), [
+                    {"site_number": site["siteNumber"], "site_name": site["siteName"], "kommune_id": kommune_id}
+                    for site in sites
+                ])
+            await session.commit()
 
-    if kommune_name:
+    if kommune_name and (not unchanged or not os.path.exists(_kommune_sites_path(kommune_name))):
         out_dir = os.path.join(SERVER_DIR, "data", "kommune")
         safe_makedirs(out_dir)
         with open(_kommune_sites_path(kommune_name), "w", encoding="utf-8") as f:
             json.dump(sites, f, ensure_ascii=False, indent=2)
-        print(f"[INFO] Gemte kommune-sites for {kommune_name}")
 
-async def update_all_kommuner_sites():
-    kommuner = _read_kommuner()
-    for row in kommuner:
+    elapsed = time.perf_counter() - started
+    status = "uændret" if unchanged else "opdateret"
+    print(f"[KOMMUNE] {kommune_id} {kommune_name or ''}: {len(sites)} lokationer {status} ({elapsed:.2f}s)")
+    return {"kommune_id": kommune_id, "sites": len(sites), "skipped": unchanged, "seconds": elapsed}
+
+async def update_all_kommuner_sites() -> Dict[str, Any]:
+    kommuner = {}
+    for row in _read_kommuner():
         kommune_id = _parse_int(row.get("id"))
-        if kommune_id is None:
-            continue
-        await fetch_and_store_sites_for_kommune(kommune_id, row.get("navn"))
+        if kommune_id is not None:
+            kommuner[str(kommune_id)] = row.get("navn")
+    stored = await _stored_kommune_site_digests()
+
+    async def _job(kode: str):
+        return await fetch_and_store_sites_for_kommune(int(kode), kommuner[kode], stored.get(int(kode)))
+
+    return await run_sync_pool(
+        list(kommuner), _job, label="KOMMUNE", concurrency=KOMMUNE_SYNC_CONCURRENCY, unit="kommuner"
+    )
 
 async def schedule_daily_kommune_sync():
     while True:
@@ -2155,19 +4250,62 @@ async def update_lokationer(request: Request):
         return JSONResponse({"msg": f"Opdatering fejlede: {exc}"}, status_code=500)
     return {"msg": "Alle kommune-lokationer opdateret"}
 
-async def daily_update_all_jsons():
+# ---------------------------------------------------------
+#  Daglig sync: delta (seneste år) + spredt fuld afstemning
+# ---------------------------------------------------------
+# "delta": kun indeværende år (i januar også sidste år) om natten, fuld 1900-NU
+# hver FULL_RECONCILE_DAYS dage pr. bruger. "full": altid 1900-NU.
+DAILY_SYNC_MODE = os.environ.get("DAILY_SYNC_MODE", "delta").strip().lower()
+DAILY_SYNC_DELTA_YEARS = max(1, int(os.environ.get("DAILY_SYNC_DELTA_YEARS", "1")))
+FULL_RECONCILE_DAYS = max(1, int(os.environ.get("FULL_RECONCILE_DAYS", "7")))
+
+def _delta_from_year(today: datetime.date) -> int:
+    years = DAILY_SYNC_DELTA_YEARS
+    if today.month == 1:
+        # Sene indtastninger for sidste år dukker typisk op i januar
+        years = max(years, 2)
+    return today.year - years + 1
+
+def _full_sync_due(kode: str, watermark: Optional["SyncWatermark"], today: datetime.date) -> bool:
     """
-    Daglig fuld synkronisering:
-    1. Hent og indsæt ALLE observationer for ALLE brugere (1900-NU) direkte.
-    2. Generér lister og scoreboards for ALLE år med data (cacher alle år).
+    Fuld afstemning hvis brugeren aldrig er synket fuldt, hvis det er over
+    FULL_RECONCILE_DAYS siden, eller hvis det er brugerens faste dag i cyklussen
+    (crc32 af koden spreder brugerne jævnt ud over dagene).
     """
-    import io
-    import datetime
-    import pandas as pd
-    import requests
+    if DAILY_SYNC_MODE == "full" or watermark is None or watermark.last_full_sync is None:
+        return True
+    age = (today - watermark.last_full_sync).days
+    if age >= FULL_RECONCILE_DAYS:
+        return True
+    return age > 0 and zlib.crc32(kode.encode("utf-8")) % FULL_RECONCILE_DAYS == today.toordinal() % FULL_RECONCILE_DAYS
+
+async def _load_sync_watermarks() -> Dict[str, "SyncWatermark"]:
+    async with SessionLocal() as session:
+        rows = (await session.execute(select(SyncWatermark))).scalars().all()
+    return {row.obserkode: row for row in rows}
 
-    BATCH_SIZE = 25000
+async def _store_sync_watermark(kode: str, today: datetime.date, full: bool, from_year: Optional[int]):
+    async with SessionLocal() as session:
+        row = (await session.execute(
+            select(SyncWatermark).where(SyncWatermark.obserkode == kode)
+        )).scalar_one_or_none()
+        if row is None:
+            row = SyncWatermark(obserkode=kode)
+            session.add(row)
+        if full:
+            row.last_full_sync = today
+        else:
+            row.last_delta_sync = today
+            row.delta_from_year = from_year
+        await session.commit()
 
+async def daily_update_all_jsons(force_full: bool = False):
+    """
+    Daglig synkronisering:
+    1. Hent observationer for alle brugere – delta (seneste år) eller fuld
+       1900-NU når brugeren har sin afstemningsdag (se _full_sync_due).
+    2. Generér lister og scoreboards for de år der er berørt.
+    """
     # 1. Hent alle brugerkoder
     async with SessionLocal() as session:
         koder = [
@@ -2176,244 +4314,503 @@ async def daily_update_all_jsons():
             if SAFE_OBSERKODE_RE.fullmatch((k.kode or "").strip().upper())
         ]
 
-    # 2. Hent og indsæt observationer for alle brugere (rydder ALT for brugeren først)
-    for kode in koder:
-        print(f"[DAILY SYNC] Henter og indsætter observationer for {kode}")
-        url = (
-            "https://dofbasen.dk/excel/search_result1.php"
-            "?design=excel&soeg=soeg&periode=maanedaar"
-            f"&aar_first=1900&aar_second={datetime.datetime.now().year}"
-            "&obstype=observationer&species=alle"
-            f"&obserdata={kode}&sortering=dato"
-        )
-        df = None
-        try:
-            resp = requests.get(url, timeout=30)
-            resp.raise_for_status()
-            df = pd.read_csv(io.StringIO(resp.content.decode("latin1")), sep=";", dtype=str)
-            print(f"[INFO] Hentet {len(df)} rækker fra DOFbasen for {kode} (1900-NU)")
-        except Exception as e:
-            print(f"[WARN] HTTP-fejl ({e}) – prøver lokal CSV fallback...")
-            df = None
-
-        # Lokal fallback (valgfri)
-        if df is None or df.empty:
-            candidates = [
-                os.path.join(ROOT_DIR, "search_result (3).csv"),
-                os.path.join(SERVER_DIR, "search_result (3).csv"),
-            ]
-            for p in candidates:
-                if os.path.exists(p):
-                    try:
-                        df = pd.read_csv(p, sep=";", dtype=str, encoding="latin1")
-                        print(f"[INFO] Lokal CSV: {len(df)} rækker fra {p}")
-                        break
-                    except Exception as e:
-                        print(f"[ERROR] Kunne ikke parse {p}: {e}")
-
-        # Indsæt i DB (ryd ALT for brugeren først) - nu med batch-inserts
-        async with SessionLocal() as session:
-            await session.execute(
-                Observation.__table__.delete().where(
-                    Observation.obserkode == kode
-                )
-            )
-            await session.commit()
-
-            inserted = 0
-            batch = []
-            if df is not None and not df.empty:
-                for _, row in df.iterrows():
-                    raw_dato = (row.get("Dato", "") or "").strip()
-                    if not raw_dato:
-                        continue
-                    if len(raw_dato) > 10:
-                        raw_dato = raw_dato[:10]
-                    dato = None
-                    for fmt in ("%Y-%m-%d", "%d-%m-%Y"):
-                        try:
-                            dato = datetime.datetime.strptime(raw_dato, fmt).date()
-                            break
-                        except Exception:
-                            pass
-                    if not dato:
-                        continue
-
-                    antal = int(row.get("Antal", "") or 0)
-                    if antal == 0:
-                        continue
+    # 2. Hent og synkronisér observationer for alle brugere (ingest-pipeline)
+    today = datetime.date.today()
+    from_year = _delta_from_year(today)
+    watermarks = await _load_sync_watermarks()
+    full_koder = {
+        kode for kode in koder
+        if force_full or _full_sync_due(kode, watermarks.get(kode), today)
+    }
+    requests = [
+        open_ingest_request(kode, 1900 if kode in full_koder else from_year, today)
+        for kode in koder
+    ]
 
-                    obs = Observation(
-                        obserkode=safe_str(row.get("Obserkode", "")),
-                        artnavn=safe_str(row.get("Artnavn", "") or ""),
-                        dato=dato,
-                        turid=safe_str(row.get("Turid")),
-                        obsid=safe_str(row.get("Obsid")) if "Obsid" in row else None,
-                        turtidfra=safe_str(row.get("Turtidfra")),
-                        turtidtil=safe_str(row.get("Turtidtil")),
-                        turnoter=merged_note_text(row.get("Turnoter", ""), row.get("Fuglnoter", "")),
-                        afdeling=safe_str(row.get("DOF_afdeling", "") or ""),
-                        loknavn=safe_str(row.get("Loknavn", "") or ""),
-                        loknr=_parse_int(row.get("Loknr")),
-                        antal=antal
-                    )
-                    batch.append(obs)
-                    inserted += 1
-                    if len(batch) >= BATCH_SIZE:
-                        session.add_all(batch)
-                        await session.commit()
-                        batch = []
-                if batch:
-                    session.add_all(batch)
-                    await session.commit()
-            print(f"[INFO] Indsat {inserted} observationer for {kode} (1900-NU)")
+    async def _after_write(req: IngestRequest, change_set: Dict[str, Any]):
+        if not req.full and change_set.get("mode") != "missing":
+            await _store_sync_watermark(req.obserkode, today, False, req.first_year)
 
-    print("[DAILY SYNC] Alle observationer hentet og indsat.")
+    print(f"[DAILY SYNC] {len(full_koder)} fulde og {len(koder) - len(full_koder)} delta-syncs (fra {from_year})")
+    results = await run_ingest_pipeline(requests, label="DAILY SYNC", after_write=_after_write)
 
-    # 3. Find alle årstal med data på tværs af brugere
+    # 3. Lister bygges kun for brugere med ændrede observationer og kun de år
+    # hvor sync faktisk ændrede noget. Koder uden brugerrække har ingen lister,
+    # så deres hash bekræftes ikke – første sync efter login bygger dem.
     async with SessionLocal() as session:
-        years = (await session.execute(
-            select(func.extract("year", Observation.dato)).distinct()
-        )).scalars().all()
-        years = [int(y) for y in years if y is not None]
+        user_koder = set((await session.execute(select(User.obserkode))).scalars().all())
+    plan = {kode: years for kode, years in ingest_rebuild_plan(results).items() if kode in user_koder}
+    confirm_koder = [kode for kode in ingested_koder(results) if kode in user_koder]
+    if not plan:
+        print("[DAILY SYNC] Ingen ændrede observationer – springer lister og scoreboards over.")
+        await confirm_export_hashes(confirm_koder)
+        return results
+    print("[DAILY SYNC] Alle observationer hentet og indsat.")
+    await rebuild_after_ingest(plan, label="DAILY SYNC")
+    await confirm_export_hashes(confirm_koder)
+    return results
 
-        # Find alle brugere igen (til generate_user_lists)
-        brugere = [u.obserkode for u in (await session.execute(select(User))).scalars().all()]
 
-    # 4. Generér lister og scoreboards for alle år og alle brugere
-    for aar in sorted(years):
-        for kode in brugere:
-            await generate_user_lists(kode, aar)
-        await generate_scoreboards_from_lists(aar)
-        print(f"[DAILY SYNC] Scoreboards og lister genereret for {aar}")
+async def sync_users_all_time(koder: List[str], label: str = "SYNC-ALL") -> Dict[str, Any]:
+    """
+    Fuld sync (1900-NU) for flere brugere i én ingest-pipeline, efterfulgt
+    af én samlet rebuild. Returnerer {kode: change_set eller Exception}; en
+    brugers fejl stopper ikke de andre.
+    """
+    koder = [normalize_obserkode(kode) for kode in koder]
+    results = await run_ingest_pipeline([open_ingest_request(kode) for kode in koder], label=label)
+    plan = ingest_rebuild_plan(results)
+    for kode in ingested_koder(results):
+        if kode not in plan and _read_list_fingerprint(get_global_user_dir(kode)) is None:
+            # Ingen lister endnu (fx en obserkode der blev synket før brugeren oprettedes)
+            plan[kode] = "user"
+    if plan:
+        await rebuild_after_ingest(plan, label=label)
+    await confirm_export_hashes(ingested_koder(results))
+    return results
 
-    print("[DAILY SYNC] Færdig med scoreboards og lister for alle år.")
+async def sync_user_all_time(obserkode: str):
+    """
+    Fuld sync for en enkelt bruger (1900-NU) + rebuild af relevante år og all-time.
+    """
+    obserkode = normalize_obserkode(obserkode)
+    change_set = (await sync_users_all_time([obserkode]))[obserkode]
+    if isinstance(change_set, Exception):
+        raise change_set
+    return change_set
 
-    # 5. Generér samlede lister (alle år) pr. bruger
-    for kode in brugere:
-        await generate_user_global_lists(kode)
-    print("[DAILY SYNC] Samlede lister (alle år) genereret for alle brugere.")
 
-    await generate_global_scoreboards_all_time()
-    print("[DAILY SYNC] Samlede scoreboards (alle år) genereret.")
+# ---------------------------------------------------------
+#  Sync-scheduler (worker-pool med global samtidighedsgrænse)
+# ---------------------------------------------------------
+SYNC_CONCURRENCY = max(1, int(os.environ.get("SYNC_CONCURRENCY", "4")))
+
+async def run_sync_pool(
+    koder: List[str],
+    job,
+    label: str = "SYNC",
+    concurrency: Optional[int] = None,
+    unit: str = "brugere",
+) -> Dict[str, Any]:
+    """
+    Kører job(kode) for alle koder med højst `concurrency` samtidige jobs.
+    HTTP-høfligheden pr. host håndhæves i dof_request (token bucket).
+    Returnerer {kode: resultat eller Exception}; en fejl stopper ikke de andre.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for kode in koder:
+        queue.put_nowait(kode)
+    results: Dict[str, Any] = {}
+    started = time.perf_counter()
 
+    async def _worker():
+        while True:
+            try:
+                kode = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                results[kode] = await job(kode)
+            except Exception as exc:
+                results[kode] = exc
+                print(f"[{label}] Fejl for {kode}: {exc}")
+            await report_job_progress(f"{label}: {len(results)}/{len(koder)} {unit}")
+
+    workers = min(len(koder), concurrency or SYNC_CONCURRENCY)
+    await asyncio.gather(*(_worker() for _ in range(workers)))
+    failed = sum(1 for r in results.values() if isinstance(r, Exception))
+    skipped = sum(1 for r in results.values() if isinstance(r, dict) and r.get("skipped"))
+    print(
+        f"[{label}] {len(koder)} {unit} på {time.perf_counter() - started:.1f}s "
+        f"({workers} workers, {len(koder) - skipped - failed} ændrede, {skipped} uændrede, {failed} fejl)"
+    )
+    return results
 
-async def sync_user_all_time(obserkode: str):
+async def sync_year_for_all_users(aar: int, koder: Optional[List[str]] = None, label: str = "SYNC-ALL-YEAR") -> Dict[str, Any]:
     """
-    Fuld sync for en enkelt bruger (1900-NU) + rebuild af relevante år og all-time.
+    Henter året for alle brugere (ingest-pipeline), bygger lister for de
+    ændrede brugere og derefter års- og all-time scoreboards én gang til sidst.
     """
-    import io
-    import datetime
-    import pandas as pd
-    import requests
+    if koder is None:
+        async with SessionLocal() as session:
+            koder = [
+                normalize_obserkode(k.kode)
+                for k in (await session.execute(select(Obserkode))).scalars().all()
+                if SAFE_OBSERKODE_RE.fullmatch((k.kode or "").strip().upper())
+            ]
 
-    obserkode = normalize_obserkode(obserkode)
-    current_year = datetime.datetime.now().year
+    results = await run_ingest_pipeline([year_ingest_request(kode, aar) for kode in koder], label=label)
+    plan = ingest_rebuild_plan(results)
+    if not plan:
+        print(f"[{label}] Ingen ændrede observationer – springer scoreboards over")
+        await confirm_export_hashes(ingested_koder(results))
+        return results
+    await rebuild_after_ingest(plan, label=label)
+    await confirm_export_hashes(ingested_koder(results))
+    print(f"[{label}] Scoreboards genopbygget for {aar} og all-time")
+    return results
 
-    url = (
-        "https://dofbasen.dk/excel/search_result1.php"
-        "?design=excel&soeg=soeg&periode=maanedaar"
-        f"&aar_first=1900&aar_second={current_year}"
-        "&obstype=observationer&species=alle"
-        f"&obserdata={obserkode}&sortering=dato"
-    )
+# ---------------------------------------------------------
+#  Jobkø (persistent, dedup + sammenlægning pr. kind)
+# ---------------------------------------------------------
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "2"))
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", "15"))
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = max(1, int(os.environ.get("JOB_MAX_ATTEMPTS", "3")))
+JOB_COALESCE_MAX = max(1, int(os.environ.get("JOB_COALESCE_MAX", "500")))
+JOB_KEEP_DAYS = max(1, int(os.environ.get("JOB_KEEP_DAYS", "14")))
+# Nøgle til pg_advisory_xact_lock under _claim_jobs (kun PostgreSQL)
+JOB_CLAIM_LOCK_KEY = 0x5359_4E43
+# Debounce: nye jobs af disse kinds skubber alle ventende af samme kind til
+# now + stille-vindue, dog højst JOB_DEBOUNCE_MAX_DELAY_SECONDS efter oprettelse.
+JOB_DEBOUNCE_SECONDS = {
+    "global_rebuild": float(os.environ.get("GLOBAL_REBUILD_QUIET_SECONDS", "30")),
+    "optin_rebuild": float(os.environ.get("GLOBAL_REBUILD_QUIET_SECONDS", "30")),
+}
+JOB_DEBOUNCE_MAX_DELAY_SECONDS = float(os.environ.get("GLOBAL_REBUILD_MAX_DELAY_SECONDS", "300"))
+# Planlagte jobs (scheduler/startup i hver uvicorn-worker) dedupliceres også mod
+# kørende jobs og jobs startet inden for dette vindue
+JOB_SCHEDULED_DEDUP_SECONDS = float(os.environ.get("JOB_SCHEDULED_DEDUP_SECONDS", "3600"))
+
+_current_job_ids: contextvars.ContextVar[Tuple[int, ...]] = contextvars.ContextVar("current_job_ids", default=())
+_job_progress_written: Dict[Tuple[int, ...], float] = {}
+_job_wakeup: Optional[asyncio.Event] = None
+
+def _now_iso(offset_seconds: float = 0) -> str:
+    return (datetime.datetime.now() + datetime.timedelta(seconds=offset_seconds)).isoformat(timespec="seconds")
+
+async def _jobs_global_rebuild(jobs: List[SyncJob]):
+    koder = sorted({job.obserkode for job in jobs if job.obserkode})
+    await rebuild_user_lists({kode: [] for kode in koder}, label="GLOBAL REBUILD")
+    await generate_global_scoreboards_all_time()
 
-    df = None
-    try:
-        resp = requests.get(url, timeout=30)
-        resp.raise_for_status()
-        df = pd.read_csv(io.StringIO(resp.content.decode("latin1")), sep=";", dtype=str)
-        print(f"[SYNC-ALL] Hentet {len(df)} rækker fra DOFbasen for {obserkode} (1900-NU)")
-    except Exception as e:
-        print(f"[SYNC-ALL] HTTP-fejl ({e}) – prøver lokal CSV fallback...")
+async def _jobs_optin_rebuild(jobs: List[SyncJob]):
+    await _rebuild_scoreboards_after_optin_changes([job.obserkode for job in jobs if job.obserkode])
 
-    if df is None or df.empty:
-        candidates = [
-            os.path.join(ROOT_DIR, "search_result (3).csv"),
-            os.path.join(SERVER_DIR, "search_result (3).csv"),
-        ]
-        for p in candidates:
-            if os.path.exists(p):
-                try:
-                    df = pd.read_csv(p, sep=";", dtype=str, encoding="latin1")
-                    print(f"[SYNC-ALL] Lokal CSV: {len(df)} rækker fra {p}")
-                    break
-                except Exception as e:
-                    print(f"[SYNC-ALL] Kunne ikke parse {p}: {e}")
+async def _jobs_user_full_sync(jobs: List[SyncJob]):
+    koder = sorted({job.obserkode for job in jobs if job.obserkode})
+    results = await sync_users_all_time(koder, label="USER FULL SYNC")
+    return {
+        job.id: results[job.obserkode] for job in jobs
+        if isinstance(results.get(job.obserkode), Exception)
+    }
 
+async def _jobs_year_sync_all(jobs: List[SyncJob]):
+    years = sorted({job.year for job in jobs if job.year})
+    for aar in years:
+        await sync_year_for_all_users(aar)
+
+async def _jobs_daily_sync(jobs: List[SyncJob]):
+    await daily_update_all_jsons()
+
+async def _jobs_full_sync_all(jobs: List[SyncJob]):
+    await daily_update_all_jsons(force_full=True)
+
+async def _jobs_tag_reindex(jobs: List[SyncJob]):
+    await reindex_missing_tag_indexes()
+
+async def _jobs_lists_backfill(jobs: List[SyncJob]):
+    await backfill_user_lists()
+
+# kind -> handler(jobs). Alle ventende jobs af samme kind køres i ét kald.
+# Handleren kan returnere {job_id: fejl} for jobs der fejlede enkeltvis; en
+# exception fra handleren fejler hele batchet.
+JOB_HANDLERS = {
+    "global_rebuild": _jobs_global_rebuild,
+    "optin_rebuild": _jobs_optin_rebuild,
+    "user_full_sync": _jobs_user_full_sync,
+    "year_sync_all": _jobs_year_sync_all,
+    "daily_sync": _jobs_daily_sync,
+    "full_sync_all": _jobs_full_sync_all,
+    "tag_reindex": _jobs_tag_reindex,
+    "lists_backfill": _jobs_lists_backfill,
+}
+
+def _job_to_dict(job: SyncJob) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "obserkode": job.obserkode,
+        "year": job.year,
+        "status": job.status,
+        "progress": job.progress,
+        "error": job.error,
+        "attempts": job.attempts,
+        "cancel_requested": bool(job.cancel_requested),
+        "created_at": job.created_at,
+        "not_before": job.not_before,
+        "started_at": job.started_at,
+        "heartbeat_at": job.heartbeat_at,
+        "finished_at": job.finished_at,
+    }
+
+def _job_key_filters(kind: str, obserkode: Optional[str], year: Optional[int]):
+    return [
+        SyncJob.kind == kind,
+        SyncJob.obserkode.is_(None) if obserkode is None else SyncJob.obserkode == obserkode,
+        SyncJob.year.is_(None) if year is None else SyncJob.year == year,
+    ]
+
+def _insert_sync_job_ignore_conflict(dialect_name: str, values: Dict[str, Any]):
+    """INSERT ... ON CONFLICT DO NOTHING mod ux_sync_jobs_pending_key."""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(SyncJob.__table__).values(**values).on_conflict_do_nothing().returning(SyncJob.id)
+
+async def enqueue_job(
+    kind: str,
+    obserkode: Optional[str] = None,
+    year: Optional[int] = None,
+    scheduled: bool = False,
+) -> Dict[str, Any]:
+    """
+    Lægger et job i køen. Findes der allerede et ventende job med samme
+    (kind, obserkode, year), genbruges det i stedet (deduplicated=True).
+    Med scheduled=True genbruges også et kørende job eller et job startet
+    inden for JOB_SCHEDULED_DEDUP_SECONDS, så hver worker kan planlægge.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Ukendt jobtype: {kind}")
+    quiet = JOB_DEBOUNCE_SECONDS.get(kind)
+    key_filters = _job_key_filters(kind, obserkode, year)
+    live = SyncJob.status == "pending"
+    if scheduled:
+        live = or_(
+            SyncJob.status.in_(("pending", "running")),
+            SyncJob.started_at >= _now_iso(-JOB_SCHEDULED_DEDUP_SECONDS),
+        )
+    async with SessionLocal() as session:
+        existing_id = (await session.execute(
+            select(SyncJob.id).where(*key_filters, live).order_by(SyncJob.id).limit(1)
+        )).scalar_one_or_none()
+        job_id = None
+        if existing_id is None:
+            conn = await session.connection()
+            job_id = (await session.execute(_insert_sync_job_ignore_conflict(conn.dialect.name, {
+                "kind": kind, "obserkode": obserkode, "year": year, "status": "pending",
+                "attempts": 0, "cancel_requested": 0, "created_at": _now_iso(),
+            }))).scalar_one_or_none()
+            if job_id is None:
+                # En anden worker nåede at oprette det ventende job først
+                existing_id = (await session.execute(
+                    select(SyncJob.id).where(*key_filters, SyncJob.status == "pending")
+                    .order_by(SyncJob.id).limit(1)
+                )).scalar_one_or_none()
+        if quiet:
+            await _debounce_pending_jobs(session, kind, quiet)
+        await session.commit()
+    if job_id is None:
+        return {"id": existing_id, "kind": kind, "deduplicated": True}
+    if _job_wakeup is not None:
+        _job_wakeup.set()
+    print(f"[JOBS] Oprettet #{job_id} {kind} {obserkode or ''} {year or ''}".rstrip())
+    return {"id": job_id, "kind": kind, "deduplicated": False}
+
+async def _debounce_pending_jobs(session: AsyncSession, kind: str, quiet: float):
+    """Skyd alle ventende jobs af kind til samme tidspunkt, så de claimes samlet."""
+    target = datetime.datetime.now() + datetime.timedelta(seconds=quiet)
+    pending = (await session.execute(
+        select(SyncJob).where(SyncJob.kind == kind, SyncJob.status == "pending")
+    )).scalars().all()
+    for job in pending:
+        latest = target
+        if job.created_at:
+            created = datetime.datetime.fromisoformat(job.created_at)
+            latest = min(target, created + datetime.timedelta(seconds=JOB_DEBOUNCE_MAX_DELAY_SECONDS))
+        job.not_before = latest.isoformat(timespec="seconds")
+
+async def report_job_progress(message: str, force: bool = False):
+    """Opdaterer progress på de jobs der kører i denne context (højst hvert 2. sekund)."""
+    job_ids = _current_job_ids.get()
+    if not job_ids:
+        return
+    now = time.monotonic()
+    if not force and now - _job_progress_written.get(job_ids, 0) < 2:
+        return
+    _job_progress_written[job_ids] = now
     async with SessionLocal() as session:
         await session.execute(
-            Observation.__table__.delete().where(
-                Observation.obserkode == obserkode
-            )
+            update(SyncJob).where(SyncJob.id.in_(job_ids)).values(progress=message[:500])
         )
         await session.commit()
 
-        inserted = 0
-        batch = []
-        if df is not None and not df.empty:
-            for _, row in df.iterrows():
-                raw_dato = (row.get("Dato", "") or "").strip()
-                if not raw_dato:
-                    continue
-                if len(raw_dato) > 10:
-                    raw_dato = raw_dato[:10]
-                dato = None
-                for fmt in ("%Y-%m-%d", "%d-%m-%Y"):
-                    try:
-                        dato = datetime.datetime.strptime(raw_dato, fmt).date()
-                        break
-                    except Exception:
-                        pass
-                if not dato:
-                    continue
-
-                antal = int(row.get("Antal", "") or 0)
-                if antal == 0:
-                    continue
-
-                obs = Observation(
-                    obserkode=safe_str(row.get("Obserkode", "")) or obserkode,
-                    artnavn=safe_str(row.get("Artnavn", "") or ""),
-                    dato=dato,
-                    turid=safe_str(row.get("Turid")),
-                    obsid=safe_str(row.get("Obsid")) if "Obsid" in row else None,
-                    turtidfra=safe_str(row.get("Turtidfra")),
-                    turtidtil=safe_str(row.get("Turtidtil")),
-                    turnoter=merged_note_text(row.get("Turnoter", ""), row.get("Fuglnoter", "")),
-                    afdeling=safe_str(row.get("DOF_afdeling", "") or ""),
-                    loknavn=safe_str(row.get("Loknavn", "") or ""),
-                    loknr=_parse_int(row.get("Loknr")),
-                    antal=antal
-                )
-                batch.append(obs)
-                inserted += 1
-                if len(batch) >= 25000:
-                    session.add_all(batch)
-                    await session.commit()
-                    batch = []
-            if batch:
-                session.add_all(batch)
-                await session.commit()
-        print(f"[SYNC-ALL] Indsat {inserted} observationer for {obserkode} (1900-NU)")
+async def _requeue_stale_jobs():
+    """Jobs hvis worker er død (ingen heartbeat) sættes tilbage i kø eller fejles."""
+    cutoff = _now_iso(-JOB_STALE_SECONDS)
+    async with SessionLocal() as session:
+        stale = (await session.execute(
+            select(SyncJob).where(SyncJob.status == "running", SyncJob.heartbeat_at < cutoff)
+        )).scalars().all()
+        for job in stale:
+            job.claim_token = None
+            if job.attempts >= JOB_MAX_ATTEMPTS:
+                job.status = "failed"
+                job.error = "Worker forsvandt (ingen heartbeat)"
+                job.finished_at = _now_iso()
+            elif (await session.execute(
+                select(SyncJob.id).where(
+                    *_job_key_filters(job.kind, job.obserkode, job.year), SyncJob.status == "pending"
+                ).limit(1)
+            )).scalar_one_or_none() is not None:
+                # Et ventende job med samme nøgle dækker allerede arbejdet
+                job.status = "cancelled"
+                job.error = "Worker forsvandt; erstattet af ventende job"
+                job.finished_at = _now_iso()
+            else:
+                job.status = "pending"
+        if stale:
+            await session.commit()
+            print(f"[JOBS] {len(stale)} hængende job(s) genoptaget")
 
+async def _claim_jobs() -> List[SyncJob]:
+    """
+    Tager det ældste klare job og alle andre klare af samme kind, medmindre
+    den kind allerede kører.
+    Claim sker med en unik token i én UPDATE ... WHERE status='pending' AND
+    NOT EXISTS (kørende job af samme kind), så flere processer hverken kan
+    tage de samme jobs eller starte to batches af samme kind.
+    """
+    now = _now_iso()
+    ready = [
+        SyncJob.status == "pending",
+        SyncJob.cancel_requested == 0,
+        or_(SyncJob.not_before.is_(None), SyncJob.not_before <= now),
+    ]
     async with SessionLocal() as session:
-        years = (await session.execute(
-            select(func.extract("year", Observation.dato))
-            .where(Observation.obserkode == obserkode)
-            .distinct()
+        conn = await session.connection()
+        if conn.dialect.name == "postgresql":
+            # Serialisér claims, så NOT EXISTS ser et andet claims committede
+            # running-rækker (READ COMMITTED); SQLite har kun én skriver ad gangen
+            await session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": JOB_CLAIM_LOCK_KEY})
+        # Højst ét kørende batch pr. kind på tværs af processer; nye jobs venter
+        # som "dirty igen" og køres samlet når det kørende er færdigt.
+        running_kinds = (await session.execute(
+            select(SyncJob.kind).where(SyncJob.status == "running").distinct()
         )).scalars().all()
-        years = [int(y) for y in years if y is not None]
+        if running_kinds:
+            ready.append(SyncJob.kind.not_in(running_kinds))
+        first = (await session.execute(
+            select(SyncJob).where(*ready).order_by(SyncJob.id).limit(1)
+        )).scalar_one_or_none()
+        if first is None:
+            return []
+        ids = (await session.execute(
+            select(SyncJob.id).where(*ready, SyncJob.kind == first.kind).order_by(SyncJob.id).limit(JOB_COALESCE_MAX)
+        )).scalars().all()
+        token = secrets.token_hex(12)
+        running = SyncJob.__table__.alias("running_jobs")
+        kind_running = select(running.c.id).where(
+            running.c.kind == first.kind, running.c.status == "running"
+        ).exists()
+        await session.execute(
+            update(SyncJob)
+            .where(SyncJob.id.in_(ids), SyncJob.status == "pending", ~kind_running)
+            .values(status="running", claim_token=token, started_at=now, heartbeat_at=now,
+                    attempts=SyncJob.attempts + 1, progress=None)
+        )
+        await session.commit()
+        return (await session.execute(
+            select(SyncJob).where(SyncJob.claim_token == token).order_by(SyncJob.id)
+        )).scalars().all()
+
+async def _finish_jobs(job_ids: List[int], status: str, error: Optional[str] = None):
+    """Afslutter et batch; jobs med cancel_requested afsluttes som "cancelled" uanset batchets udfald."""
+    finished_at = _now_iso()
+    async with SessionLocal() as session:
+        await session.execute(
+            update(SyncJob).where(SyncJob.id.in_(job_ids), SyncJob.status == "running", SyncJob.cancel_requested != 0)
+            .values(status="cancelled", finished_at=finished_at, claim_token=None)
+        )
+        await session.execute(
+            update(SyncJob).where(SyncJob.id.in_(job_ids), SyncJob.status == "running")
+            .values(status=status, error=error, finished_at=finished_at, claim_token=None)
+        )
+        await session.commit()
 
-    for aar in sorted(years):
-        await generate_user_lists(obserkode, aar)
-        await generate_scoreboards_from_lists(aar)
-        print(f"[SYNC-ALL] Lister/scoreboards for {obserkode} opdateret ({aar})")
+async def _run_claimed_jobs(jobs: List[SyncJob]):
+    kind = jobs[0].kind
+    job_ids = [job.id for job in jobs]
+    handler = JOB_HANDLERS.get(kind)
+    if handler is None:
+        await _finish_jobs(job_ids, "failed", f"Ukendt jobtype: {kind}")
+        return
 
-    await generate_user_global_lists(obserkode)
-    await generate_global_scoreboards_all_time()
-    print(f"[SYNC-ALL] All-time lister/scoreboards opdateret for {obserkode}")
+    started = time.perf_counter()
+    print(f"[JOBS] Kører {kind} for {len(jobs)} job(s): {job_ids[:10]}{'...' if len(job_ids) > 10 else ''}")
+    token = _current_job_ids.set(tuple(job_ids))
+    task = asyncio.create_task(handler(jobs))
+    _current_job_ids.reset(token)
+    cancelled = False
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=JOB_HEARTBEAT_SECONDS)
+        if done:
+            break
+        async with SessionLocal() as session:
+            await session.execute(
+                update(SyncJob).where(SyncJob.id.in_(job_ids), SyncJob.status == "running")
+                .values(heartbeat_at=_now_iso())
+            )
+            await session.commit()
+            remaining = (await session.execute(
+                select(func.count()).select_from(SyncJob)
+                .where(SyncJob.id.in_(job_ids), SyncJob.cancel_requested == 0)
+            )).scalar_one()
+        if remaining == 0:
+            cancelled = True
+            task.cancel()
+
+    _job_progress_written.pop(tuple(job_ids), None)
+    elapsed = time.perf_counter() - started
+    if cancelled or task.cancelled():
+        await _finish_jobs(job_ids, "cancelled")
+        print(f"[JOBS] {kind} annulleret efter {elapsed:.1f}s")
+        return
+    exc = task.exception()
+    if exc is not None:
+        await _finish_jobs(job_ids, "failed", repr(exc)[:2000])
+        print(f"[JOBS] {kind} fejlede efter {elapsed:.1f}s: {exc!r}")
+        return
+    failures = task.result() or {}
+    for job_id, error in failures.items():
+        await _finish_jobs([job_id], "failed", repr(error)[:2000])
+    await _finish_jobs(job_ids, "done")
+    if failures:
+        print(f"[JOBS] {kind} færdig på {elapsed:.1f}s ({len(jobs) - len(failures)} job(s), {len(failures)} fejlede)")
+        return
+    print(f"[JOBS] {kind} færdig på {elapsed:.1f}s ({len(jobs)} job(s))")
 
+async def _purge_old_jobs():
+    cutoff = _now_iso(-JOB_KEEP_DAYS * 86400)
+    async with SessionLocal() as session:
+        await session.execute(SyncJob.__table__.delete().where(
+            SyncJob.status.in_(("done", "failed", "cancelled")), SyncJob.finished_at < cutoff
+        ))
+        await session.commit()
+
+async def job_worker_loop():
+    """Én worker pr. proces: claimer og kører jobs, og genoptager hængende jobs."""
+    global _job_wakeup
+    _job_wakeup = asyncio.Event()
+    last_housekeeping = 0.0
+    while True:
+        try:
+            if time.monotonic() - last_housekeeping > JOB_HEARTBEAT_SECONDS:
+                last_housekeeping = time.monotonic()
+                await _requeue_stale_jobs()
+                await _purge_old_jobs()
+            jobs = await _claim_jobs()
+            if jobs:
+                await _run_claimed_jobs(jobs)
+                continue
+        except Exception as exc:
+            print(f"[JOBS] Worker-fejl: {exc!r}")
+        try:
+            await asyncio.wait_for(_job_wakeup.wait(), timeout=JOB_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _job_wakeup.clear()
 
 async def schedule_daily_year_sync():
     while True:
@@ -2426,20 +4823,31 @@ async def schedule_daily_year_sync():
         await asyncio.sleep(sleep_seconds)
         try:
             aar = await get_global_year()
-            print(f"[SCHEDULE] Running daily year sync for {aar}...")
-            async with SessionLocal() as session:
-                koder = [
-                    normalize_obserkode(k.kode)
-                    for k in (await session.execute(select(Obserkode))).scalars().all()
-                    if SAFE_OBSERKODE_RE.fullmatch((k.kode or "").strip().upper())
-                ]
-            for kode in koder:
-                await fetch_and_store(kode, aar)
-                await asyncio.sleep(30)
-            print(f"[SCHEDULE] Daily year sync done for {aar}.")
+            # Alle uvicorn-workers planlægger; jobkøen deduplikerer til én kørsel
+            job = await enqueue_job("year_sync_all", year=aar, scheduled=True)
+            print(f"[SCHEDULE] Daily year sync for {aar} lagt i kø (job #{job['id']})")
         except Exception as exc:
             print(f"[SCHEDULE] Daily year sync failed: {exc}")
 
+# Natlig delta-sync (med spredt fuld afstemning, se _full_sync_due)
+DAILY_SYNC_HOUR = min(23, max(0, int(os.environ.get("DAILY_SYNC_HOUR", "2"))))
+
+async def schedule_daily_sync():
+    while True:
+        now = datetime.datetime.now()
+        target = now.replace(hour=DAILY_SYNC_HOUR, minute=0, second=0, microsecond=0)
+        if target <= now:
+            target = target + datetime.timedelta(days=1)
+        sleep_seconds = max(0, int((target - now).total_seconds()))
+        print(f"[SCHEDULE] Next daily sync at {target.isoformat()} (in {sleep_seconds}s)")
+        await asyncio.sleep(sleep_seconds)
+        try:
+            # Alle uvicorn-workers planlægger; jobkøen deduplikerer til én kørsel
+            job = await enqueue_job("daily_sync", scheduled=True)
+            print(f"[SCHEDULE] Daily sync lagt i kø (job #{job['id']})")
+        except Exception as exc:
+            print(f"[SCHEDULE] Daily sync failed: {exc}")
+
 async def schedule_daily_species_sync():
     while True:
         now = datetime.datetime.now()
@@ -2451,7 +4859,7 @@ async def schedule_daily_species_sync():
         await asyncio.sleep(sleep_seconds)
         try:
             print("[SCHEDULE] Running daily species sync...")
-            result = await asyncio.to_thread(_sync_species_styles_and_excluded_from_dof)
+            result = await _sync_species_styles_and_excluded_from_dof()
             print(
                 "[SCHEDULE] Daily species sync done: "
                 f"excluded={result.get('excluded_total_count', 0)}, "
@@ -2541,7 +4949,9 @@ async def obser_is_admin(request: Request):
 async def set_filter_api(filter: str, request: Request):
     if not request.session.get("is_admin"):
         raise HTTPException(status_code=403, detail="Kun admin kan ændre filter")
+    before = await list_settings_token()
     await set_global_filter(filter)
+    await enqueue_lists_rebuild_if_changed(before)
     return {"msg": "Globalt filter opdateret"}
 
 @app.get("/api/get_filter")
@@ -2600,6 +5010,10 @@ async def delete_obserkode(kode: str, request: Request):
             raise HTTPException(status_code=404, detail="Obserkode ikke fundet")
         # Slet alle observationer
         await session.execute(Observation.__table__.delete().where(Observation.obserkode == kode))
+        await session.execute(ObservationTag.__table__.delete().where(ObservationTag.obserkode == kode))
+        await session.execute(ObservationTagState.__table__.delete().where(ObservationTagState.obserkode == kode))
+        await session.execute(ObservationDataVersion.__table__.delete().where(ObservationDataVersion.obserkode == kode))
+        await session.execute(ExportHash.__table__.delete().where(ExportHash.obserkode == kode))
         # Slet fra Obserkode
         await session.execute(Obserkode.__table__.delete().where(Obserkode.kode == kode))
         # Slet fra User
@@ -2655,13 +5069,10 @@ async def get_userprefs(request: Request):
     raw_filter = await get_global_filter()
     async with SessionLocal() as dbsession:
         user = (await dbsession.execute(select(User).where(User.obserkode == obserkode))).scalar_one_or_none()
-        obs_rows = (await dbsession.execute(
-            select(Observation.dato, Observation.turnoter).where(Observation.obserkode == obserkode)
-        )).all()
         if user:
             kommune_value = _normalize_single_kommune(getattr(user, "kommune", None))
             periods = _load_user_matrikel_periods(user)
-            available_indexes = _collect_matrikel_indexes_from_observations(obs_rows, raw_filter)
+            available_indexes = await load_matrikel_indexes(dbsession, obserkode, raw_filter)
             available_keys = {_matrikel_key(index) for index in available_indexes}
             filtered_periods = {
                 key: value
@@ -3065,52 +5476,40 @@ async def statistik_data(obserkode: str):
 
     # Observationer pr. aar (fra DB)
     obs_by_year: Dict[int, int] = {}
-    obs_rows: List[Observation] = []
     async with SessionLocal() as dbsession:
-        obs_rows = (await dbsession.execute(
-            select(Observation).where(Observation.obserkode == obserkode)
-        )).scalars().all()
-        for row in obs_rows:
-            d = getattr(row, "dato", None)
-            if not d:
-                continue
-            obs_by_year[d.year] = obs_by_year.get(d.year, 0) + 1
+        obs_rows = await load_obs_records(dbsession, Observation.obserkode == obserkode)
+        tag_index = await load_user_tag_index(dbsession, obserkode)
+    for row in obs_rows:
+        d = getattr(row, "dato", None)
+        if not d:
+            continue
+        obs_by_year[d.year] = obs_by_year.get(d.year, 0) + 1
 
     raw_filter = await get_global_filter()
     excluded_keys = _get_excluded_species_keys()
+    cols = ObsColumns(obs_rows, raw_filter, excluded_keys, tag_index)
 
     # Fallback: hvis matrikel-listen ikke er bygget (fx manglende perioder),
     # udled den direkte fra observationer med matrikel-1 tag.
     if not matrikel_list:
-        tagged_global_m1 = [
-            row for row in (obs_rows or [])
-            if _observation_has_matrikel_tag(row, raw_filter, 1)
-        ]
-        fallback_matrikel_list = _firsts_from_obs(tagged_global_m1, excluded_keys=excluded_keys)
+        fallback_matrikel_list = cols.firsts(cols.matrikel(1))
         if fallback_matrikel_list:
             matrikel_list = _sort_list_by_date(fallback_matrikel_list)
 
-    matrikel_indexes = _collect_matrikel_indexes_from_observations(obs_rows, raw_filter)
+    matrikel_indexes = _collect_matrikel_indexes_from_observations(obs_rows, raw_filter, tag_index)
     if not matrikel_indexes:
         matrikel_indexes = [1]
+    matrikel_masks = {idx: cols.matrikel(idx) for idx in matrikel_indexes}
 
-    obs_by_year_rows: Dict[int, List[Observation]] = {}
-    for row in obs_rows:
-        d = getattr(row, "dato", None)
-        if not d:
-            continue
-        obs_by_year_rows.setdefault(d.year, []).append(row)
-
-    def _count_matrikel_species(rows: List[Observation], matrikel_index: int) -> int:
-        tagged = [
-            row for row in (rows or [])
-            if _observation_has_matrikel_tag(row, raw_filter, matrikel_index)
-        ]
-        return len(_firsts_from_obs(tagged, excluded_keys=excluded_keys))
+    def _count_matrikel_species(matrikel_index: int, year: Optional[int] = None) -> int:
+        mask = matrikel_masks[matrikel_index]
+        if year is not None:
+            mask = mask & cols.in_year(year)
+        return cols.count_species(mask)
 
     matrikel_totals_by_index: Dict[int, Dict[str, Optional[int]]] = {}
     for idx in matrikel_indexes:
-        count_total = _count_matrikel_species(obs_rows, idx)
+        count_total = _count_matrikel_species(idx)
         rank_total = total_rank_matrikel if idx == 1 else None
         matrikel_totals_by_index[idx] = {
             "count": count_total,
@@ -3119,7 +5518,6 @@ async def statistik_data(obserkode: str):
 
     matrikel_year_rows: List[Dict[str, Any]] = []
     for year in year_dirs:
-        rows_for_year = obs_by_year_rows.get(year, [])
         per_index: Dict[str, Dict[str, Optional[int]]] = {}
         year_has_data = False
 
@@ -3132,7 +5530,7 @@ async def statistik_data(obserkode: str):
                 break
 
         for idx in matrikel_indexes:
-            count_year = _count_matrikel_species(rows_for_year, idx)
+            count_year = _count_matrikel_species(idx, year)
             if count_year > 0:
                 year_has_data = True
             per_index[str(idx)] = {
@@ -3224,13 +5622,13 @@ async def observationer_table(request: Request):
         raise HTTPException(status_code=401, detail="Ikke logget ind")
 
     url = (
-        "https://statistik.dofbasen.dk/arter"
+        f"{DOF_STATISTIK_URL}/arter"
         f"?aar=&slutAar=&startAar=&afdeling=&kommune=&lokalitet=&obser={obserkode}"
         "&visArter=ja&_visArter=on&_visHybrider=on&_visUbestemte=on&_visAndre=on"
     )
 
     try:
-        resp = requests.get(url, timeout=20)
+        resp = await dof_get(url, timeout=20)
     except Exception:
         return JSONResponse({"rows": [], "error": "Kunne ikke hente data"}, status_code=502)
 
@@ -3335,8 +5733,9 @@ async def sync_obserkode_api(request: Request, kode: Optional[str] = None, aar:
             session.add(Obserkode(kode=resolved_kode))
             await session.commit()
     # kør sync nu
-    await fetch_and_store(resolved_kode, aar, include_global_rebuild=False)
-    asyncio.create_task(_background_global_rebuild(resolved_kode))
+    change_set = await fetch_and_store(resolved_kode, aar, include_global_rebuild=False)
+    if change_set.get("rebuilt"):
+        await enqueue_job("global_rebuild", resolved_kode)
     return {"msg": f"Sync kørt for {resolved_kode}", "aar": aar or (await get_global_year())}
 
 @app.post("/api/sync_all")
@@ -3344,8 +5743,8 @@ async def sync_all_api(request: Request):
     if not request.session.get("is_admin"):
         raise HTTPException(status_code=403, detail="Kun admin kan køre sync_all")
     enforce_sync_rate_limit(request, 30)
-    await daily_update_all_jsons()
-    return {"ok": True, "msg": "Synkronisering for alle brugere er gennemført"}
+    job = await enqueue_job("daily_sync")
+    return {"ok": True, "job_id": job["id"], "msg": "Synkronisering for alle brugere er startet"}
 
 @app.post("/api/admin/sync_all_current_year")
 async def admin_sync_all_current_year(request: Request):
@@ -3360,21 +5759,11 @@ async def admin_sync_all_current_year(request: Request):
             if SAFE_OBSERKODE_RE.fullmatch((k.kode or "").strip().upper())
         ]
 
-    async def _run_sync_all_year():
-        try:
-            for kode in koder:
-                await fetch_and_store(kode, aar, include_global_rebuild=False)
-            # Én samlet global rebuild til sidst
-            for kode in koder:
-                await generate_user_global_lists(kode)
-            await generate_global_scoreboards_all_time()
-            print(f"[SYNC-ALL-YEAR] Færdig for {len(koder)} brugere ({aar})")
-        except Exception as e:
-            print(f"[SYNC-ALL-YEAR] Fejl: {e}")
-
-    asyncio.create_task(_run_sync_all_year())
+    # Parallelt i worker-pool; scoreboards bygges én gang til sidst
+    job = await enqueue_job("year_sync_all", year=aar)
     return {
         "ok": True,
+        "job_id": job["id"],
         "year": aar,
         "users": len(koder),
         "msg": f"Synkronisering startet for {len(koder)} brugere ({aar})"
@@ -3385,12 +5774,103 @@ async def admin_sync_all_previous_years(request: Request):
     if not request.session.get("is_admin"):
         raise HTTPException(status_code=403, detail="Kun admin kan køre sync for alle")
     enforce_sync_rate_limit(request, 30)
-    asyncio.create_task(daily_update_all_jsons())
+    job = await enqueue_job("full_sync_all")
     return {
         "ok": True,
+        "job_id": job["id"],
         "msg": "Fuld synkronisering for alle brugere er startet i baggrunden."
     }
 
+@app.get("/api/admin/jobs")
+async def admin_list_jobs(
+    request: Request,
+    status: Optional[str] = None,
+    kind: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    if not request.session.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Kun admin kan se jobs")
+    query = select(SyncJob)
+    if status:
+        query = query.where(SyncJob.status == status)
+    if kind:
+        query = query.where(SyncJob.kind == kind)
+    async with SessionLocal() as session:
+        jobs = (await session.execute(query.order_by(SyncJob.id.desc()).limit(limit))).scalars().all()
+        counts = dict((await session.execute(
+            select(SyncJob.status, func.count()).group_by(SyncJob.status)
+        )).all())
+    return {"counts": counts, "jobs": [_job_to_dict(job) for job in jobs]}
+
+@app.get("/api/admin/jobs/{job_id}")
+async def admin_get_job(job_id: int, request: Request):
+    if not request.session.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Kun admin kan se jobs")
+    async with SessionLocal() as session:
+        job = await session.get(SyncJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job ikke fundet")
+    return _job_to_dict(job)
+
+@app.post("/api/admin/jobs/{job_id}/cancel")
+async def admin_cancel_job(job_id: int, request: Request):
+    """
+    Ventende jobs annulleres med det samme; kørende stoppes ved næste
+    heartbeat. Er jobbet en del af et samlet batch, kører batchet videre for
+    de andre jobs, og jobbet afsluttes som "cancelled" når batchet er færdigt.
+    """
+    if not request.session.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Kun admin kan annullere jobs")
+    async with SessionLocal() as session:
+        job = await session.get(SyncJob, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job ikke fundet")
+        if job.status == "pending":
+            job.status = "cancelled"
+            job.finished_at = _now_iso()
+        elif job.status == "running":
+            job.cancel_requested = 1
+        else:
+            raise HTTPException(status_code=409, detail=f"Job er allerede {job.status}")
+        await session.commit()
+        return _job_to_dict(job)
+
+@app.get("/api/admin/sync_status")
+async def admin_sync_status(request: Request, hours: int = Query(24, ge=1, le=24 * 30)):
+    if not request.session.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Kun admin kan se sync-status")
+    since = (datetime.datetime.now() - datetime.timedelta(hours=hours)).isoformat(timespec="seconds")
+    async with SessionLocal() as session:
+        rows = (await session.execute(select(ExportHash).order_by(ExportHash.checked_at.desc()))).scalars().all()
+        watermarks = (await session.execute(select(SyncWatermark))).scalars().all()
+
+    recent = [r for r in rows if (r.checked_at or "") >= since]
+    return {
+        "hours": hours,
+        "tracked": len(rows),
+        "checked": len(recent),
+        "changed": sum(1 for r in recent if r.last_result in ("changed", "pending")),
+        "skipped": sum(1 for r in recent if r.last_result == "skipped"),
+        "rebuild_pending": sum(1 for r in rows if r.last_result == "pending"),
+        "daily_mode": DAILY_SYNC_MODE,
+        "full_reconcile_days": FULL_RECONCILE_DAYS,
+        "full_overdue": sum(
+            1 for w in watermarks
+            if w.last_full_sync is None or (datetime.date.today() - w.last_full_sync).days > FULL_RECONCILE_DAYS
+        ),
+        "exports": [
+            {
+                "obserkode": r.obserkode,
+                "scope": r.scope,
+                "rows": r.rows,
+                "last_result": r.last_result,
+                "checked_at": r.checked_at,
+                "changed_at": r.changed_at,
+            }
+            for r in recent
+        ],
+    }
+
 @app.post("/api/admin/rebuild_scoreboards_from_db")
 async def admin_rebuild_scoreboards_from_db(request: Request):
     if not request.session.get("is_admin"):
@@ -3417,12 +5897,8 @@ async def admin_rebuild_scoreboards_from_db(request: Request):
             years.append(parsed)
     years = sorted(set(years))
 
-    rebuilt_user_count = 0
-    for user in users:
-        for year in years:
-            await generate_user_lists(user.obserkode, year)
-        await generate_user_global_lists(user.obserkode)
-        rebuilt_user_count += 1
+    await rebuild_user_lists({user.obserkode: years for user in users}, label="ADMIN REBUILD")
+    rebuilt_user_count = len(users)
 
     for year in years:
         await generate_scoreboards_from_lists(year)
@@ -3447,8 +5923,9 @@ async def sync_mine_observationer(request: Request, aar: Optional[int] = None):
     enforce_sync_rate_limit(request, 30)
     if aar is None:
         aar = await get_global_year()
-    await fetch_and_store(obserkode, aar, include_global_rebuild=False)
-    asyncio.create_task(_background_global_rebuild(obserkode))
+    change_set = await fetch_and_store(obserkode, aar, include_global_rebuild=False)
+    if change_set.get("rebuilt"):
+        await enqueue_job("global_rebuild", normalize_obserkode(obserkode))
     return {
         "ok": True,
         "state": "done",
@@ -3464,8 +5941,8 @@ async def full_sync_me(request: Request):
         raise HTTPException(status_code=401, detail="Ikke logget ind")
     enforce_sync_rate_limit(request, 30)
 
-    asyncio.create_task(sync_user_all_time(obserkode))
-    return {"ok": True, "msg": f"Fuld synkronisering startet for {obserkode}"}
+    job = await enqueue_job("user_full_sync", normalize_obserkode(obserkode))
+    return {"ok": True, "job_id": job["id"], "msg": f"Fuld synkronisering startet for {obserkode}"}
 
 # ---------------------------------------------------------
 #  API: Firsts & Scoreboards (filer)
@@ -3579,64 +6056,11 @@ async def api_obser(request: Request):
     if not obserkode:
         return JSONResponse({"error": "Obserkode mangler"}, status_code=400)
 
-    async def _ensure_firsts_obsid(rows: Any) -> List[Dict[str, Any]]:
-        if not isinstance(rows, list) or not rows:
+    def _firsts_rows(rows: Any) -> List[Dict[str, Any]]:
+        # obsid er sat da listen blev bygget (se ObsColumns._fallback_obsid)
+        if not isinstance(rows, list):
             return []
-
-        normalized_rows = [row for row in rows if isinstance(row, dict)]
-        missing = [row for row in normalized_rows if not str(row.get("obsid") or "").strip()]
-        if not missing:
-            return normalized_rows
-
-        dates: set = set()
-        for row in missing:
-            parsed = _parse_ddmmyyyy(row.get("dato"))
-            if parsed != datetime.datetime.min:
-                dates.add(parsed.date())
-        if not dates:
-            return normalized_rows
-
-        async with SessionLocal() as session:
-            candidates = (await session.execute(
-                select(Observation).where(
-                    Observation.obserkode == obserkode,
-                    Observation.dato.in_(sorted(dates)),
-                )
-            )).scalars().all()
-
-        obsid_by_exact: Dict[Tuple[str, str, str], str] = {}
-        obsid_by_art: Dict[Tuple[str, str], str] = {}
-        for obs in candidates:
-            if not obs.obsid or not obs.dato:
-                continue
-            dato_key = obs.dato.strftime("%d-%m-%Y")
-            art_key = _normalize_base_art_name(obs.artnavn or "").casefold()
-            lok_key = safe_output(obs.loknavn or "").strip().casefold()
-            obsid = safe_output(obs.obsid)
-            if not obsid:
-                continue
-            obsid_by_exact.setdefault((dato_key, art_key, lok_key), obsid)
-            obsid_by_art.setdefault((dato_key, art_key), obsid)
-
-        enriched: List[Dict[str, Any]] = []
-        for row in normalized_rows:
-            existing = str(row.get("obsid") or "").strip()
-            if existing:
-                enriched.append(row)
-                continue
-
-            dato_key = str(row.get("dato") or "")
-            art_key = _normalize_base_art_name(row.get("artnavn") or "").casefold()
-            lok_key = safe_output(row.get("lokalitet") or "").strip().casefold()
-            obsid = obsid_by_exact.get((dato_key, art_key, lok_key)) or obsid_by_art.get((dato_key, art_key))
-            if obsid:
-                copy_row = dict(row)
-                copy_row["obsid"] = obsid
-                enriched.append(copy_row)
-            else:
-                enriched.append(row)
-
-        return enriched
+        return [row for row in rows if isinstance(row, dict)]
 
     if str(aar) == "global":
         userdir = os.path.join(SERVER_DIR, "data", "global", "obser", obserkode)
@@ -3684,20 +6108,20 @@ async def api_obser(request: Request):
         data = json.load(f)
     if scope == "user_lokalafdeling":
         afdeling = params.get("afdeling")
-        firsts = await _ensure_firsts_obsid(data.get(afdeling, {}).get("alle", []))
+        firsts = _firsts_rows(data.get(afdeling, {}).get("alle", []))
         return {"firsts": firsts}
     if scope in ("user_kommune_alle", "user_kommune_matrikel"):
         if not data:
             return {"firsts": []}
         if scope == "user_kommune_matrikel":
-            firsts = await _ensure_firsts_obsid(data.get("matrikel", []))
+            firsts = _firsts_rows(data.get("matrikel", []))
             return {"firsts": firsts}
-        firsts = await _ensure_firsts_obsid(data.get("alle", []))
+        firsts = _firsts_rows(data.get("alle", []))
         return {"firsts": firsts}
     if key == "firsts":
-        enriched_firsts = await _ensure_firsts_obsid(data)
+        firsts = _firsts_rows(data)
         available_years = await get_available_years_for_user(obserkode) if scope == "user_global" else []
-        return {key: enriched_firsts, "available_years": available_years}
+        return {key: firsts, "available_years": available_years}
     return {key: data}
 
 @app.get("/api/user_scoreboard")
@@ -4050,9 +6474,9 @@ async def validate_login(data: Dict[str, Any] = Body(...), request: Request = No
     login_attempts[obserkode] = attempts
 
     # DOFbasen login
-    url = "https://krydslister.dofbasen.dk/api/v1/login"
+    url = f"{DOF_KRYDSLISTER_URL}/api/v1/login"
     try:
-        r = requests.post(url, json={"username": obserkode, "password": adgangskode}, timeout=10)
+        r = await dof_post(url, json={"username": obserkode, "password": adgangskode}, timeout=10, retries=1)
         if r.status_code != 200:
             return {"ok": False, "error": "Login fejlede"}
         token = r.json().get("token")
@@ -4061,8 +6485,8 @@ async def validate_login(data: Dict[str, Any] = Body(...), request: Request = No
     except Exception as e:
         return {"ok": False, "error": str(e)}
 
-    # Hent navn
-    navn = fetch_observer_name_from_dof(obserkode)
+    # Hent navn (cachet)
+    navn = await resolve_observer_name(obserkode)
 
     # Gem/Opdater bruger
     async with SessionLocal() as session:
@@ -4081,7 +6505,7 @@ async def validate_login(data: Dict[str, Any] = Body(...), request: Request = No
         await session.commit()
 
     if new_user_created:
-        asyncio.create_task(sync_user_all_time(obserkode))
+        await enqueue_job("user_full_sync", obserkode)
 
     if request:
         session = request.session
@@ -4172,7 +6596,7 @@ async def set_afdeling_kommune(data: Dict[str, Any] = Body(...), request: Reques
     web_session["kommune"] = kommune
 
     if needs_scoreboard_refresh:
-        asyncio.create_task(_rebuild_scoreboards_after_optin_change(obserkode))
+        await enqueue_job("optin_rebuild", normalize_obserkode(obserkode))
 
     return {"ok": True}
 
@@ -4192,6 +6616,10 @@ async def delete_my_account(request: Request):
             raise HTTPException(status_code=404, detail="Bruger ikke fundet")
 
         await dbsession.execute(Observation.__table__.delete().where(Observation.obserkode == safe_kode))
+        await dbsession.execute(ObservationTag.__table__.delete().where(ObservationTag.obserkode == safe_kode))
+        await dbsession.execute(ObservationTagState.__table__.delete().where(ObservationTagState.obserkode == safe_kode))
+        await dbsession.execute(ObservationDataVersion.__table__.delete().where(ObservationDataVersion.obserkode == safe_kode))
+        await dbsession.execute(ExportHash.__table__.delete().where(ExportHash.obserkode == safe_kode))
         await dbsession.execute(User.__table__.delete().where(User.obserkode == safe_kode))
         await dbsession.execute(Obserkode.__table__.delete().where(Obserkode.kode == safe_kode))
         await dbsession.commit()
@@ -4232,13 +6660,12 @@ async def get_matrix():
     kode_ture: Dict[str, Dict[str, Any]] = {}
     kode_turid_set: Dict[str, set] = {}
 
-    def hovedart(artnavn: str) -> str:
-        return (artnavn or "").split('(')[0].split(',')[0].strip()
-
+    species = species_dictionary()
     for obs in rows:
-        ha = hovedart(obs.artnavn)
-        if "sp." in ha or "/" in ha or " x " in ha:
+        sid = species.intern(obs.artnavn)
+        if not species.countable[sid]:
             continue
+        ha = species.base_name(sid)
         all_arter.add(ha)
         all_koder.add(obs.obserkode)
         hovedart_data.setdefault(ha, {}).setdefault(obs.obserkode, []).append(obs.dato)
@@ -4344,6 +6771,8 @@ def save_excluded_species(species: List[str]):
     cleaned.sort(key=lambda x: x.casefold())
     with open(EXCLUDED_SPECIES_FILE, "w", encoding="utf-8") as f:
         json.dump(cleaned, f, ensure_ascii=False, indent=2)
+    global _excluded_keys_cache
+    _excluded_keys_cache = (None, frozenset())
 
 def load_species_styles() -> Dict[str, str]:
     if not os.path.exists(SPECIES_STYLES_FILE):
@@ -4443,9 +6872,9 @@ def _extract_species_entries_from_dof_html(html_text: str) -> Dict[str, Dict[str
 
     return found
 
-def _sync_species_styles_and_excluded_from_dof() -> Dict[str, Any]:
-    url = "https://dofbasen.dk/opslag/artdata.php"
-    response = requests.get(url, timeout=25)
+async def _sync_species_styles_and_excluded_from_dof() -> Dict[str, Any]:
+    url = f"{DOFBASEN_URL}/opslag/artdata.php"
+    response = await dof_get(url, timeout=25)
     response.raise_for_status()
 
     entries = _extract_species_entries_from_dof_html(response.text)
@@ -4473,7 +6902,9 @@ def _sync_species_styles_and_excluded_from_dof() -> Dict[str, Any]:
         raise RuntimeError("Fandt ingen arter i klammer i DOFbasens artsliste")
 
     existing_excluded = load_excluded_species()
+    before = await list_settings_token()
     save_excluded_species(existing_excluded + fetched_brackets)
+    await enqueue_lists_rebuild_if_changed(before)
     saved_excluded = load_excluded_species()
 
     su_count = sum(1 for kind in merged_styles.values() if kind == "su")
@@ -4618,6 +7049,14 @@ async def gruppe_scoreboard(request: Request, data: dict = Body(...)):
     visible_end = min(range_end, today)
 
     global_filter_value = await get_global_filter()
+    species = species_dictionary()
+
+    def _counts_for_trend(artnavn: Optional[str]) -> Optional[int]:
+        """key_id for arten hvis den tæller i trend-kurven (ingen eksklusionsliste her)."""
+        sid = species.intern(artnavn)
+        if not species.countable[sid] or not species.base_name(sid):
+            return None
+        return species.key_id[sid]
 
     async with SessionLocal() as session:
         users = (await session.execute(select(User).where(User.obserkode.in_(koder)))).scalars().all()
@@ -4639,16 +7078,15 @@ async def gruppe_scoreboard(request: Request, data: dict = Body(...)):
                     )
                 obs_rows = (await dbsession.execute(obs_query)).scalars().all()
             
-            firsts_by_art: Dict[str, datetime.date] = {}
+            firsts_by_art: Dict[int, datetime.date] = {}
             for obs_row in obs_rows:
                 if not obs_row.dato:
                     continue
                 if obs_row.dato > visible_end:
                     continue
-                art_name = _normalize_base_art_name(obs_row.artnavn)
-                if not art_name or "sp." in art_name or "/" in art_name or " x " in art_name:
+                key = _counts_for_trend(obs_row.artnavn)
+                if key is None:
                     continue
-                key = art_name.casefold()
                 previous = firsts_by_art.get(key)
                 if previous is None or obs_row.dato < previous:
                     firsts_by_art[key] = obs_row.dato
@@ -4664,12 +7102,7 @@ async def gruppe_scoreboard(request: Request, data: dict = Body(...)):
         elif scope == "gruppe_matrikel":
             L = _load_json(os.path.join(OBSER_DIR, u.obserkode, "matrikelarter.json")) or []
 
-            user_periods = (_load_user_matrikel_periods(u) or {}).get("matrikel1") or []
-            relevant_periods = [
-                period for period in user_periods
-                if _period_overlaps_range(period, range_start, visible_end)
-            ]
-            relevant_periods.sort(key=lambda period: period.get("start_date") or "")
+            relevant_periods = compiled_matrikel_periods(u).get("matrikel1", _NO_PERIODS).overlapping(range_start, visible_end)
 
             if relevant_periods:
                 async with SessionLocal() as dbsession:
@@ -4680,40 +7113,40 @@ async def gruppe_scoreboard(request: Request, data: dict = Body(...)):
                             Observation.dato <= visible_end,
                         )
                     obs_rows = (await dbsession.execute(obs_query)).scalars().all()
+                    tag_index = await load_user_tag_index(dbsession, u.obserkode)
 
-                points: List[Dict[str, Any]] = []
-                for period in relevant_periods:
-                    period_start = _parse_iso_date(period.get("start_date"))
-                    if not period_start:
+                # Tag- og artstjek én gang pr. række; perioderne er derefter kun ordinal-sammenligninger
+                visible_last = visible_end.toordinal()
+                tagged_rows: List[Tuple[int, int]] = []
+                for obs_row in obs_rows:
+                    if not obs_row.dato or obs_row.dato > visible_end:
+                        continue
+                    key = _counts_for_trend(obs_row.artnavn)
+                    if key is None:
                         continue
-                    if period_start > visible_end:
+                    if not _observation_has_matrikel_tag(obs_row, global_filter_value, 1, tag_index):
                         continue
-                    period_end = _parse_iso_date(period.get("end_date")) or datetime.date.max
-                    period_end = min(period_end, visible_end)
-                    points.append({"dato": period_start.strftime("%d-%m-%Y"), "count": 0})
+                    tagged_rows.append((obs_row.dato.toordinal(), key))
 
-                    firsts_by_art: Dict[str, datetime.date] = {}
-                    for obs_row in obs_rows:
-                        if not obs_row.dato:
-                            continue
-                        if obs_row.dato > visible_end:
-                            continue
-                        if obs_row.dato < period_start or obs_row.dato > period_end:
-                            continue
-                        if not _observation_has_matrikel_tag(obs_row, global_filter_value, 1):
-                            continue
-                        art_name = _normalize_base_art_name(obs_row.artnavn)
-                        if not art_name or "sp." in art_name or "/" in art_name or " x " in art_name:
+                points: List[Dict[str, Any]] = []
+                for period_start, period_end in zip(relevant_periods.starts, relevant_periods.ends):
+                    if period_start > visible_last:
+                        continue
+                    period_end = min(period_end, visible_last)
+                    points.append({"dato": datetime.date.fromordinal(period_start).strftime("%d-%m-%Y"), "count": 0})
+
+                    firsts_by_art: Dict[int, int] = {}
+                    for day, key in tagged_rows:
+                        if day < period_start or day > period_end:
                             continue
-                        key = art_name.casefold()
                         previous = firsts_by_art.get(key)
-                        if previous is None or obs_row.dato < previous:
-                            firsts_by_art[key] = obs_row.dato
+                        if previous is None or day < previous:
+                            firsts_by_art[key] = day
 
                     running = 0
-                    for first_date in sorted(firsts_by_art.values()):
+                    for first_day in sorted(firsts_by_art.values()):
                         running += 1
-                        points.append({"dato": first_date.strftime("%d-%m-%Y"), "count": running})
+                        points.append({"dato": datetime.date.fromordinal(first_day).strftime("%d-%m-%Y"), "count": running})
 
                 if points:
                     trend_points[u.obserkode] = points
@@ -4722,8 +7155,13 @@ async def gruppe_scoreboard(request: Request, data: dict = Body(...)):
         # Scoreboard-row
         a, art, dato = 0, "", ""
         if L:
-            unique_arter = { (r.get("artnavn") or "").split("(")[0].split(",")[0].strip()
-                             for r in L if r.get("artnavn") and "sp." not in r.get("artnavn") and "/" not in r.get("artnavn") and " x " not in r.get("artnavn") }
+            unique_arter = set()
+            for r in L:
+                if not r.get("artnavn"):
+                    continue
+                sid = species.intern(r["artnavn"])
+                if species.countable[sid]:
+                    unique_arter.add(species.name_id[sid])
             a = len(unique_arter)
             latest = max(L, key=lambda r: _parse_ddmmyyyy(r.get("dato")), default={})
             art = latest.get("artnavn", "")
@@ -4737,9 +7175,10 @@ async def gruppe_scoreboard(request: Request, data: dict = Body(...)):
         })
         # Matrix-data
         for r in L:
-            ha = (r.get("artnavn") or "").split("(")[0].split(",")[0].strip()
-            if "sp." in ha or "/" in ha or " x " in ha:
+            sid = species.intern(r.get("artnavn"))
+            if not species.countable[sid]:
                 continue
+            ha = species.base_name(sid)
             all_arter.add(ha)
             hovedart_data.setdefault(ha, {}).setdefault(u.obserkode, []).append(r.get("dato"))
 
@@ -4828,8 +7267,10 @@ async def admin_add_excluded_species(payload: Dict[str, Any] = Body(...), admin:
     species = load_excluded_species()
     existing_keys = {name.casefold() for name in species}
     if artnavn.casefold() not in existing_keys:
+        before = await list_settings_token()
         species.append(artnavn)
         save_excluded_species(species)
+        await enqueue_lists_rebuild_if_changed(before)
         species = load_excluded_species()
     return {"ok": True, "species": species}
 
@@ -4842,7 +7283,9 @@ async def admin_remove_excluded_species(artnavn: str = Query(""), admin: bool =
     species = load_excluded_species()
     target_key = target.casefold()
     filtered = [name for name in species if name.casefold() != target_key]
+    before = await list_settings_token()
     save_excluded_species(filtered)
+    await enqueue_lists_rebuild_if_changed(before)
     return {"ok": True, "species": filtered}
 
 @app.post("/api/admin/excluded_species/save")
@@ -4850,14 +7293,16 @@ async def admin_save_excluded_species(payload: Dict[str, Any] = Body(...), admin
     species = payload.get("species")
     if not isinstance(species, list):
         raise HTTPException(status_code=400, detail="species skal være en liste")
+    before = await list_settings_token()
     save_excluded_species([str(x) for x in species])
+    await enqueue_lists_rebuild_if_changed(before)
     saved = load_excluded_species()
     return {"ok": True, "species": saved, "count": len(saved)}
 
 @app.post("/api/admin/excluded_species/sync")
 async def admin_sync_excluded_species_from_dof(admin: bool = Depends(require_admin)):
     try:
-        result = await asyncio.to_thread(_sync_species_styles_and_excluded_from_dof)
+        result = await _sync_species_styles_and_excluded_from_dof()
     except Exception as exc:
         raise HTTPException(status_code=502, detail=f"Kunne ikke hente artsliste fra DOFbasen: {exc}")
 
@@ -4888,8 +7333,21 @@ async def admin_slet_gruppe(request: Request, data: dict = Body(...), admin: boo
 
 
 @app.post("/api/admin/sync_all_user_names")
-async def admin_sync_all_user_names(request: Request, admin: bool = Depends(require_admin)):
+async def admin_sync_all_user_names(request: Request, force: bool = False, admin: bool = Depends(require_admin)):
     enforce_sync_rate_limit(request, 30)
+    started = time.perf_counter()
+
+    async with SessionLocal() as session:
+        user_codes = (await session.execute(select(User.obserkode))).scalars().all()
+        obserkoder = (await session.execute(select(Obserkode.kode))).scalars().all()
+    all_codes = set()
+    for raw_code in list(user_codes) + list(obserkoder):
+        code = (raw_code or "").strip().upper()
+        if SAFE_OBSERKODE_RE.fullmatch(code):
+            all_codes.add(code)
+
+    # Navne hentes samtidigt (og fra cachen) før DB-sessionen åbnes
+    fetched_names = await resolve_observer_names(sorted(all_codes), force=force)
 
     async with SessionLocal() as session:
         users = (await session.execute(select(User))).scalars().all()
@@ -4899,20 +7357,13 @@ async def admin_sync_all_user_names(request: Request, admin: bool = Depends(requ
             if SAFE_OBSERKODE_RE.fullmatch(code):
                 user_by_code[code] = user
 
-        all_codes = set(user_by_code.keys())
-        obserkoder = (await session.execute(select(Obserkode.kode))).scalars().all()
-        for raw_code in obserkoder:
-            code = (raw_code or "").strip().upper()
-            if SAFE_OBSERKODE_RE.fullmatch(code):
-                all_codes.add(code)
-
         updated = 0
         created = 0
         unchanged = 0
         missing = 0
 
         for code in sorted(all_codes):
-            fetched_name = await asyncio.to_thread(fetch_observer_name_from_dof, code)
+            fetched_name = fetched_names.get(code)
             if not fetched_name:
                 missing += 1
                 continue
@@ -4933,6 +7384,8 @@ async def admin_sync_all_user_names(request: Request, admin: bool = Depends(requ
 
         await session.commit()
 
+    elapsed = time.perf_counter() - started
+    print(f"[NAVNE] {len(all_codes)} koder på {elapsed:.1f}s ({updated} opdateret, {created} oprettet, {missing} uden navn)")
     return {
         "ok": True,
         "users": len(all_codes),
@@ -4940,6 +7393,7 @@ async def admin_sync_all_user_names(request: Request, admin: bool = Depends(requ
         "created": created,
         "unchanged": unchanged,
         "missing": missing,
+        "seconds": round(elapsed, 2),
         "msg": (
             "Navne-sync fuldført: "
             f"{updated} opdateret, {created} oprettet, "
@@ -4961,8 +7415,8 @@ async def admin_full_sync_user(request: Request, kode: str, admin: bool = Depend
         if not user:
             raise HTTPException(status_code=404, detail="Obserkode ikke fundet")
 
-    asyncio.create_task(sync_user_all_time(obserkode))
-    return {"ok": True, "msg": f"Full sync startet for {obserkode}"}
+    job = await enqueue_job("user_full_sync", obserkode)
+    return {"ok": True, "job_id": job["id"], "msg": f"Full sync startet for {obserkode}"}
 
 
 @app.get("/api/admin/user_profile")
@@ -5032,13 +7486,55 @@ async def admin_update_user(payload: Dict[str, Any] = Body(...), admin: bool = D
 #  Startup
 # ---------------------------------------------------------
 async def ensure_user_optional_columns():
-    statements = [
+    await _apply_optional_ddl([
         "ALTER TABLE users ADD COLUMN IF NOT EXISTS lokalafdelinger_json TEXT",
         "ALTER TABLE users ADD COLUMN IF NOT EXISTS kommuner_json TEXT",
         "ALTER TABLE users ADD COLUMN IF NOT EXISTS matrikel1_perioder TEXT",
         "ALTER TABLE users ADD COLUMN IF NOT EXISTS matrikel2_perioder TEXT",
         "ALTER TABLE users ADD COLUMN IF NOT EXISTS matrikel_perioder_json TEXT",
-    ]
+    ])
+
+async def ensure_observation_sync_columns():
+    await _apply_optional_ddl([
+        "ALTER TABLE observations ADD COLUMN IF NOT EXISTS sync_key VARCHAR",
+        "ALTER TABLE observations ADD COLUMN IF NOT EXISTS row_hash VARCHAR",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_observations_obserkode_sync_key ON observations (obserkode, sync_key)",
+    ])
+
+async def ensure_sync_job_indexes():
+    """Partielt unikt indeks på ventende jobs; ældre dubletter annulleres først."""
+    await _apply_optional_ddl([
+        "UPDATE sync_jobs SET status = 'cancelled' WHERE status = 'pending' AND id NOT IN ("
+        "SELECT MIN(id) FROM sync_jobs WHERE status = 'pending' "
+        "GROUP BY kind, COALESCE(obserkode, ''), COALESCE(year, -1))",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_sync_jobs_pending_key ON sync_jobs "
+        "(kind, COALESCE(obserkode, ''), COALESCE(year, -1)) WHERE status = 'pending'",
+    ])
+
+async def ensure_tag_index_job():
+    """Lægger et tag_reindex-job i køen hvis nogen brugere mangler et komplet tag-indeks."""
+    async with SessionLocal() as session:
+        ready = select(ObservationTagState.obserkode).where(ObservationTagState.version == TAG_INDEX_VERSION)
+        missing = (await session.execute(
+            select(Observation.obserkode).where(
+                Observation.obserkode.is_not(None),
+                Observation.obserkode.not_in(ready),
+            ).limit(1)
+        )).scalar_one_or_none()
+    if missing:
+        await enqueue_job("tag_reindex", scheduled=True)
+
+async def ensure_lists_backfill_job():
+    """Lægger et lists_backfill-job i køen hvis listefilerne er bygget med en ældre listeversion."""
+    try:
+        with open(_lists_version_marker(), "r", encoding="utf-8") as f:
+            current = f.read().strip()
+    except OSError:
+        current = None
+    if current != LIST_FINGERPRINT_VERSION:
+        await enqueue_job("lists_backfill", scheduled=True)
+
+async def _apply_optional_ddl(statements: List[str]):
     for sql in statements:
         try:
             async with engine.begin() as conn:
@@ -5057,10 +7553,22 @@ async def startup():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     await ensure_user_optional_columns()
+    await ensure_observation_sync_columns()
+    await ensure_sync_job_indexes()
+    await ensure_tag_index_job()
+    await ensure_lists_backfill_job()
     print("[START] DB klar. Static peger på:", WEB_DIR)
     asyncio.create_task(schedule_daily_kommune_sync())
     asyncio.create_task(schedule_daily_year_sync())
+    asyncio.create_task(schedule_daily_sync())
     asyncio.create_task(schedule_daily_species_sync())
+    asyncio.create_task(job_worker_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_dof_http_client()
+    shutdown_cpu_pool()
 
 
 @app.post("/api/full_sync_all")
@@ -5068,8 +7576,8 @@ async def full_sync_all(request: Request):
     if not request.session.get("is_admin"):
         raise HTTPException(status_code=403, detail="Kun admin kan køre fuld sync for alle")
     enforce_sync_rate_limit(request, 30)
-    asyncio.create_task(daily_update_all_jsons())
-    return {"msg": "Fuld synkronisering for alle brugere er startet"}
+    job = await enqueue_job("full_sync_all")
+    return {"job_id": job["id"], "msg": "Fuld synkronisering for alle brugere er startet"}
 
 # ---------------------------------------------------------
 #  Static (peg på .../web ved siden af server/)
@@ -640,6 +640,6 @@ document.getElementById('yearForm').addEventListener('submit', async function(e)
         alert(msg);
         return;
     }
-    alert('Alle koder synkroniseret for år ' + year);
+    alert('Synkronisering af alle koder er startet for år ' + year);
     await hentAktueltAar(); // Opdater feltet efter ændring
 });
\ No newline at end of file